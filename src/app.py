@@ -1,21 +1,22 @@
 import streamlit as st
-import os
 
 # Fix for ChromaDB on Streamlit Cloud (requires pysqlite3-binary)
 __import__('pysqlite3')
 import sys
 sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
 
-# DEBUG: Print environment info
-try:
-    import langchain
-    import langchain.chains
-    print(f"LangChain version: {langchain.__version__}")
-    print(f"Available chains: {dir(langchain.chains)}")
-except Exception as e:
-    print(f"Debug Error: {e}")
-
-from chatbot import Chatbot
+from chatbot import get_chatbot, index_available, is_chatbot_ready, start_background_warm_up
+from metrics import start_metrics_server
+from chat_ui import (
+    append_message,
+    collection_selector,
+    compact_message,
+    get_source_store,
+    render_message,
+    render_sources,
+    show_earlier_button,
+    visible_messages,
+)
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -27,21 +28,33 @@ st.set_page_config(
 st.title("MANE Graduate Handbook Chatbot 🤖")
 st.caption("Powered by local, open-source models. Your data stays on your machine.")
 
+# Expose /metrics on METRICS_PORT (once per process) when configured
+start_metrics_server()
+
 # --- State Management ---
-# Initialize the chatbot and store it in the session state
-if "chatbot" not in st.session_state:
+# The chatbot (embedding model, vector store, LLM client) is shared by all
+# sessions in this process. It loads on a background thread so the page
+# renders immediately; only a question asked before it is ready waits for it.
+if not is_chatbot_ready():
     # Check if the database exists before initializing
-    if not os.path.exists("chroma_db"):
+    if not index_available():
         st.error(
             "The knowledge base (ChromaDB) has not been created yet. "
             "Please run `python src/ingest.py` from your terminal first."
         )
         st.stop()
-    
+
+    start_background_warm_up()
+
+def ready_chatbot():
+    """Returns the shared chatbot, showing a spinner if it is still loading."""
+    if is_chatbot_ready():
+        return get_chatbot()
     with st.spinner("Initializing chatbot... This may take a moment."):
-        st.session_state.chatbot = Chatbot()
+        return get_chatbot()
 
-# Initialize chat history
+# Initialize chat history. Messages are kept compact (text plus source IDs into
+# the process-wide source store) and capped at TRANSCRIPT_MAX_MESSAGES.
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
@@ -54,6 +67,9 @@ with st.sidebar:
         "It uses OpenRouter (cloud AI) and a vector database "
         "to ensure answers come directly from the handbook content."
     )
+    # Shown once the chatbot has loaded and only if the index has several collections
+    selected_collections = collection_selector(get_chatbot().collections() if is_chatbot_ready() else {})
+
     st.header("How to Use")
     st.markdown(
         """
@@ -64,10 +80,10 @@ with st.sidebar:
     )
 
 # --- Chat Interface ---
-# Display chat messages from history on app rerun
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+# Display the latest window of the chat history on app rerun
+show_earlier_button(st.session_state.messages)
+for message in visible_messages(st.session_state.messages):
+    render_message(message)
 
 # React to user input
 if prompt := st.chat_input("Ask a question about the MANE handbook"):
@@ -75,23 +91,24 @@ if prompt := st.chat_input("Ask a question about the MANE handbook"):
     with st.chat_message("user"):
         st.markdown(prompt)
     # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": prompt})
-
-    # Get bot response
-    with st.spinner("Searching the handbook and generating an answer..."):
-        response, sources = st.session_state.chatbot.get_response(prompt)
-        
-        # Display assistant response in chat message container
-        with st.chat_message("assistant"):
-            st.markdown(response)
-            
-            # Display sources in an expander
-            if sources:
-                with st.expander("View Sources"):
-                    for i, doc in enumerate(sources):
-                        st.write(f"**Source {i+1}**")
-                        st.write(f"From: *{doc.metadata.get('source', 'N/A')}*")
-                        st.info(f"{doc.page_content}")
+    append_message(st.session_state.messages, compact_message("user", prompt))
+
+    # Stream bot response into the assistant message container as it is generated
+    sources = []
+    bot = ready_chatbot()
+
+    def answer_tokens():
+        for kind, payload in bot.stream_response(prompt, selected_collections or None):
+            if kind == "sources":
+                sources.extend(payload)
+            else:
+                yield payload
+
+    with st.chat_message("assistant"):
+        response = st.write_stream(answer_tokens())
+        message = compact_message("assistant", response, get_source_store().add_documents(sources))
+        if message["sources"]:
+            render_sources(message["sources"], message["id"])
 
     # Add assistant response to chat history
-    st.session_state.messages.append({"role": "assistant", "content": response})
+    append_message(st.session_state.messages, message)
@@ -1,9 +1,21 @@
 import streamlit as st
 import os
+from datetime import datetime
 from dotenv import load_dotenv
-from chatbot import Chatbot
-from firestore_chat import FirestoreChatManager
-from cloud_storage import CloudStorageManager
+from chatbot import get_chatbot, index_available, is_chatbot_ready, start_background_warm_up
+from metrics import start_metrics_server
+from chat_ui import (
+    TRANSCRIPT_MAX_MESSAGES,
+    append_message,
+    collection_selector,
+    compact_message,
+    get_source_store,
+    prepend_messages,
+    render_message,
+    render_sources,
+    show_earlier_button,
+    visible_messages,
+)
 
 # Load environment variables
 load_dotenv()
@@ -20,25 +32,43 @@ st.caption("Powered by OpenRouter with Google Cloud integration")
 
 # --- Configuration ---
 USE_CLOUD_SERVICES = os.getenv("USE_CLOUD_SERVICES", "false").lower() == "true"
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "50"))
+RECENT_SESSIONS_SHOWN = 5
+
+# Expose /metrics on METRICS_PORT (once per process) when configured
+start_metrics_server()
 
 # --- State Management ---
-# Initialize the chatbot and store it in the session state
-if "chatbot" not in st.session_state:
+# The chatbot (embedding model, vector store, LLM client) is shared by all
+# sessions in this process. It loads on a background thread so the page
+# renders immediately; only a question asked before it is ready waits for it.
+if not is_chatbot_ready():
     # Check if the database exists before initializing
-    if not os.path.exists("chroma_db"):
+    if not index_available():
         st.error(
             "The knowledge base (ChromaDB) has not been created yet. "
             "Please run `python src/ingest.py` from your terminal first."
         )
         st.stop()
-    
+
+    start_background_warm_up()
+
+def ready_chatbot():
+    """Returns the shared chatbot, showing a spinner if it is still loading."""
+    if is_chatbot_ready():
+        return get_chatbot()
     with st.spinner("Initializing chatbot... This may take a moment."):
-        st.session_state.chatbot = Chatbot()
+        return get_chatbot()
 
 # Initialize cloud services if enabled
 if USE_CLOUD_SERVICES and "firestore_manager" not in st.session_state:
     try:
-        st.session_state.firestore_manager = FirestoreChatManager()
+        # The Google Cloud SDKs are only imported when cloud services are enabled
+        from firestore_chat import get_chat_manager
+        from cloud_storage import CloudStorageManager
+
+        # Shared per process: one Firestore client and write-behind queue for all sessions
+        st.session_state.firestore_manager = get_chat_manager()
         st.session_state.storage_manager = CloudStorageManager()
     except Exception as e:
         st.warning(f"Cloud services not available: {e}")
@@ -51,19 +81,38 @@ if "session_id" not in st.session_state:
     else:
         st.session_state.session_id = "local_session"
 
-# Initialize chat history
+def load_history_page(before=None):
+    """
+    Loads one page of chat history from Firestore into the session transcript,
+    ahead of the messages already there and within TRANSCRIPT_MAX_MESSAGES.
+    Sets history_cursor to the oldest message kept, or None when there is
+    nothing older left to load.
+    """
+    history = st.session_state.firestore_manager.get_chat_history(
+        st.session_state.session_id, limit=CHAT_HISTORY_PAGE_SIZE, before=before
+    )
+    messages = st.session_state.messages
+    left_out = prepend_messages(messages, history)
+    has_more = left_out or len(history) == CHAT_HISTORY_PAGE_SIZE
+    st.session_state.history_cursor = messages[0]["timestamp"] if has_more and messages else None
+
+def remember_message(message):
+    """
+    Adds a message to the session transcript. Messages dropped to keep it
+    bounded stay in Firestore, so the history cursor is moved to the oldest
+    kept one and "Load earlier messages" can bring them back.
+    """
+    if append_message(st.session_state.messages, message) and USE_CLOUD_SERVICES:
+        st.session_state.history_cursor = st.session_state.messages[0]["timestamp"]
+
+# Initialize chat history. Messages are kept compact (text plus source IDs into
+# the process-wide source store) and capped at TRANSCRIPT_MAX_MESSAGES.
 if "messages" not in st.session_state:
+    st.session_state.history_cursor = None
+    st.session_state.messages = []
     if USE_CLOUD_SERVICES:
-        # Load from Firestore
-        st.session_state.messages = []
-        history = st.session_state.firestore_manager.get_chat_history(st.session_state.session_id)
-        for msg in history:
-            st.session_state.messages.append({
-                "role": msg["role"],
-                "content": msg["content"]
-            })
-    else:
-        st.session_state.messages = []
+        # Load the latest page from Firestore; older pages are loaded on demand
+        load_history_page()
 
 # --- Sidebar ---
 with st.sidebar:
@@ -81,6 +130,9 @@ with st.sidebar:
     else:
         st.info("ℹ️ Running in local mode")
     
+    # Shown once the chatbot has loaded and only if the index has several collections
+    selected_collections = collection_selector(get_chatbot().collections() if is_chatbot_ready() else {})
+
     st.header("How to Use")
     st.markdown(
         """
@@ -118,10 +170,21 @@ with st.sidebar:
                 st.error(f"Failed to list files: {e}")
 
 # --- Chat Interface ---
-# Display chat messages from history on app rerun
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+# Older messages already in memory are drawn first; only then are further pages
+# fetched from Firestore.
+show_earlier_button(st.session_state.messages)
+if (USE_CLOUD_SERVICES and st.session_state.history_cursor is not None
+        and len(st.session_state.messages) <= st.session_state.shown_messages):
+    if len(st.session_state.messages) >= TRANSCRIPT_MAX_MESSAGES:
+        st.caption(f"Older messages are saved, but only the latest {TRANSCRIPT_MAX_MESSAGES} "
+                   "are kept in this session.")
+    elif st.button("Load earlier messages"):
+        load_history_page(before=st.session_state.history_cursor)
+        st.session_state.shown_messages = len(st.session_state.messages)
+
+# Display the latest window of the chat history on app rerun
+for message in visible_messages(st.session_state.messages):
+    render_message(message)
 
 # React to user input
 if prompt := st.chat_input("Ask a question about the MANE handbook"):
@@ -129,32 +192,36 @@ if prompt := st.chat_input("Ask a question about the MANE handbook"):
     with st.chat_message("user"):
         st.markdown(prompt)
     # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    user_message = compact_message("user", prompt, timestamp=datetime.utcnow())
+    remember_message(user_message)
     
     # Save to cloud if enabled
     if USE_CLOUD_SERVICES:
         st.session_state.firestore_manager.add_message(
-            st.session_state.session_id, "user", prompt
+            st.session_state.session_id, "user", prompt, timestamp=user_message["timestamp"]
         )
 
-    # Get bot response
-    with st.spinner("Searching the handbook and generating an answer..."):
-        response, sources = st.session_state.chatbot.get_response(prompt)
-        
-        # Display assistant response in chat message container
-        with st.chat_message("assistant"):
-            st.markdown(response)
-            
-            # Display sources in an expander
-            if sources:
-                with st.expander("View Sources"):
-                    for i, doc in enumerate(sources):
-                        st.write(f"**Source {i+1}**")
-                        st.write(f"From: *{doc.metadata.get('source', 'N/A')}*")
-                        st.info(f"{doc.page_content}")
+    # Stream bot response into the assistant message container as it is generated
+    sources = []
+    bot = ready_chatbot()
+
+    def answer_tokens():
+        for kind, payload in bot.stream_response(prompt, selected_collections or None):
+            if kind == "sources":
+                sources.extend(payload)
+            else:
+                yield payload
+
+    with st.chat_message("assistant"):
+        response = st.write_stream(answer_tokens())
+        message = compact_message(
+            "assistant", response, get_source_store().add_documents(sources), timestamp=datetime.utcnow()
+        )
+        if message["sources"]:
+            render_sources(message["sources"], message["id"])
 
     # Add assistant response to chat history
-    st.session_state.messages.append({"role": "assistant", "content": response})
+    remember_message(message)
     
     # Save to cloud if enabled
     if USE_CLOUD_SERVICES:
@@ -163,23 +230,27 @@ if prompt := st.chat_input("Ask a question about the MANE handbook"):
             for doc in sources:
                 sources_data.append({
                     "content": doc.page_content[:200] + "...",
-                    "source": doc.metadata.get('source', 'N/A')
+                    "source": doc.metadata.get('source', 'N/A'),
+                    "page": doc.metadata.get("page")
                 })
         st.session_state.firestore_manager.add_message(
-            st.session_state.session_id, "assistant", response, sources_data
+            st.session_state.session_id, "assistant", response, sources_data,
+            timestamp=message["timestamp"]
         )
 
 # --- Session Management ---
 if USE_CLOUD_SERVICES and st.sidebar.button("New Chat Session"):
     st.session_state.session_id = st.session_state.firestore_manager.create_chat_session()
     st.session_state.messages = []
+    st.session_state.history_cursor = None
+    st.session_state.pop("shown_messages", None)
     st.rerun()
 
 if USE_CLOUD_SERVICES and st.sidebar.button("View Chat History"):
-    sessions = st.session_state.firestore_manager.get_user_sessions("anonymous")
+    sessions = st.session_state.firestore_manager.get_user_sessions("anonymous", limit=RECENT_SESSIONS_SHOWN)
     if sessions:
         st.sidebar.write("Recent chat sessions:")
-        for session in sessions[:5]:  # Show last 5 sessions
+        for session in sessions:
             st.sidebar.write(f"- {session['created_at'].strftime('%Y-%m-%d %H:%M')} ({session['message_count']} messages)")
     else:
         st.sidebar.write("No chat history found") 
\ No newline at end of file
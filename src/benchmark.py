@@ -0,0 +1,268 @@
+"""
+Benchmark suite for ingestion, retrieval and end-to-end latency.
+
+Runs entirely offline against the bundled handbook: the LLM is replaced by a
+local OpenAI-compatible stub server (see stub_llm_server.py), so the numbers
+measure this project's own overhead. The embedding model must already be in
+the local Hugging Face cache.
+
+Usage:
+    python src/benchmark.py [--skip-ingest] [--concurrency 8] [--output benchmark_results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from stub_llm_server import start_stub_server
+
+QUESTIONS_PATH = "benchmarks/questions.json"
+RESULTS_PATH = "benchmark_results.json"
+
+def latency_summary(seconds):
+    """Summarizes latency samples (in seconds) as milliseconds percentiles."""
+    if not seconds:
+        return {"count": 0}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+def load_questions(path=QUESTIONS_PATH):
+    """Loads the fixed question set with the keywords a relevant chunk must contain."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _normalize_text(text):
+    return " ".join(text.lower().split())
+
+def is_relevant(docs, keywords):
+    """Returns True if any retrieved document contains one of the expected keywords."""
+    texts = [_normalize_text(doc.page_content) for doc in docs]
+    return any(_normalize_text(keyword) in text for keyword in keywords for text in texts)
+
+def bench_ingest(db_path):
+    """Builds a fresh vector database, then re-ingests the unchanged handbook."""
+    import ingest
+    from index_manifest import load_manifest
+    from index_versions import current_index_dir
+
+    ingest.DB_PATH = db_path
+    started = time.perf_counter()
+    ingest.create_vector_database()
+    full_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    ingest.create_vector_database()
+    noop_seconds = time.perf_counter() - started
+
+    chunks = len(load_manifest(current_index_dir(db_path))["chunks"])
+    return {
+        "chunks": chunks,
+        "seconds": full_seconds,
+        "chunks_per_sec": chunks / full_seconds if full_seconds else 0.0,
+        "unchanged_reingest_seconds": noop_seconds,
+    }
+
+def bench_retrieval(bot, questions, k, repeats):
+    """Measures query embedding and vector search latency, and retrieval recall@k."""
+    embed_seconds = []
+    search_seconds = []
+    hits = 0
+    for item in questions:
+        for _ in range(repeats):
+            started = time.perf_counter()
+            embedding = bot.embeddings.embed_query(item["question"])
+            embed_seconds.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            bot.vectorstore.similarity_search_by_vector(embedding, k=k)
+            search_seconds.append(time.perf_counter() - started)
+
+        if is_relevant(bot._retrieve(item["question"], embedding)[:k], item["expected_keywords"]):
+            hits += 1
+
+    return {
+        "embedding": latency_summary(embed_seconds),
+        "vector_search": latency_summary(search_seconds),
+        "recall_at_k": hits / len(questions),
+        "k": k,
+    }
+
+def _directory_bytes(path, skip_suffix=".sqlite3"):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files if not name.endswith(skip_suffix))
+    return total
+
+def bench_vector_stores(bot, questions, db_path, k, repeats):
+    """
+    Compares Chroma's HNSW search with exact NumPy search (float32 and float16)
+    on the same database: per-query latency, batched throughput, agreement of
+    the top k with exact search, and memory held by the index.
+    """
+    from index_versions import current_index_dir
+    from numpy_store import NumpyVectorStore
+    from routing import open_chroma
+
+    db_path = current_index_dir(db_path)
+    embeddings = [bot.embeddings.embed_query(item["question"]) for item in questions]
+    stores = {
+        "chroma": open_chroma(db_path, bot.embeddings),
+        "numpy_float32": NumpyVectorStore.from_chroma(db_path, dtype="float32"),
+        "numpy_float16": NumpyVectorStore.from_chroma(db_path, dtype="float16"),
+    }
+    exact = [
+        [doc.metadata.get("chunk_id", doc.page_content) for doc in docs]
+        for docs in stores["numpy_float32"].similarity_search_by_vectors(embeddings, k=k)
+    ]
+
+    results = {}
+    for name, store in stores.items():
+        seconds = []
+        overlaps = []
+        for embedding, expected in zip(embeddings, exact):
+            for _ in range(repeats):
+                started = time.perf_counter()
+                docs = store.similarity_search_by_vector(embedding, k=k)
+                seconds.append(time.perf_counter() - started)
+            found = [doc.metadata.get("chunk_id", doc.page_content) for doc in docs]
+            overlaps.append(len(set(found) & set(expected)) / max(len(expected), 1))
+
+        summary = {"search": latency_summary(seconds), "exact_top_k_overlap": float(np.mean(overlaps))}
+        if isinstance(store, NumpyVectorStore):
+            started = time.perf_counter()
+            for _ in range(repeats):
+                store.similarity_search_by_vectors(embeddings, k=k)
+            batch_seconds = time.perf_counter() - started
+            summary["batched_queries_per_sec"] = len(embeddings) * repeats / batch_seconds if batch_seconds else 0.0
+            summary["index_bytes"] = store.nbytes
+        else:
+            summary["index_bytes"] = _directory_bytes(db_path)  # HNSW segment files on disk
+        results[name] = summary
+    results["k"] = k
+    return results
+
+def bench_end_to_end(bot, questions, repeats, concurrency):
+    """Measures get_response latency with the answer cache disabled."""
+    bot.cache.max_entries = 0
+    bot.cache.clear()
+
+    def timed(question):
+        started = time.perf_counter()
+        bot.get_response(question)
+        return time.perf_counter() - started
+
+    workload = [item["question"] for item in questions] * repeats
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, workload))
+    wall_seconds = time.perf_counter() - started
+
+    summary = latency_summary(latencies)
+    summary["concurrency"] = concurrency
+    summary["requests_per_sec"] = len(workload) / wall_seconds if wall_seconds else 0.0
+    return summary
+
+def llm_client_counters():
+    """Sums the LLM client's attempt, retry, hedge and fallback counters over all labels."""
+    from metrics import REGISTRY
+
+    totals = {}
+    for counter in REGISTRY.snapshot()["counters"]:
+        if counter["name"].startswith("llm_"):
+            name = counter["name"]
+            if name == "llm_attempts_total":
+                name = f"llm_attempts_{counter['labels'].get('outcome')}"
+            totals[name] = totals.get(name, 0) + counter["value"]
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MANE handbook chatbot.")
+    parser.add_argument("--skip-ingest", action="store_true",
+                        help="Benchmark the existing chroma_db instead of building a fresh one.")
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-delay", type=float, default=0.2,
+                        help="Seconds the stub LLM waits before answering.")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0,
+                        help="Fraction of stub LLM requests that fail with HTTP 503.")
+    parser.add_argument("--llm-slow-rate", type=float, default=0.0,
+                        help="Fraction of stub LLM requests delayed by --llm-slow-delay seconds.")
+    parser.add_argument("--llm-slow-delay", type=float, default=5.0)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    stub = start_stub_server(
+        port=0,
+        first_token_delay=args.llm_delay,
+        failure_rate=args.llm_failure_rate,
+        slow_rate=args.llm_slow_rate,
+        slow_delay=args.llm_slow_delay,
+    )
+    host, port = stub.server_address[:2]
+    # The chatbot reads its configuration at import time
+    os.environ["OPENROUTER_BASE_URL"] = f"http://{host}:{port}/v1"
+    os.environ["OPENROUTER_API_KEY"] = "benchmark"
+
+    import chatbot
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "embedding_model": chatbot.EMBEDDING_MODEL,
+        "embedding_backend": chatbot.EMBEDDING_BACKEND,
+        "retrieval_mode": chatbot.RETRIEVAL_MODE,
+        "questions": len(questions),
+    }
+
+    temp_dir = None
+    try:
+        if args.skip_ingest:
+            db_path = chatbot.DB_PATH
+        else:
+            temp_dir = tempfile.mkdtemp(prefix="bench_chroma_")
+            db_path = temp_dir
+            print("Benchmarking ingestion...")
+            results["ingest"] = bench_ingest(db_path)
+
+        chatbot.DB_PATH = db_path
+        started = time.perf_counter()
+        bot = chatbot.Chatbot()
+        bot.warm_up()
+        results["startup_seconds"] = time.perf_counter() - started
+
+        print("Benchmarking retrieval...")
+        results["retrieval"] = bench_retrieval(bot, questions, args.k, args.repeats)
+        print("Comparing vector store backends...")
+        results["vector_stores"] = bench_vector_stores(bot, questions, db_path, args.k, args.repeats)
+        print("Benchmarking end-to-end latency...")
+        results["end_to_end"] = bench_end_to_end(bot, questions, args.repeats, args.concurrency)
+        results["llm_client"] = llm_client_counters()
+    finally:
+        stub.shutdown()
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
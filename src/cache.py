@@ -0,0 +1,156 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# --- Configuration ---
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_query(query):
+    """Lowercases a query and strips punctuation and repeated whitespace."""
+    query = _PUNCTUATION.sub(" ", query.lower())
+    return _WHITESPACE.sub(" ", query).strip()
+
+class CachedAnswer:
+    """An answer and its sources as stored in the AnswerCache."""
+
+    def __init__(self, answer, sources, embedding):
+        self.answer = answer
+        self.sources = sources
+        self.embedding = embedding
+        self.created_at = time.monotonic()
+
+class AnswerCache:
+    """
+    Two-tier answer cache placed in front of the RAG chain.
+
+    The exact tier matches normalized question text; the semantic tier matches
+    a previously answered question whose embedding has a cosine similarity of at
+    least `similarity_threshold` with the new one. Entries are evicted
+    least-recently-used once `max_entries` is reached and expire after
+    `ttl_seconds`. The whole cache is dropped when the vector database version
+    changes.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl_seconds=ANSWER_CACHE_TTL,
+                 similarity_threshold=ANSWER_CACHE_SIMILARITY, version=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.version = version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Stacked embeddings for the semantic tier, rebuilt lazily after changes
+        self._matrix = None
+        self._matrix_keys = []
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_exact(self, query):
+        """Returns the cached answer for a normalized-identical question, if any."""
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._get_fresh(key)
+            if entry is not None:
+                self.exact_hits += 1
+            return entry
+
+    def get_semantic(self, embedding):
+        """
+        Returns the cached answer for the most similar previous question if it
+        clears the similarity threshold. Counts a miss otherwise, so callers
+        should try get_exact first.
+        """
+        query_vector = _normalize_vector(embedding)
+        with self._lock:
+            if self.max_entries > 0 and self._entries:
+                if self._matrix is None:
+                    self._matrix_keys = list(self._entries)
+                    self._matrix = np.stack([self._entries[k].embedding for k in self._matrix_keys])
+                scores = self._matrix @ query_vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    entry = self._get_fresh(self._matrix_keys[best])
+                    if entry is not None:
+                        self.semantic_hits += 1
+                        return entry
+            self.misses += 1
+            return None
+
+    def put(self, query, embedding, answer, sources, version=None):
+        """
+        Stores an answer for a question and its query embedding. With a version,
+        answers retrieved from another build of the vector database (e.g. one
+        swapped out while the answer was generated) are not stored.
+        """
+        if self.max_entries <= 0:
+            return
+        key = normalize_query(query)
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._entries[key] = CachedAnswer(answer, sources, _normalize_vector(embedding))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def set_version(self, version):
+        """Records the vector database version, clearing the cache if it changed."""
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self._clear()
+
+    def clear(self):
+        """Drops every cached answer."""
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        """Returns hit/miss counters and the current size of the cache."""
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "version": self.version,
+            }
+
+    def _get_fresh(self, key):
+        # Caller holds self._lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created_at > self.ttl_seconds:
+            del self._entries[key]
+            self._matrix = None
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _clear(self):
+        # Caller holds self._lock
+        self._entries.clear()
+        self._matrix = None
+        self._matrix_keys = []
+
+def _normalize_vector(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
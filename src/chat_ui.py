@@ -0,0 +1,168 @@
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+import streamlit as st
+
+# --- Configuration ---
+# Messages kept in a session's memory, and how many are drawn per "show earlier" step
+TRANSCRIPT_MAX_MESSAGES = int(os.getenv("TRANSCRIPT_MAX_MESSAGES", "200"))
+TRANSCRIPT_WINDOW = int(os.getenv("TRANSCRIPT_WINDOW", "20"))
+# Source passages shared by all sessions in the process
+SOURCE_STORE_SIZE = int(os.getenv("SOURCE_STORE_SIZE", "2048"))
+
+class SourceStore:
+    """
+    Process-wide store of the source passages cited by answers.
+    Each passage is held once, under a hash of its text, no matter how many
+    sessions or messages cite it; messages keep only the IDs. Bounded LRU, so
+    a passage cited long ago may have to be shown as unavailable.
+    """
+
+    def __init__(self, max_entries=SOURCE_STORE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, content, source="N/A", page=None, heading=None):
+        """Stores a passage and returns its ID."""
+        source_id = hashlib.sha1(f"{source}\n{page}\n{content}".encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            if source_id in self._entries:
+                self._entries.move_to_end(source_id)
+            else:
+                self._entries[source_id] = {
+                    "content": content, "source": source, "page": page, "heading": heading,
+                }
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return source_id
+
+    def add_documents(self, docs):
+        """Stores retrieved documents and returns their IDs, in order."""
+        return [
+            self.add(doc.page_content, doc.metadata.get("source", "N/A"),
+                     doc.metadata.get("page"), doc.metadata.get("heading"))
+            for doc in docs
+        ]
+
+    def get(self, source_id):
+        with self._lock:
+            return self._entries.get(source_id)
+
+_source_store = SourceStore()
+
+def get_source_store():
+    """Returns the process-wide SourceStore."""
+    return _source_store
+
+def compact_message(role, content, source_ids=(), timestamp=None, message_id=None):
+    """Returns the small, plain-data form a message is kept in session state."""
+    message = {
+        "id": message_id or uuid.uuid4().hex,
+        "role": role,
+        "content": content,
+        "sources": list(source_ids),
+    }
+    if timestamp is not None:
+        message["timestamp"] = timestamp
+    return message
+
+def compact_stored_message(stored):
+    """
+    Returns the compact form of a message read back from chat history, moving
+    its source passages into the shared store.
+    """
+    store = get_source_store()
+    return compact_message(
+        stored["role"],
+        stored["content"],
+        [store.add(src.get("content", ""), src.get("source", "N/A"), src.get("page"))
+         for src in stored.get("sources") or []],
+        timestamp=stored.get("timestamp"),
+        message_id=stored.get("id"),
+    )
+
+def prepend_messages(messages, older, max_messages=TRANSCRIPT_MAX_MESSAGES):
+    """
+    Prepends a page of older stored messages (oldest first) to a session
+    transcript, compacted. Only the newest ones that fit within max_messages
+    are added; returns how many were left out.
+    """
+    room = max(max_messages - len(messages), 0)
+    kept = older[len(older) - room:] if room else []
+    messages[:0] = [compact_stored_message(message) for message in kept]
+    return len(older) - len(kept)
+
+def append_message(messages, message, max_messages=TRANSCRIPT_MAX_MESSAGES):
+    """
+    Appends a message to a session transcript, dropping the oldest ones beyond
+    max_messages. Returns the dropped messages (oldest first).
+    """
+    messages.append(message)
+    overflow = len(messages) - max_messages
+    if overflow <= 0:
+        return []
+    dropped = messages[:overflow]
+    del messages[:overflow]
+    return dropped
+
+def visible_messages(messages):
+    """
+    Returns the messages to draw on this rerun: the latest TRANSCRIPT_WINDOW,
+    plus however many earlier ones the user asked to see. Drawing a bounded
+    window keeps each rerun's cost independent of the conversation length.
+    """
+    shown = st.session_state.setdefault("shown_messages", TRANSCRIPT_WINDOW)
+    return messages[-shown:] if shown < len(messages) else messages
+
+def show_earlier_button(messages, label="Show earlier messages"):
+    """Offers to draw another TRANSCRIPT_WINDOW older messages, if any are hidden."""
+    hidden = len(messages) - st.session_state.setdefault("shown_messages", TRANSCRIPT_WINDOW)
+    if hidden > 0 and st.button(f"{label} ({hidden})"):
+        st.session_state.shown_messages += TRANSCRIPT_WINDOW
+        st.rerun()
+
+def render_message(message):
+    """Draws one transcript message. Source passages are only drawn when asked for."""
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+        if message.get("sources"):
+            render_sources(message["sources"], message["id"])
+
+def render_sources(source_ids, key):
+    """Draws a toggle that shows the cited passages from the shared store."""
+    if not st.toggle(f"View Sources ({len(source_ids)})", key=f"sources-{key}"):
+        return
+    store = get_source_store()
+    for i, source_id in enumerate(source_ids):
+        st.write(f"**Source {i+1}**")
+        entry = store.get(source_id)
+        if entry is None:
+            st.caption("This passage is no longer cached; ask the question again to see it.")
+            continue
+        location = f"*{entry['source']}*"
+        if entry.get("page"):
+            location += f", page {entry['page']}"
+        if entry.get("heading"):
+            location += f" ({entry['heading']})"
+        st.write(f"From: {location}")
+        st.info(entry["content"])
+
+def collection_selector(collections):
+    """
+    Lets the user limit questions to some collections when the index has
+    several. Returns the selected names; empty means route automatically.
+    """
+    if len(collections) < 2:
+        return []
+    st.header("Documents")
+    return st.multiselect(
+        "Search only in",
+        sorted(collections),
+        format_func=lambda name: f"{name} ({len(collections[name]['documents'])} documents)",
+        help="Leave empty to search the collections that best match each question.",
+        key="selected_collections",
+    )
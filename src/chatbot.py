@@ -1,11 +1,30 @@
 import os
+import asyncio
+import threading
+import time
+import httpx
 from dotenv import load_dotenv
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains.retrieval import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.documents import Document
+from cache import AnswerCache
+from query_embedder import QueryEmbedder
+from llm_client import OPENROUTER_FALLBACK_MODELS, LLMError, ResilientChatClient
+from numpy_store import NumpyVectorStore
+from reranker import RERANK_CANDIDATES, RERANK_ENABLED, RERANK_TOP_N, CrossEncoderReranker
+from context import assemble_context, count_tokens
+from metrics import REGISTRY, STARTUP, RequestTrace, log_event
+from index_manifest import index_version, load_manifest
+from index_versions import current_index_dir, current_version_name
+from embedding_backends import EMBEDDING_BACKEND, check_index_embeddings, create_embeddings
+from lexical_index import LexicalIndex, lexical_index_path
+from routing import CollectionRouter, load_collections, open_chroma
+from index_artifact import (
+    INDEX_ARTIFACT_GCS_PATH,
+    INDEX_ARTIFACT_PATH,
+    IndexArtifact,
+    fetch_index_artifact,
+    load_artifact_manifest,
+    remote_artifact_generation,
+)
 
 # Load environment variables
 load_dotenv()
@@ -16,18 +35,94 @@ EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL",'all-MiniLM-L6-v2')
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "meta-llama/llama-3.3-8b-instruct:free")
 OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+# "chroma" opens the ChromaDB database, "numpy" loads it into an in-memory exact-search
+# matrix, and "artifact" memory-maps an exported index artifact
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma").lower()
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "4"))
+# "vector" for pure similarity search, "hybrid" to fuse it with BM25 keyword search
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = 60
+# Seconds between checks for a newly published index (0 disables hot swapping)
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "30"))
+# Connection pool shared by all concurrent requests to OpenRouter
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+
+# This is the most important part. It instructs the LLM to answer *only* based on the context.
+SYSTEM_PROMPT = (
+    "You are a factual, helpful assistant for the RPI MANE department, focused on answering questions about the graduate program.\n"
+    "By strict instructions, you must answer based ONLY on the provided context below.\n"
+    "If the answer is not in the context, say 'I'm sorry, I cannot find the answer to that in the graduate student handbook.'\n"
+    "Do not fabricate or infer information.\n"
+    "\n"
+    "Context:\n"
+    "{context}"
+)
+LLM_UNAVAILABLE_MESSAGE = (
+    "The language model isn't responding right now, so I couldn't answer your question. "
+    "Please try again in a moment."
+)
+
+# Process-wide chatbot shared by every Streamlit session (see get_chatbot)
+_shared_chatbot = None
+_shared_lock = threading.Lock()
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+_index_watcher = None
+
+class IndexState:
+    """
+    One opened build of the index: its vector store, lexical index, collection
+    router and version, plus the marker (published version name or Cloud
+    Storage generation) it was opened for. Each request takes the chatbot's
+    current state once and uses it throughout, so swapping in a new build
+    never changes the index under an in-flight request.
+    """
+
+    def __init__(self, vectorstore, lexical_index, version, marker, collections=None, router=None):
+        self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        self.version = version
+        self.marker = marker
+        self.collections = collections or {}
+        self.router = router
 
 class Chatbot:
     def __init__(self):
         """Initializes the chatbot by setting up the RAG chain."""
-        self.chain = self._setup_chain()
+        self.embeddings = None
+        self.embedder = None
+        self.index = None
+        self.llm = None
+        self.reranker = None
+        self.cache = AnswerCache()
+        self._swap_lock = threading.Lock()
+        self._setup_chain()
+
+    @property
+    def vectorstore(self):
+        return self.index.vectorstore if self.index else None
+
+    @property
+    def lexical_index(self):
+        return self.index.lexical_index if self.index else None
 
     def _setup_chain(self):
-        """Configures and returns the retrieval chain."""
+        """
+        Configures the question-answering pipeline: embeddings, index and LLM client.
+        Retrieval is done separately (see _retrieve) so the query embedding can
+        be shared between the answer cache and the vector search, and the
+        prompt is built by _messages.
+        """
         # 1. Load the local vector database
-        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-        vectorstore = Chroma(persist_directory=DB_PATH, embedding_function=embeddings)
-        retriever = vectorstore.as_retriever()
+        with STARTUP.phase("load_embedding_model"):
+            self.embeddings = create_embeddings(EMBEDDING_MODEL)
+            self.embedder = QueryEmbedder(self.embeddings)
+        with STARTUP.phase("open_index"):
+            self._load_index()
+        if RERANK_ENABLED:
+            with STARTUP.phase("load_reranker"):
+                self.reranker = CrossEncoderReranker()
 
         # 2. Set up the LLM through OpenRouter
         if not OPENROUTER_API_KEY:
@@ -36,56 +131,453 @@ class Chatbot:
                 "Get your API key from https://openrouter.ai/"
             )
         
-        llm = ChatOpenAI(
-            model=OPENROUTER_MODEL,
-            openai_api_key=OPENROUTER_API_KEY,
-            openai_api_base=OPENROUTER_BASE_URL,
-            temperature=0.3,
-            max_tokens=1024
-        )
-
-        # 3. Create a prompt template
-        # This is the most important part. It instructs the LLM to answer *only* based on the context.
-        system_prompt = (
-            "You are a factual, helpful assistant for the RPI MANE department, focused on answering questions about the graduate program.\n"
-            "By strict instructions, you must answer based ONLY on the provided context below.\n"
-            "If the answer is not in the context, say 'I'm sorry, I cannot find the answer to that in the graduate student handbook.'\n"
-            "Do not fabricate or infer information.\n"
-            "\n"
-            "Context:\n"
-            "{context}"
-        )
-
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", system_prompt),
-                ("human", "{input}"),
+        # Timeouts, retries, hedging and model fallback are handled by the client
+        with STARTUP.phase("create_llm_client"):
+            self.llm = ResilientChatClient(
+                base_url=OPENROUTER_BASE_URL,
+                api_key=OPENROUTER_API_KEY,
+                models=[OPENROUTER_MODEL] + OPENROUTER_FALLBACK_MODELS,
+                limits=llm_connection_limits(),
+                temperature=0.3,
+                max_tokens=1024,
+            )
+
+    def _messages(self, query, sources):
+        """Builds the chat messages for a question, stuffing the sources into the system prompt."""
+        context = "\n\n".join(doc.page_content for doc in sources)
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT.format(context=context)},
+            {"role": "user", "content": query},
+        ]
+
+    def _load_index(self):
+        """Opens the published index and makes it the one requests search."""
+        self.index = self._open_index(published_index_marker())
+        self.cache.set_version(self.index.version)
+
+    def _open_index(self, marker):
+        """Opens the vector store selected by VECTOR_STORE and its lexical index as an IndexState."""
+        if VECTOR_STORE == "artifact":
+            if INDEX_ARTIFACT_GCS_PATH:
+                fetch_index_artifact(INDEX_ARTIFACT_GCS_PATH, INDEX_ARTIFACT_PATH)
+            vectorstore = IndexArtifact(INDEX_ARTIFACT_PATH)
+            # The artifact manifest records the model and backend at its top level
+            check_index_embeddings(vectorstore.manifest, EMBEDDING_MODEL)
+            index_dir = vectorstore.artifact_dir
+            version = vectorstore.version
+        else:
+            index_dir = current_index_dir(DB_PATH)
+            manifest = load_manifest(index_dir)
+            if manifest is None:
+                print(f"Warning: '{index_dir}' has no ingest manifest, so its embedding model can't be "
+                      f"checked; assuming '{EMBEDDING_MODEL}'. Re-run `python src/ingest.py` to record it.")
+            else:
+                check_index_embeddings(manifest.get("settings"), EMBEDDING_MODEL)
+            if VECTOR_STORE == "numpy":
+                # Small corpora: exact search over an in-memory matrix instead of HNSW
+                vectorstore = NumpyVectorStore.from_chroma(index_dir)
+            else:
+                vectorstore = open_chroma(index_dir, self.embeddings)
+            version = index_version(index_dir)
+
+        lexical_index = None
+        if RETRIEVAL_MODE == "hybrid":
+            lexical_index = LexicalIndex.load(lexical_index_path(index_dir))
+            if lexical_index is None:
+                print("Warning: no lexical index found; falling back to vector retrieval. "
+                      "Re-run `python src/ingest.py` to build it.")
+        return IndexState(vectorstore, lexical_index, version, marker,
+                          collections=load_collections(index_dir), router=CollectionRouter.load(index_dir))
+
+    def collections(self):
+        """
+        Returns {name: {"chunks": ..., "documents": {document: [editions]}}} for
+        every collection of the current index, the default one included; {} only
+        for an index built before collections were recorded.
+        """
+        return {
+            name: {key: value for key, value in summary.items() if key != "centroid"}
+            for name, summary in self.index.collections.items()
+        }
+
+    def refresh_index(self):
+        """
+        Swaps in a newly published index, if there is one. The new build is
+        opened next to the old one and replaces it in a single assignment:
+        requests already running finish on the old build, the embedding model
+        and LLM client are kept, and the answer cache is cleared because its
+        answers came from the old build. Returns True if the index was swapped.
+        """
+        with self._swap_lock:
+            marker = published_index_marker()
+            if marker == self.index.marker:
+                return False
+            old_version = self.index.version
+            state = self._open_index(marker)
+            self.index = state
+            self.cache.set_version(state.version)
+        REGISTRY.increment("index_swaps_total")
+        log_event("index_swapped", old_version=old_version, new_version=state.version)
+        return True
+
+    def _lookup(self, query, trace):
+        """
+        Embeds the query and checks the answer cache.
+        Returns (cached_answer_or_None, query_embedding); the embedding is None
+        when the exact tier hit and no embedding was needed.
+        """
+        with trace.stage("cache_exact"):
+            cached = self.cache.get_exact(query)
+        if cached is not None:
+            trace.set(cache="exact")
+            REGISTRY.increment("rag_cache_lookups_total", result="exact")
+            return cached, None
+
+        with trace.stage("embed"):
+            embedding = self.embedder.embed_query(query)
+        with trace.stage("cache_semantic"):
+            cached = self.cache.get_semantic(embedding)
+        result = "semantic" if cached is not None else "miss"
+        trace.set(cache=result)
+        REGISTRY.increment("rag_cache_lookups_total", result=result)
+        return cached, embedding
+
+    def _retrieve(self, query, embedding, trace=None, index=None, collections=None):
+        """
+        Returns the documents to answer a query with, from `index` (the current
+        IndexState by default), searching only the given collections or, when
+        none are given, the ones the index's router picks.
+        In hybrid mode, vector and BM25 candidates are combined with reciprocal
+        rank fusion so exact terms like course numbers and acronyms are found
+        even when the embedding misses them.
+        """
+        trace = trace or RequestTrace("retrieve")
+        docs = self._search(query, embedding, trace, index or self.index, collections)
+        if self.reranker is None:
+            return docs
+        with trace.stage("rerank"):
+            reranked = self.reranker.rerank(query, docs, RERANK_TOP_N)
+        trace.set(rerank_candidates=len(docs))
+        return reranked
+
+    def _search(self, query, embedding, trace, index, collections=None):
+        """
+        Returns the first-stage candidates: RETRIEVAL_K chunks, or
+        RERANK_CANDIDATES when a reranker will pick the best of them.
+        With several collections, only the routed ones are searched.
+        """
+        depth = RERANK_CANDIDATES if self.reranker is not None else RETRIEVAL_K
+        search_kwargs = {}
+        if index.router is not None:
+            with trace.stage("route"):
+                search_kwargs["collections"] = index.router.route(embedding, collections)
+            trace.set(collections=search_kwargs["collections"])
+
+        if index.lexical_index is None:
+            with trace.stage("vector_search"):
+                return index.vectorstore.similarity_search_by_vector(embedding, k=depth, **search_kwargs)
+
+        with trace.stage("vector_search"):
+            vector_docs = index.vectorstore.similarity_search_by_vector(
+                embedding, k=max(HYBRID_CANDIDATES, depth), **search_kwargs
+            )
+        docs_by_id = {doc.metadata.get("chunk_id"): doc for doc in vector_docs}
+        with trace.stage("lexical_search"):
+            lexical_ids = [
+                cid for cid, _ in index.lexical_index.search(query, max(HYBRID_CANDIDATES, depth), **search_kwargs)
             ]
-        )
+        fused_ids = reciprocal_rank_fusion([list(docs_by_id), lexical_ids])[:depth]
 
-        # 4. Create the chain
-        question_answer_chain = create_stuff_documents_chain(llm, prompt)
-        rag_chain = create_retrieval_chain(retriever, question_answer_chain)
-        
-        return rag_chain
+        missing = [cid for cid in fused_ids if cid not in docs_by_id]
+        if missing:
+            with trace.stage("fetch_chunks"):
+                found = index.vectorstore.get(ids=missing, include=["documents", "metadatas"])
+            for cid, text, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+                docs_by_id[cid] = Document(page_content=text, metadata=metadata)
+        return [docs_by_id[cid] for cid in fused_ids if cid in docs_by_id]
 
-    def get_response(self, query):
+    def _prepare(self, query, trace, index, collections=None):
+        """
+        Runs every step before generation: cache lookups, query embedding,
+        retrieval from `index` and context assembly. Blocking, so async callers
+        run it in a worker thread. Questions limited to explicit collections
+        bypass the answer cache, whose answers may come from other collections.
+        Returns (cached_answer, embedding, sources); cached_answer is None on a miss.
+        """
+        if collections:
+            with trace.stage("embed"):
+                embedding = self.embedder.embed_query(query)
+            trace.set(cache="bypass")
+        else:
+            cached, embedding = self._lookup(query, trace)
+            if cached is not None:
+                return cached, embedding, cached.sources
+        retrieved = self._retrieve(query, embedding, trace, index, collections)
+        with trace.stage("assemble_context"):
+            sources = assemble_context(retrieved)
+        context_tokens = sum(count_tokens(doc.page_content) for doc in sources)
+        trace.set(retrieved=len(retrieved), passages=len(sources), context_tokens=context_tokens)
+        REGISTRY.increment("rag_context_tokens_total", context_tokens)
+        return None, embedding, sources
+
+    def _finish_answer(self, trace, query, embedding, answer, sources, index, collections=None):
+        """
+        Caches a generated answer (unless it was limited to explicit collections
+        or its index was swapped out meanwhile) and records its token count.
         """
-        Gets a response from the chatbot for a given query.
+        completion_tokens = count_tokens(answer)
+        trace.set(completion_tokens=completion_tokens)
+        REGISTRY.increment("rag_completion_tokens_total", completion_tokens)
+        if not collections:
+            self.cache.put(query, embedding, answer, sources, version=index.version)
+
+    def get_response(self, query, collections=None):
+        """
+        Gets a response from the chatbot for a given query, optionally searching
+        only the named collections (see collections()).
         Returns the answer and the source documents.
         """
-        if not self.chain:
+        if self.llm is None:
             return "Chatbot is not initialized.", []
         
+        trace = RequestTrace("get_response")
+        index = self.index
+        try:
+            cached, embedding, sources = self._prepare(query, trace, index, collections)
+            if cached is not None:
+                trace.finish()
+                return cached.answer, cached.sources
+
+            with trace.stage("llm"):
+                answer = self.llm.complete(self._messages(query, sources))
+            self._finish_answer(trace, query, embedding, answer, sources, index, collections)
+            trace.finish()
+            return answer, sources
+        except LLMError as e:
+            trace.set(error=str(e))
+            trace.finish("llm_unavailable")
+            return LLM_UNAVAILABLE_MESSAGE, []
+        except Exception as e:
+            trace.set(error=str(e))
+            trace.finish("error")
+            return f"An error occurred: {e}", []
+
+    def stream_response(self, query, collections=None):
+        """
+        Streams a response from the chatbot for a given query, optionally
+        searching only the named collections.
+        Yields ("sources", documents) once retrieval is done, then
+        ("token", text) for each piece of the answer as the LLM produces it.
+        """
+        if self.llm is None:
+            yield "token", "Chatbot is not initialized."
+            return
+
+        trace = RequestTrace("stream_response")
+        index = self.index
+        try:
+            cached, embedding, sources = self._prepare(query, trace, index, collections)
+            if cached is not None:
+                yield "sources", cached.sources
+                yield "token", cached.answer
+                trace.finish()
+                return
+
+            yield "sources", sources
+            tokens = []
+            llm_started = time.perf_counter()
+            for token in self.llm.stream(self._messages(query, sources)):
+                if not tokens:
+                    trace.set(first_token_ms=round((time.perf_counter() - llm_started) * 1000, 2))
+                tokens.append(token)
+                yield "token", token
+            trace.record("llm", time.perf_counter() - llm_started)
+            self._finish_answer(trace, query, embedding, "".join(tokens), sources, index, collections)
+            trace.finish()
+        except LLMError as e:
+            trace.set(error=str(e))
+            trace.finish("llm_unavailable")
+            yield "token", LLM_UNAVAILABLE_MESSAGE
+        except Exception as e:
+            trace.set(error=str(e))
+            trace.finish("error")
+            yield "token", f"An error occurred: {e}"
+
+    async def aget_response(self, query, collections=None):
+        """
+        Async version of get_response for serving many questions concurrently.
+        Embedding and vector search run in a worker thread; the LLM call uses
+        the pooled async HTTP client, so the event loop is never blocked.
+        """
+        if self.llm is None:
+            return "Chatbot is not initialized.", []
+
+        trace = RequestTrace("aget_response")
+        index = self.index
         try:
-            response = self.chain.invoke({"input": query})
-            return response.get("answer"), response.get("context", [])
+            cached, embedding, sources = await asyncio.to_thread(self._prepare, query, trace, index, collections)
+            if cached is not None:
+                trace.finish()
+                return cached.answer, cached.sources
+
+            with trace.stage("llm"):
+                answer = await self.llm.acomplete(self._messages(query, sources))
+            self._finish_answer(trace, query, embedding, answer, sources, index, collections)
+            trace.finish()
+            return answer, sources
+        except LLMError as e:
+            trace.set(error=str(e))
+            trace.finish("llm_unavailable")
+            return LLM_UNAVAILABLE_MESSAGE, []
         except Exception as e:
+            trace.set(error=str(e))
+            trace.finish("error")
             return f"An error occurred: {e}", []
 
+    async def astream_response(self, query, collections=None):
+        """Async version of stream_response, yielding the same (kind, payload) events."""
+        if self.llm is None:
+            yield "token", "Chatbot is not initialized."
+            return
+
+        trace = RequestTrace("astream_response")
+        index = self.index
+        try:
+            cached, embedding, sources = await asyncio.to_thread(self._prepare, query, trace, index, collections)
+            if cached is not None:
+                yield "sources", cached.sources
+                yield "token", cached.answer
+                trace.finish()
+                return
+
+            yield "sources", sources
+            tokens = []
+            llm_started = time.perf_counter()
+            async for token in self.llm.astream(self._messages(query, sources)):
+                if not tokens:
+                    trace.set(first_token_ms=round((time.perf_counter() - llm_started) * 1000, 2))
+                tokens.append(token)
+                yield "token", token
+            trace.record("llm", time.perf_counter() - llm_started)
+            self._finish_answer(trace, query, embedding, "".join(tokens), sources, index, collections)
+            trace.finish()
+        except LLMError as e:
+            trace.set(error=str(e))
+            trace.finish("llm_unavailable")
+            yield "token", LLM_UNAVAILABLE_MESSAGE
+        except Exception as e:
+            trace.set(error=str(e))
+            trace.finish("error")
+            yield "token", f"An error occurred: {e}"
+
+    def warm_up(self):
+        """Runs a throwaway query embedding so the model weights are loaded and
+        the first real question doesn't pay for lazy initialization."""
+        self.embeddings.embed_query("warm up")
+        if self.reranker is not None:
+            self.reranker.warm_up()
+
+def llm_connection_limits():
+    """Returns the connection pool limits for the OpenRouter HTTP clients."""
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_CONNECTIONS,
+    )
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merges ranked lists of IDs, scoring each ID by the sum of 1 / (k + rank)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def get_chatbot():
+    """
+    Returns the process-wide Chatbot, creating it on first use.
+    The embedding model, vector store handle and LLM client are loaded once per
+    process and shared by every session; the chatbot holds no per-session state,
+    so callers must not keep their own copy in st.session_state.
+    """
+    global _shared_chatbot
+    if _shared_chatbot is None:
+        with _shared_lock:
+            if _shared_chatbot is None:
+                bot = Chatbot()
+                with STARTUP.phase("warm_up"):
+                    bot.warm_up()
+                _shared_chatbot = bot
+                log_event("startup_profile", **STARTUP.report())
+                start_index_watcher(bot)
+    return _shared_chatbot
+
+def start_index_watcher(bot, interval=INDEX_WATCH_INTERVAL):
+    """
+    Checks for a newly published index every `interval` seconds on a daemon
+    thread (once per process) and hot-swaps it into the bot. A failed swap is
+    logged and the bot keeps serving the index it has.
+    """
+    global _index_watcher
+    if interval <= 0 or _index_watcher is not None:
+        return
+
+    def watch():
+        while True:
+            time.sleep(interval)
+            try:
+                bot.refresh_index()
+            except Exception as e:
+                REGISTRY.increment("index_swap_failures_total")
+                log_event("index_swap_failed", error=str(e))
+
+    _index_watcher = threading.Thread(target=watch, name="index-watcher", daemon=True)
+    _index_watcher.start()
+
+def start_background_warm_up():
+    """
+    Builds the shared chatbot on a daemon thread, once per process, so a page
+    or server can start answering health checks while the embedding model
+    loads. A failure is only logged; the next get_chatbot() call retries and
+    raises it to its caller.
+    """
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None and _shared_chatbot is None:
+            def warm_up():
+                try:
+                    get_chatbot()
+                except Exception as e:
+                    log_event("warm_up_failed", error=str(e))
+
+            _warm_up_thread = threading.Thread(target=warm_up, name="chatbot-warm-up", daemon=True)
+            _warm_up_thread.start()
+
+def published_index_marker():
+    """
+    Returns a cheap identifier of the index currently published for
+    VECTOR_STORE: the Cloud Storage generation of a remote artifact's manifest,
+    a local artifact's version, or the CURRENT version name of DB_PATH.
+    """
+    if VECTOR_STORE == "artifact":
+        if INDEX_ARTIFACT_GCS_PATH:
+            return remote_artifact_generation(INDEX_ARTIFACT_GCS_PATH)
+        return (load_artifact_manifest(INDEX_ARTIFACT_PATH) or {}).get("version")
+    # Databases built before versioned directories are identified by their manifest
+    return current_version_name(DB_PATH) or index_version(DB_PATH)
+
+def index_available():
+    """Returns True if the index selected by VECTOR_STORE exists (or can be fetched)."""
+    if VECTOR_STORE == "artifact":
+        return bool(INDEX_ARTIFACT_GCS_PATH) or os.path.exists(INDEX_ARTIFACT_PATH)
+    return os.path.exists(DB_PATH)
+
+def is_chatbot_ready():
+    """Returns True once the shared chatbot has been created and warmed up."""
+    return _shared_chatbot is not None
+
 # Example usage (for testing)
 if __name__ == "__main__":
-    bot = Chatbot()
+    bot = get_chatbot()
     
     # Example query
     test_query = "What are the requirements for the PhD qualifying exam?"
@@ -101,6 +593,6 @@ if __name__ == "__main__":
         for i, doc in enumerate(sources):
             print(f"Source {i+1}:")
             # print(f"  Content: {doc.page_content[:200]}...") # Uncomment to see content
-            print(f"  Source: {doc.metadata.get('source', 'N/A')}")
+            print(f"  Source: {doc.metadata.get('source', 'N/A')}, page {doc.metadata.get('page', 'N/A')}")
     else:
         print("No sources found.")
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""
+Retention job: deletes Firestore chat sessions (and their messages) that have
+not been updated for CHAT_RETENTION_DAYS days.
+
+Usage:
+    python src/cleanup_sessions.py [--days 90] [--workers 8]
+"""
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+from firestore_chat import CLEANUP_WORKERS, FirestoreChatManager
+
+# Load environment variables
+load_dotenv()
+
+# --- Configuration ---
+CHAT_RETENTION_DAYS = float(os.getenv("CHAT_RETENTION_DAYS", "90"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete chat sessions older than the retention period.")
+    parser.add_argument("--days", type=float, default=CHAT_RETENTION_DAYS,
+                        help="Delete sessions not updated in this many days.")
+    parser.add_argument("--workers", type=int, default=CLEANUP_WORKERS,
+                        help="Sessions deleted in parallel.")
+    args = parser.parse_args()
+
+    manager = FirestoreChatManager(write_behind=False)
+    print(f"Deleting chat sessions not updated in the last {args.days:g} days...")
+    result = manager.purge_sessions_older_than(args.days, max_workers=args.workers)
+
+    print("\n-----------------------------------------")
+    print("Retention cleanup complete!")
+    print(f"Cutoff: {result['cutoff']}")
+    print(f"Sessions deleted: {result['sessions_deleted']}")
+    print(f"Documents deleted: {result['documents_deleted']}")
+    print(f"Time: {result['seconds']:.1f}s ({result['documents_per_sec']:.1f} documents/sec)")
+    print("-----------------------------------------")
+
+if __name__ == "__main__":
+    main()
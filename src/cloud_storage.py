@@ -1,49 +1,223 @@
 import os
+import base64
+import json
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import storage
 from google.cloud.exceptions import NotFound
 import tempfile
 
+from metrics import REGISTRY
+
+# --- Configuration ---
+# Local cache of downloaded objects, reused across ingests and restarts while their generation is unchanged
+GCS_CACHE_DIR = os.getenv("GCS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "mane_gcs_cache"))
+GCS_DOWNLOAD_WORKERS = int(os.getenv("GCS_DOWNLOAD_WORKERS", "8"))
+# Objects at least this large are downloaded as parallel byte-range chunks
+GCS_CHUNKED_DOWNLOAD_THRESHOLD = int(os.getenv("GCS_CHUNKED_DOWNLOAD_THRESHOLD", str(32 * 1024 * 1024)))
+GCS_CHUNK_SIZE = int(os.getenv("GCS_CHUNK_SIZE", str(16 * 1024 * 1024)))
+# Only the metadata the cache needs is requested when listing
+LIST_FIELDS = "items(name,generation,size,md5Hash,etag),nextPageToken"
+
 class CloudStorageManager:
-    def __init__(self, bucket_name=None):
-        """Initialize Google Cloud Storage manager."""
-        self.client = storage.Client()
+    def __init__(self, bucket_name=None, client=None, cache_dir=GCS_CACHE_DIR):
+        """
+        Initialize Google Cloud Storage manager.
+        A client can be passed in (e.g. one pointed at a fake GCS server);
+        otherwise one is created, anonymously when STORAGE_EMULATOR_HOST is set.
+        """
+        self.client = client or _default_client()
         self.bucket_name = bucket_name or os.getenv('GCS_BUCKET_NAME')
         if not self.bucket_name:
             raise ValueError("GCS_BUCKET_NAME environment variable must be set")
-        
+
         self.bucket = self.client.bucket(self.bucket_name)
-    
+        self.cache_dir = cache_dir
+        self._cache_lock = threading.Lock()
+
     def upload_file(self, local_file_path, cloud_file_name):
         """Upload a file to Google Cloud Storage."""
         blob = self.bucket.blob(cloud_file_name)
         blob.upload_from_filename(local_file_path)
         print(f"Uploaded {local_file_path} to gs://{self.bucket_name}/{cloud_file_name}")
         return f"gs://{self.bucket_name}/{cloud_file_name}"
-    
+
     def download_file(self, cloud_file_name, local_file_path):
         """Download a file from Google Cloud Storage."""
         blob = self.bucket.blob(cloud_file_name)
         blob.download_to_filename(local_file_path)
         print(f"Downloaded gs://{self.bucket_name}/{cloud_file_name} to {local_file_path}")
-    
+
     def file_exists(self, cloud_file_name):
         """Check if a file exists in Google Cloud Storage."""
         blob = self.bucket.blob(cloud_file_name)
         return blob.exists()
-    
+
     def list_files(self, prefix=""):
         """List files in the bucket with optional prefix."""
-        blobs = self.client.list_blobs(self.bucket_name, prefix=prefix)
-        return [blob.name for blob in blobs]
-    
+        return [blob.name for blob in self.list_blobs(prefix)]
+
+    def list_blobs(self, prefix=""):
+        """
+        Lists the objects under a prefix with their generation, size and hash,
+        in one paged listing call instead of a metadata request per object.
+        """
+        return list(self.client.list_blobs(self.bucket_name, prefix=prefix, fields=LIST_FIELDS))
+
     def delete_file(self, cloud_file_name):
         """Delete a file from Google Cloud Storage."""
         blob = self.bucket.blob(cloud_file_name)
         blob.delete()
         print(f"Deleted gs://{self.bucket_name}/{cloud_file_name}")
-    
+
     def get_temp_file(self, cloud_file_name):
         """Download a file to a temporary location and return the path."""
         with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(cloud_file_name)[1]) as tmp_file:
             self.download_file(cloud_file_name, tmp_file.name)
-            return tmp_file.name 
\ No newline at end of file
+            return tmp_file.name
+
+    def fetch(self, cloud_file_name, blob=None):
+        """
+        Returns the path of an up-to-date local copy of an object, or None if
+        it doesn't exist. The object's metadata is fetched (or taken from a
+        listing) and compared with the cache; it is only downloaded when its
+        generation changed. Cached files are shared, so callers must not modify them.
+        """
+        if blob is None:
+            blob = self.bucket.get_blob(cloud_file_name)
+            if blob is None:
+                return None
+
+        path = self._cached_path(blob)
+        if path is not None:
+            REGISTRY.increment("gcs_cache_total", result="hit")
+            return path
+
+        REGISTRY.increment("gcs_cache_total", result="miss")
+        os.makedirs(self._objects_dir(), exist_ok=True)
+        path = os.path.join(self._objects_dir(), _content_key(blob))
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        self._download_blob(blob, tmp_path)
+        os.replace(tmp_path, path)
+        self._remember(blob, path)
+        print(f"Downloaded gs://{self.bucket_name}/{blob.name} (generation {blob.generation})")
+        return path
+
+    def read_bytes(self, cloud_file_name):
+        """
+        Returns an object's contents in memory (e.g. for fitz.open(stream=...)),
+        or None if it doesn't exist. Goes through fetch(), so the object is
+        served from (or added to) the local cache.
+        """
+        path = self.fetch(cloud_file_name)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def fetch_many(self, prefix, suffix=""):
+        """
+        Brings every object under a prefix (optionally only names ending in
+        suffix) into the local cache, downloading changed ones in parallel.
+        Returns {object name: local path}, sorted by name.
+        """
+        blobs = [blob for blob in self.list_blobs(prefix) if blob.name.endswith(suffix)]
+        with ThreadPoolExecutor(max_workers=max(1, GCS_DOWNLOAD_WORKERS)) as pool:
+            paths = list(pool.map(lambda blob: self.fetch(blob.name, blob), blobs))
+        return dict(sorted(zip((blob.name for blob in blobs), paths)))
+
+    def download_prefix(self, prefix, local_dir):
+        """
+        Copies every object under a prefix into local_dir, keeping the relative
+        paths. Objects whose generation is already cached are not downloaded.
+        Files are hard-linked to the cache when possible rather than copied, so
+        (e.g. on Cloud Run's in-memory /tmp) they are not held twice.
+        """
+        prefix = prefix.rstrip("/") + "/"
+        for name, path in self.fetch_many(prefix).items():
+            local_path = os.path.join(local_dir, os.path.relpath(name, prefix))
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            try:
+                os.link(path, local_path)
+            except OSError:
+                # Another filesystem, or links unsupported
+                shutil.copyfile(path, local_path)
+
+    def _download_blob(self, blob, local_path):
+        """Downloads a specific generation, in parallel byte ranges when the object is large."""
+        if blob.size and blob.size >= GCS_CHUNKED_DOWNLOAD_THRESHOLD:
+            from google.cloud.storage import transfer_manager
+
+            transfer_manager.download_chunks_concurrently(
+                blob,
+                local_path,
+                chunk_size=GCS_CHUNK_SIZE,
+                max_workers=GCS_DOWNLOAD_WORKERS,
+                worker_type=transfer_manager.THREAD,
+                download_kwargs={"if_generation_match": blob.generation},
+            )
+        else:
+            blob.download_to_filename(local_path, if_generation_match=blob.generation)
+
+    def _objects_dir(self):
+        return os.path.join(self.cache_dir, "objects")
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, "index.json")
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _cached_path(self, blob):
+        """Returns the cached copy of this generation of the object, if there is one."""
+        with self._cache_lock:
+            entry = self._load_index().get(f"{self.bucket_name}/{blob.name}")
+        if entry and entry["generation"] == str(blob.generation) and os.path.exists(entry["path"]):
+            return entry["path"]
+        return None
+
+    def _remember(self, blob, path):
+        """
+        Records which cached file holds the object's current generation, and
+        deletes the file of the generation it replaces unless another object
+        still uses it (identical objects share a file).
+        """
+        with self._cache_lock:
+            index = self._load_index()
+            key = f"{self.bucket_name}/{blob.name}"
+            previous = index.get(key)
+            index[key] = {
+                "generation": str(blob.generation),
+                "etag": blob.etag,
+                "path": path,
+            }
+            tmp_path = self._index_path() + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f, indent=2)
+            os.replace(tmp_path, self._index_path())
+
+            if previous and previous["path"] != path and \
+                    all(entry["path"] != previous["path"] for entry in index.values()):
+                try:
+                    os.remove(previous["path"])
+                except FileNotFoundError:
+                    pass
+
+def _content_key(blob):
+    """Names cached files by content hash, so identical objects share one file."""
+    if blob.md5_hash:
+        return base64.b64decode(blob.md5_hash).hex()
+    # Composite objects have no MD5; fall back to their identity and generation
+    return f"{blob.bucket.name}-{blob.name}-{blob.generation}".replace("/", "_")
+
+def _default_client():
+    if os.getenv("STORAGE_EMULATOR_HOST"):
+        # Local fake GCS server (e.g. fake-gcs-server): no real credentials needed
+        from google.auth.credentials import AnonymousCredentials
+        return storage.Client(project=os.getenv("GOOGLE_CLOUD_PROJECT", "test"), credentials=AnonymousCredentials())
+    return storage.Client()
@@ -0,0 +1,128 @@
+import os
+import re
+
+from langchain_core.documents import Document
+
+from metrics import log_event
+
+# --- Configuration ---
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+DUPLICATE_SIMILARITY = float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.8"))
+TOKENIZER_ENCODING = "cl100k_base"
+SHINGLE_SIZE = 3
+
+_WORD = re.compile(r"\w+")
+_encoding = None
+
+def count_tokens(text):
+    """
+    Counts tokens with a local tiktoken encoding.
+    tiktoken downloads the encoding on first use and caches it in
+    TIKTOKEN_CACHE_DIR; the Docker image pre-fills that cache. Falls back to
+    the usual four-characters-per-token estimate, logged once, when the
+    encoding can't be loaded (e.g. offline with an empty cache).
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            _encoding = False
+            log_event("tokenizer_fallback", encoding=TOKENIZER_ENCODING, error=str(e),
+                      cache_dir=os.getenv("TIKTOKEN_CACHE_DIR"))
+    if _encoding is False:
+        return (len(text) + 3) // 4
+    return len(_encoding.encode(text, disallowed_special=()))
+
+def merge_overlapping(docs):
+    """
+    Merges chunks that overlap or touch on the same page into one passage.
+    Chunks need `start_index` metadata (set at ingestion); others pass through.
+    A chunk that bridges two passages joins them. The merged passage takes
+    the position and metadata of its best-ranked chunk.
+    """
+    merged = []  # None where a passage was folded into a better-ranked one
+    passages = {}  # (source, page) -> list of [start, end, index into merged]
+    for doc in docs:
+        start = doc.metadata.get("start_index")
+        if start is None:
+            merged.append(doc)
+            continue
+
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        span = (start, start + len(doc.page_content), doc.page_content)
+        position, metadata = len(merged), doc.metadata
+        others = passages.get(key, [])
+        while True:
+            # Joining a passage grows the span, which may then touch another one
+            touching = [p for p in others if span[0] <= p[1] and p[0] <= span[1]]
+            if not touching:
+                break
+            for passage_start, passage_end, index in touching:
+                current = merged[index]
+                span = _join_spans(span, (passage_start, passage_end, current.page_content))
+                if index < position:
+                    position, metadata = index, current.metadata
+                merged[index] = None
+            others = [p for p in others if p not in touching]
+
+        passages[key] = others + [[span[0], span[1], position]]
+        if position == len(merged):
+            merged.append(doc if span[0] == start and span[2] == doc.page_content else
+                          Document(page_content=span[2], metadata={**metadata, "start_index": span[0]}))
+        else:
+            merged[position] = Document(page_content=span[2], metadata={**metadata, "start_index": span[0]})
+    return [doc for doc in merged if doc is not None]
+
+def _join_spans(a, b):
+    """Joins two overlapping or touching (start, end, text) spans of a page."""
+    if b[0] < a[0]:
+        a, b = b, a
+    if b[1] <= a[1]:
+        return a
+    return (a[0], b[1], a[2] + b[2][a[1] - b[0]:])
+
+def drop_near_duplicates(docs, threshold=DUPLICATE_SIMILARITY):
+    """Drops passages whose word shingles mostly repeat a better-ranked passage."""
+    kept = []
+    kept_shingles = []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if any(_jaccard(shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+    return kept
+
+def assemble_context(docs, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Turns retrieved chunks into the passages sent to the LLM: overlapping
+    chunks are merged, near-duplicates dropped, and passages packed in rank
+    order until the token budget is spent. The best passage is truncated
+    rather than dropped if it alone exceeds the budget.
+    """
+    packed = []
+    remaining = token_budget
+    for doc in drop_near_duplicates(merge_overlapping(docs)):
+        tokens = count_tokens(doc.page_content)
+        if tokens <= remaining:
+            packed.append(doc)
+            remaining -= tokens
+        elif not packed:
+            # Estimate the cut from the token density of this passage
+            keep = len(doc.page_content) * remaining // tokens
+            packed.append(Document(page_content=doc.page_content[:keep], metadata=doc.metadata))
+            break
+    return packed
+
+def _shingles(text):
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
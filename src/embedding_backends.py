@@ -0,0 +1,173 @@
+"""
+Embedding backends for the sentence-transformers model.
+
+All backends run the same EMBEDDING_MODEL weights and return LangChain
+Embeddings objects, so ingestion and the chatbot can switch between them:
+
+    torch       full-precision PyTorch (the default)
+    torch-int8  PyTorch with the Linear layers dynamically quantized to int8
+    onnx        ONNX Runtime, using the ONNX export published with the model
+    onnx-int8   ONNX Runtime, using the int8-quantized ONNX export
+
+The ONNX backends need `uv sync --extra onnx` (sentence-transformers >= 3.2
+with ONNX Runtime). The backend is recorded in the ingest manifest, and the
+chatbot refuses to query an index built with a different one.
+
+Check that a backend retrieves the same chunks as the float model:
+    python src/embedding_backends.py compare --backend onnx-int8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# --- Configuration ---
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+# Quantized export to load for onnx-int8 (the avx2 build runs on any recent x86 CPU)
+EMBEDDING_ONNX_INT8_FILE = os.getenv("EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+DEFAULT_BACKEND = "torch"  # Assumed for indexes whose manifest predates backends
+
+# Parity thresholds used by `compare`
+PARITY_MIN_COSINE = float(os.getenv("EMBEDDING_PARITY_MIN_COSINE", "0.98"))
+PARITY_MIN_OVERLAP = float(os.getenv("EMBEDDING_PARITY_MIN_OVERLAP", "0.9"))
+
+def create_embeddings(model_name, backend=EMBEDDING_BACKEND, encode_kwargs=None):
+    """Creates a LangChain embeddings object for model_name on the given backend."""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(
+            f"Unknown EMBEDDING_BACKEND '{backend}'. Choose one of: {', '.join(EMBEDDING_BACKENDS)}."
+        )
+
+    model_kwargs = {}
+    if backend == "onnx":
+        model_kwargs = {"backend": "onnx"}
+    elif backend == "onnx-int8":
+        model_kwargs = {"backend": "onnx", "model_kwargs": {"file_name": EMBEDDING_ONNX_INT8_FILE}}
+
+    embeddings = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs=model_kwargs,
+        encode_kwargs=encode_kwargs or {},
+    )
+    if backend == "torch-int8":
+        import torch
+        embeddings.client = torch.quantization.quantize_dynamic(
+            embeddings.client, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return embeddings
+
+class EmbeddingMismatchError(ValueError):
+    """An index was embedded with a different model or backend than the one configured."""
+
+def check_index_embeddings(settings, model_name, backend=EMBEDDING_BACKEND):
+    """
+    Raises EmbeddingMismatchError unless an index built with the given ingest
+    settings was embedded with model_name on this backend. Settings that do
+    not record the model cannot be checked and are rejected too.
+    """
+    index_model = (settings or {}).get("embedding_model")
+    index_backend = (settings or {}).get("embedding_backend", DEFAULT_BACKEND)
+    if not index_model:
+        raise EmbeddingMismatchError(
+            "The index does not record which embedding model built it. "
+            "Re-run `python src/ingest.py` to rebuild it."
+        )
+    if index_model != model_name:
+        raise EmbeddingMismatchError(
+            f"The index was built with '{index_model}' but EMBEDDING_MODEL is "
+            f"'{model_name}'. Re-run `python src/ingest.py` or change EMBEDDING_MODEL."
+        )
+    if index_backend != backend:
+        raise EmbeddingMismatchError(
+            f"The index was embedded with the '{index_backend}' backend but EMBEDDING_BACKEND is "
+            f"'{backend}'. Re-run `python src/ingest.py` or change EMBEDDING_BACKEND."
+        )
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def compare_backends(model_name, candidate, queries, texts, k=4, reference=DEFAULT_BACKEND):
+    """
+    Embeds queries and texts with both backends and reports how closely the
+    candidate matches the reference: cosine similarity of the query embeddings
+    and overlap of the top-k texts each retrieves for every query.
+    """
+    report = {"model": model_name, "reference": reference, "candidate": candidate, "k": k}
+    results = {}
+    for backend in (reference, candidate):
+        embeddings = create_embeddings(model_name, backend)
+        embeddings.embed_query("warm up")
+        started = time.perf_counter()
+        query_vectors = _normalize([embeddings.embed_query(q) for q in queries])
+        query_seconds = time.perf_counter() - started
+        text_vectors = _normalize(embeddings.embed_documents(texts))
+        scores = query_vectors @ text_vectors.T
+        top_k = np.argsort(-scores, axis=1)[:, :k]
+        results[backend] = (query_vectors, top_k)
+        report[f"{backend}_query_ms"] = round(query_seconds / len(queries) * 1000, 2)
+
+    ref_vectors, ref_top = results[reference]
+    cand_vectors, cand_top = results[candidate]
+    cosines = np.sum(ref_vectors * cand_vectors, axis=1)
+    overlaps = [len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)]
+    report.update({
+        "min_query_cosine": float(cosines.min()),
+        "mean_query_cosine": float(cosines.mean()),
+        "mean_top_k_overlap": float(np.mean(overlaps)),
+        "passed": bool(cosines.min() >= PARITY_MIN_COSINE and np.mean(overlaps) >= PARITY_MIN_OVERLAP),
+    })
+    return report
+
+def _load_chunk_texts(db_path, limit):
+    import chromadb
+    from index_versions import current_index_dir
+    from routing import collection_names
+
+    index_dir = current_index_dir(db_path)
+    client = chromadb.PersistentClient(path=index_dir)
+    texts = []
+    for name in collection_names(index_dir):
+        if len(texts) >= limit:
+            break
+        texts.extend(client.get_or_create_collection(name).get(include=["documents"], limit=limit - len(texts))["documents"])
+    return texts
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare an embedding backend with the float model.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compare = subparsers.add_parser("compare", help="Check retrieval parity against the torch backend.")
+    compare.add_argument("--backend", default="onnx-int8", choices=EMBEDDING_BACKENDS)
+    compare.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"))
+    compare.add_argument("--db-path", default="chroma_db")
+    compare.add_argument("--questions", default="benchmarks/questions.json")
+    compare.add_argument("--max-chunks", type=int, default=2000)
+    compare.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        queries = [item["question"] for item in json.load(f)]
+    texts = _load_chunk_texts(args.db_path, args.max_chunks)
+    if not texts:
+        print(f"Error: no chunks found in '{args.db_path}'. Run `python src/ingest.py` first.")
+        sys.exit(1)
+
+    print(f"Comparing '{args.backend}' with '{DEFAULT_BACKEND}' on {len(queries)} questions "
+          f"and {len(texts)} chunks...")
+    report = compare_backends(args.model, args.backend, queries, texts, k=args.k)
+    print(json.dumps(report, indent=2))
+    if not report["passed"]:
+        print(f"\nParity check failed (thresholds: cosine >= {PARITY_MIN_COSINE}, "
+              f"top-{args.k} overlap >= {PARITY_MIN_OVERLAP}).")
+        sys.exit(1)
+    print("\nParity check passed.")
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,358 @@
 import os
-from datetime import datetime
+import atexit
+import json
+import signal
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from google.api_core import exceptions as google_exceptions
 from google.cloud import firestore
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from metrics import REGISTRY, log_event
+
+# --- Configuration ---
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "true").lower() == "true"
+CHAT_SPOOL_PATH = os.getenv("CHAT_SPOOL_PATH", os.path.join(tempfile.gettempdir(), "mane_chat_spool.jsonl"))
+# Each process claims its own spool slot next to this path (see claim_spool)
+CHAT_SPOOL_SLOTS = 64
+CHAT_FLUSH_INTERVAL = float(os.getenv("CHAT_FLUSH_INTERVAL", "0.5"))
+# Seconds spent flushing queued writes at shutdown (Cloud Run kills the process 10s after SIGTERM)
+CHAT_SHUTDOWN_TIMEOUT = float(os.getenv("CHAT_SHUTDOWN_TIMEOUT", "8"))
+# Messages that can never be written (e.g. their session was deleted) are moved here
+CHAT_DEAD_LETTER_PATH = os.getenv("CHAT_DEAD_LETTER_PATH", CHAT_SPOOL_PATH + ".dead")
+# Commit errors that retrying cannot fix
+NON_RETRYABLE_ERRORS = (google_exceptions.NotFound, google_exceptions.InvalidArgument)
+FIRESTORE_BATCH_LIMIT = 500  # Maximum writes in one Firestore batch
+HISTORY_CACHE_SESSIONS = int(os.getenv("HISTORY_CACHE_SESSIONS", "256"))
+HISTORY_CACHE_MESSAGES = int(os.getenv("HISTORY_CACHE_MESSAGES", "100"))
+SESSION_SUMMARY_FIELDS = ["created_at", "updated_at", "message_count"]
+CLEANUP_WORKERS = int(os.getenv("CLEANUP_WORKERS", "8"))
+
+# Process-wide chat manager shared by every Streamlit session (see get_chat_manager)
+_shared_manager = None
+_shared_lock = threading.Lock()
+# Write-behind queues flushed on SIGTERM, and the handler that was installed before ours
+_open_queues = []
+_previous_sigterm_handler = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+def claim_spool(path):
+    """
+    Returns (spool path, lock file) for the first spool slot next to `path`
+    (path itself, then e.g. spool.1.jsonl, spool.2.jsonl) that no live
+    process holds, so processes on one host never share a spool. A slot left
+    by a crashed process is free again and its messages are replayed by the
+    claimer.
+    Without file locks, falls back to a spool named after the process ID.
+    """
+    base, ext = os.path.splitext(path)
+    if fcntl is None:
+        return f"{base}.{os.getpid()}{ext}", None
+    for slot in range(CHAT_SPOOL_SLOTS):
+        candidate = path if slot == 0 else f"{base}.{slot}{ext}"
+        lock_file = open(candidate + ".lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return candidate, lock_file
+        except OSError:
+            lock_file.close()
+    raise RuntimeError(f"All {CHAT_SPOOL_SLOTS} chat spool slots next to '{path}' are in use.")
+
+def _flush_on_sigterm(signum, frame):
+    """Flushes queued chat writes, then lets the previous SIGTERM handling run."""
+    for queue in list(_open_queues):
+        queue.close()
+    if callable(_previous_sigterm_handler):
+        _previous_sigterm_handler(signum, frame)
+    elif _previous_sigterm_handler != signal.SIG_IGN:
+        # Exit as the default action would, but through the normal shutdown path
+        sys.exit(128 + signum)
+
+def _install_sigterm_handler():
+    """
+    Flushes the queues on SIGTERM (which skips atexit). Signal handlers can
+    only be set from the main thread; Streamlit and uvicorn, whose scripts and
+    requests run elsewhere, already turn SIGTERM into a normal exit that runs
+    the atexit flush.
+    """
+    global _previous_sigterm_handler
+    if _previous_sigterm_handler is not None or threading.current_thread() is not threading.main_thread():
+        return
+    _previous_sigterm_handler = signal.getsignal(signal.SIGTERM)
+    signal.signal(signal.SIGTERM, _flush_on_sigterm)
+
+class ChatWriteBehindQueue:
+    """
+    Persists chat messages off the request path.
+
+    add() appends the message to a local spool file and returns immediately; a
+    background thread coalesces pending messages into one Firestore batched
+    write per session (the message documents plus one message_count/updated_at
+    update) and removes them from the spool once committed. A session whose
+    commit fails with a transient error is retried with backoff without holding
+    back the others; one that can never be written (NON_RETRYABLE_ERRORS, e.g.
+    the session was deleted) is moved to the dead-letter file. Messages left in
+    the spool by a crash are replayed by the next process that claims the
+    same spool slot (see claim_spool). Message IDs are chosen
+    up front so a replayed write overwrites rather than duplicates; only the
+    session's message_count can be over-counted if a crash lands between a
+    commit and the spool rewrite.
+    """
+
+    def __init__(self, db, collection_name, spool_path=CHAT_SPOOL_PATH, flush_interval=CHAT_FLUSH_INTERVAL,
+                 dead_letter_path=CHAT_DEAD_LETTER_PATH):
+        self.db = db
+        self.collection = db.collection(collection_name)
+        self.spool_path, self._spool_lock = claim_spool(spool_path)
+        self.dead_letter_path = dead_letter_path
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._in_flight = []
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self._pending.extend(self._read_spool())
+        if self._pending:
+            log_event("chat_spool_replay", messages=len(self._pending))
+        self._thread = threading.Thread(target=self._run, name="chat-write-behind", daemon=True)
+        self._thread.start()
+        _open_queues.append(self)
+        atexit.register(self.close)
+        _install_sigterm_handler()
+
+    def add(self, session_id, message_id, message_data):
+        """Queues a message for writing and records it in the spool."""
+        record = {"session_id": session_id, "message_id": message_id, "data": message_data}
+        with self._condition:
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                f.write(_encode_record(record) + "\n")
+            self._pending.append(record)
+            self._condition.notify()
+
+    def flush(self, timeout=None):
+        """Blocks until every queued message has been committed (or timeout expires)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._condition.notify()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout=CHAT_SHUTDOWN_TIMEOUT):
+        """Flushes pending messages, stops the background thread and releases the spool."""
+        if self._closed:
+            return
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        if self in _open_queues:
+            _open_queues.remove(self)
+        if self._spool_lock is not None:
+            self._spool_lock.close()
+
+    def _run(self):
+        retry_delay = self.flush_interval
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed and not self._pending:
+                    return
+                # Let a few more messages arrive so they share the batch
+                self._condition.wait(self.flush_interval)
+                self._in_flight, self._pending = self._pending, []
+
+            failed = self._commit(self._in_flight)
+            retry = []
+            for records, error in failed:
+                if isinstance(error, NON_RETRYABLE_ERRORS):
+                    self._dead_letter(records, error)
+                else:
+                    log_event("chat_write_behind_error", session_id=records[0]["session_id"],
+                              error=str(error), messages=len(records))
+                    retry.extend(records)
+
+            with self._condition:
+                self._pending = retry + self._pending
+                self._in_flight = []
+                self._rewrite_spool()
+                self._condition.notify_all()
+                if retry and self._closed:
+                    return
+            if retry:
+                REGISTRY.increment("firestore_write_retries_total")
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 30)
+            else:
+                retry_delay = self.flush_interval
+
+    @REGISTRY.timer("firestore_operation_seconds", operation="write_behind_commit")
+    def _commit(self, records):
+        """
+        Commits records one session at a time, so a failing session does not
+        block the others. Returns [(records, error)] for the sessions that failed.
+        """
+        sessions = {}
+        for record in records:
+            sessions.setdefault(record["session_id"], []).append(record)
+
+        failed = []
+        written = 0
+        for session_id, session_records in sessions.items():
+            try:
+                self._commit_session(session_id, session_records)
+                written += len(session_records)
+            except Exception as e:
+                failed.append((session_records, e))
+        REGISTRY.increment("firestore_messages_written_total", written)
+        return failed
+
+    def _commit_session(self, session_id, records):
+        # The session update goes in the first batch, so a deleted session
+        # fails before any of its messages are written
+        session_ref = self.collection.document(session_id)
+        batch = self.db.batch()
+        batch.update(session_ref, {
+            "updated_at": max(record["data"]["timestamp"] for record in records),
+            "message_count": firestore.Increment(len(records)),
+        })
+        operations = 1
+        for record in records:
+            if operations >= FIRESTORE_BATCH_LIMIT:
+                batch.commit()
+                batch = self.db.batch()
+                operations = 0
+            batch.set(session_ref.collection("messages").document(record["message_id"]), record["data"])
+            operations += 1
+        batch.commit()
+
+    def _dead_letter(self, records, error):
+        """Moves records that can never be written out of the queue, into the dead-letter file."""
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(_encode_record(dict(record, error=str(error))) + "\n")
+        log_event("chat_write_behind_dead_letter", session_id=records[0]["session_id"],
+                  error=str(error), messages=len(records))
+        REGISTRY.increment("firestore_dead_letter_total", len(records))
+
+    def _read_spool(self):
+        if not os.path.exists(self.spool_path):
+            return []
+        records = []
+        with open(self.spool_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        records.append(_decode_record(line))
+                    except ValueError:
+                        # A torn final line from a crash mid-write
+                        continue
+        return records
+
+    def _rewrite_spool(self):
+        # Caller holds self._condition
+        tmp_path = self.spool_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in self._pending:
+                f.write(_encode_record(record) + "\n")
+        os.replace(tmp_path, self.spool_path)
+
+def _encode_record(record):
+    data = dict(record["data"], timestamp=record["data"]["timestamp"].isoformat())
+    return json.dumps(dict(record, data=data))
+
+def _decode_record(line):
+    record = json.loads(line)
+    record["data"]["timestamp"] = datetime.fromisoformat(record["data"]["timestamp"])
+    return record
+
+class HistoryCache:
+    """
+    LRU cache of the most recent messages of recently used sessions.
+    Messages added through this process are appended as they are written, so
+    a cached session also reflects writes still queued in the write-behind queue.
+    """
+
+    def __init__(self, max_sessions=HISTORY_CACHE_SESSIONS, max_messages=HISTORY_CACHE_MESSAGES):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self._entries = OrderedDict()  # session_id -> {"messages": [...], "complete": bool}
+        self._lock = threading.Lock()
+
+    def get(self, session_id, limit=None):
+        """Returns the latest `limit` messages (all if None) if the cache can answer, else None."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            messages = entry["messages"]
+            if limit is None:
+                if not entry["complete"]:
+                    return None
+                result = list(messages)
+            elif len(messages) >= limit or entry["complete"]:
+                result = messages[-limit:] if limit else []
+            else:
+                return None
+            self._entries.move_to_end(session_id)
+            return result
+
+    def put(self, session_id, messages, complete):
+        """Caches the latest messages of a session; `complete` means there are no older ones."""
+        if self.max_sessions <= 0:
+            return
+        with self._lock:
+            if len(messages) > self.max_messages:
+                messages, complete = messages[-self.max_messages:], False
+            self._entries[session_id] = {"messages": list(messages), "complete": complete}
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+
+    def append(self, session_id, message):
+        """Appends a newly written message to a cached session."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            entry["messages"].append(message)
+            if len(entry["messages"]) > self.max_messages:
+                del entry["messages"][0]
+                entry["complete"] = False
+
+    def discard(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
 
 class FirestoreChatManager:
-    def __init__(self, collection_name="chat_sessions"):
-        """Initialize Firestore chat manager."""
-        self.db = firestore.Client()
+    def __init__(self, collection_name="chat_sessions", client=None, write_behind=CHAT_WRITE_BEHIND):
+        """
+        Initialize Firestore chat manager.
+        Pass `client` to use a pre-configured client (or an in-memory stand-in);
+        the default client honours FIRESTORE_EMULATOR_HOST. With write_behind,
+        add_message returns immediately and writes are batched in the background.
+        """
+        self.db = client or firestore.Client()
         self.collection_name = collection_name
         self.collection = self.db.collection(collection_name)
+        self.writer = ChatWriteBehindQueue(self.db, collection_name) if write_behind else None
+        self.history_cache = HistoryCache()
     
+    @REGISTRY.timer("firestore_operation_seconds", operation="create_chat_session")
     def create_chat_session(self, user_id: str = None) -> str:
         """Create a new chat session and return the session ID."""
         session_data = {
@@ -19,44 +362,108 @@ class FirestoreChatManager:
             "message_count": 0
         }
         doc_ref = self.collection.add(session_data)[1]
+        # A new session has no history, so it can be served from the cache right away
+        self.history_cache.put(doc_ref.id, [], complete=True)
         return doc_ref.id
     
-    def add_message(self, session_id: str, role: str, content: str, sources: List[Dict] = None):
-        """Add a message to a chat session."""
+    @REGISTRY.timer("firestore_operation_seconds", operation="add_message")
+    def add_message(self, session_id: str, role: str, content: str, sources: List[Dict] = None,
+                    timestamp: Optional[datetime] = None):
+        """
+        Add a message to a chat session.
+        With write-behind enabled this only queues the write; otherwise the
+        message and the session metadata update are committed in one batch.
+        The timestamp defaults to now; callers that page history by timestamp
+        can pass the one they keep locally.
+        """
+        message_id = uuid.uuid4().hex
         message_data = {
             "role": role,
             "content": content,
-            "timestamp": datetime.utcnow(),
+            "timestamp": timestamp or datetime.utcnow(),
             "sources": sources or []
         }
-        
-        # Add message to subcollection
-        self.collection.document(session_id).collection("messages").add(message_data)
-        
-        # Update session metadata
+
+        self.history_cache.append(session_id, dict(message_data, id=message_id))
+        if self.writer is not None:
+            self.writer.add(session_id, message_id, message_data)
+            return message_id
+
         session_ref = self.collection.document(session_id)
-        session_ref.update({
-            "updated_at": datetime.utcnow(),
+        batch = self.db.batch()
+        batch.set(session_ref.collection("messages").document(message_id), message_data)
+        batch.update(session_ref, {
+            "updated_at": message_data["timestamp"],
             "message_count": firestore.Increment(1)
         })
-    
-    def get_chat_history(self, session_id: str) -> List[Dict[str, Any]]:
-        """Get all messages from a chat session."""
-        messages = []
+        batch.commit()
+        return message_id
+
+    def flush(self, timeout=None):
+        """Waits for queued messages to be written. Returns False on timeout."""
+        if self.writer is None:
+            return True
+        return self.writer.flush(timeout)
+
+    @REGISTRY.timer("firestore_operation_seconds", operation="get_chat_history")
+    def get_chat_history(self, session_id: str, limit: Optional[int] = None,
+                         before: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Get messages from a chat session, oldest first.
+        With `limit`, only the latest `limit` messages are read. To page further
+        back, pass the timestamp of the oldest message returned as `before`.
+        Recent history is served from a local cache when possible.
+        """
+        if before is None:
+            cached = self.history_cache.get(session_id, limit)
+            if cached is not None:
+                REGISTRY.increment("chat_history_cache_total", result="hit")
+                return cached
+            REGISTRY.increment("chat_history_cache_total", result="miss")
+
         messages_ref = self.collection.document(session_id).collection("messages")
-        
-        for doc in messages_ref.order_by("timestamp").stream():
+        if limit is None and before is None:
+            query = messages_ref.order_by("timestamp")
+        else:
+            query = messages_ref.order_by("timestamp", direction=firestore.Query.DESCENDING)
+            if before is not None:
+                query = query.start_after({"timestamp": before})
+            if limit is not None:
+                query = query.limit(limit)
+
+        messages = []
+        for doc in query.stream():
             message_data = doc.to_dict()
             message_data["id"] = doc.id
             messages.append(message_data)
-        
+        if limit is not None or before is not None:
+            messages.reverse()
+
+        if before is None:
+            complete = limit is None or len(messages) < limit
+            self.history_cache.put(session_id, messages, complete)
         return messages
     
-    def get_user_sessions(self, user_id: str) -> List[Dict[str, Any]]:
-        """Get all chat sessions for a user."""
+    @REGISTRY.timer("firestore_operation_seconds", operation="get_user_sessions")
+    def get_user_sessions(self, user_id: str, limit: Optional[int] = None,
+                          updated_before: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Get chat session summaries for a user, most recently updated first.
+        Only the summary fields are read (not whole documents). With `limit`,
+        pass the `updated_at` of the last session returned as `updated_before`
+        to fetch the next page.
+        """
+        query = (
+            self.collection.where("user_id", "==", user_id)
+            .order_by("updated_at", direction=firestore.Query.DESCENDING)
+            .select(SESSION_SUMMARY_FIELDS)
+        )
+        if updated_before is not None:
+            query = query.start_after({"updated_at": updated_before})
+        if limit is not None:
+            query = query.limit(limit)
+
         sessions = []
-        query = self.collection.where("user_id", "==", user_id).order_by("updated_at", direction=firestore.Query.DESCENDING)
-        
         for doc in query.stream():
             session_data = doc.to_dict()
             session_data["id"] = doc.id
@@ -64,19 +471,100 @@ class FirestoreChatManager:
         
         return sessions
     
-    def delete_session(self, session_id: str):
-        """Delete a chat session and all its messages."""
-        # Delete all messages in the session
-        messages_ref = self.collection.document(session_id).collection("messages")
-        for doc in messages_ref.stream():
-            doc.reference.delete()
-        
-        # Delete the session document
-        self.collection.document(session_id).delete()
+    @REGISTRY.timer("firestore_operation_seconds", operation="delete_session")
+    def delete_session(self, session_id: str) -> int:
+        """
+        Delete a chat session and all its messages.
+        Messages are listed by reference only (no document reads) and deleted
+        in batched writes of up to FIRESTORE_BATCH_LIMIT. Returns the number of
+        documents deleted, including the session itself.
+        """
+        session_ref = self.collection.document(session_id)
+        deleted = 0
+        batch = self.db.batch()
+        pending = 0
+        for message_ref in session_ref.collection("messages").list_documents(page_size=FIRESTORE_BATCH_LIMIT):
+            batch.delete(message_ref)
+            pending += 1
+            if pending == FIRESTORE_BATCH_LIMIT:
+                batch.commit()
+                deleted += pending
+                batch = self.db.batch()
+                pending = 0
+
+        # Delete the session document with the last batch of messages
+        batch.delete(session_ref)
+        batch.commit()
+        deleted += pending + 1
+        self.history_cache.discard(session_id)
+        return deleted
+
+    def delete_sessions(self, session_ids: List[str], max_workers: int = CLEANUP_WORKERS) -> int:
+        """Delete several sessions in parallel. Returns the number of documents deleted."""
+        if not session_ids:
+            return 0
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return sum(pool.map(self.delete_session, session_ids))
+
+    def purge_sessions_older_than(self, days: float, max_workers: int = CLEANUP_WORKERS,
+                                  page_size: int = 100) -> Dict[str, Any]:
+        """
+        Delete every session not updated in the last `days` days.
+        Sessions are found a page at a time (IDs only) and each page is deleted
+        in parallel. Returns counts and throughput for reporting.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        query = (
+            self.collection.where("updated_at", "<", cutoff)
+            .order_by("updated_at")
+            .select(["updated_at"])
+            .limit(page_size)
+        )
+
+        started = time.perf_counter()
+        sessions = 0
+        documents = 0
+        last = None
+        while True:
+            page = list((query.start_after(last) if last is not None else query).stream())
+            if not page:
+                break
+            documents += self.delete_sessions([doc.id for doc in page], max_workers)
+            sessions += len(page)
+            last = page[-1]
+            elapsed = time.perf_counter() - started
+            log_event("chat_retention_progress", sessions=sessions, documents=documents,
+                      documents_per_sec=round(documents / elapsed, 1) if elapsed else 0.0)
+            if len(page) < page_size:
+                break
+
+        elapsed = time.perf_counter() - started
+        REGISTRY.increment("firestore_documents_purged_total", documents)
+        return {
+            "cutoff": cutoff.isoformat(),
+            "sessions_deleted": sessions,
+            "documents_deleted": documents,
+            "seconds": elapsed,
+            "documents_per_sec": documents / elapsed if elapsed else 0.0,
+        }
     
+    @REGISTRY.timer("firestore_operation_seconds", operation="update_session_metadata")
     def update_session_metadata(self, session_id: str, metadata: Dict[str, Any]):
         """Update session metadata."""
         self.collection.document(session_id).update({
             **metadata,
             "updated_at": datetime.utcnow()
-        }) 
\ No newline at end of file
+        })
+
+def get_chat_manager():
+    """
+    Returns the process-wide FirestoreChatManager, creating it on first use.
+    Sharing one manager means one Firestore client and one write-behind queue
+    (and spool file) per process rather than per session.
+    """
+    global _shared_manager
+    if _shared_manager is None:
+        with _shared_lock:
+            if _shared_manager is None:
+                _shared_manager = FirestoreChatManager()
+    return _shared_manager
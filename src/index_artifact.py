@@ -0,0 +1,329 @@
+"""
+Portable, read-only index artifact.
+
+An artifact is a directory holding everything retrieval needs, in formats that
+can be memory-mapped at startup instead of opening a database:
+
+    manifest.json      format version, embedding model, dtype, counts, content hash
+    embeddings.npy     L2-normalized chunk embeddings (float16, int8 or float32)
+    scales.npy         per-row dequantization scales (int8 only)
+    texts.bin          UTF-8 chunk texts, concatenated
+    text_offsets.npy   byte offset of each chunk text in texts.bin (count + 1 entries)
+    records.json       chunk IDs and metadata, grouped by collection
+    collections.json   collection summaries for routing (see routing.py), when the database has them
+    lexical/           BM25 index (see lexical_index.py), when the database has one
+
+Usage:
+    python src/index_artifact.py export [--dtype float16] [--output index_artifact]
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+from index_manifest import index_version, load_manifest
+from index_versions import current_index_dir
+from lexical_index import lexical_index_path
+from routing import collection_names, collection_ranges, collections_path, partition_rows
+
+# --- Configuration ---
+INDEX_ARTIFACT_PATH = os.getenv("INDEX_ARTIFACT_PATH", "index_artifact")
+INDEX_ARTIFACT_DTYPE = os.getenv("INDEX_ARTIFACT_DTYPE", "float16")
+# Optional gs:// location the app downloads the artifact from, once per instance
+INDEX_ARTIFACT_GCS_PATH = os.getenv("INDEX_ARTIFACT_GCS_PATH", "")
+ARTIFACT_FORMAT_VERSION = 1
+ARTIFACT_MANIFEST = "manifest.json"
+ARTIFACT_FILES = ("embeddings.npy", "scales.npy", "texts.bin", "text_offsets.npy", "records.json")
+EXPORT_PAGE_SIZE = 1000
+SEARCH_BLOCK_ROWS = 4096  # Rows dequantized at a time during search
+
+def previous_artifact_dir(artifact_dir):
+    return artifact_dir.rstrip("/\\") + ".previous"
+
+def resolve_artifact_dir(artifact_dir):
+    """
+    Returns the directory holding the artifact: artifact_dir, or the previous
+    artifact set aside by replace_artifact_dir if a swap is under way or was
+    interrupted.
+    """
+    if os.path.isdir(artifact_dir):
+        return artifact_dir
+    previous = previous_artifact_dir(artifact_dir)
+    return previous if os.path.exists(os.path.join(previous, ARTIFACT_MANIFEST)) else artifact_dir
+
+def replace_artifact_dir(new_dir, artifact_dir):
+    """
+    Moves a complete artifact from new_dir to artifact_dir. The old artifact is
+    renamed aside first and deleted only once the new one is in place, so
+    there is always a complete artifact to read (see resolve_artifact_dir),
+    even if the process dies mid-swap.
+    """
+    previous = previous_artifact_dir(artifact_dir)
+    if os.path.isdir(artifact_dir):
+        shutil.rmtree(previous, ignore_errors=True)
+        os.replace(artifact_dir, previous)
+    os.replace(new_dir, artifact_dir)
+    shutil.rmtree(previous, ignore_errors=True)
+
+def load_artifact_manifest(artifact_dir):
+    """Returns the artifact's manifest, or None if there is no artifact at artifact_dir."""
+    path = os.path.join(resolve_artifact_dir(artifact_dir), ARTIFACT_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def read_collection(db_path):
+    """
+    Reads every chunk of a Chroma vector database, in pages, one collection
+    after another so each collection's rows are contiguous.
+    Returns (ids, embeddings, texts, metadatas); embeddings is a float32
+    matrix with L2-normalized rows, and every metadata names its collection.
+    """
+    import chromadb
+
+    client = chromadb.PersistentClient(path=db_path)
+    ids, vectors, texts, metadatas = [], [], [], []
+    for name in collection_names(db_path):
+        collection = client.get_or_create_collection(name)
+        for offset in range(0, collection.count(), EXPORT_PAGE_SIZE):
+            page = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=EXPORT_PAGE_SIZE,
+                offset=offset,
+            )
+            ids.extend(page["ids"])
+            vectors.extend(page["embeddings"])
+            texts.extend(page["documents"])
+            metadatas.extend({**(metadata or {}), "collection": name} for metadata in page["metadatas"])
+    if not ids:
+        raise ValueError(f"The vector database at '{db_path}' is empty; run ingest.py first.")
+
+    embeddings = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings /= np.where(norms == 0, 1, norms)
+    return ids, embeddings, texts, metadatas
+
+def export_index_artifact(db_path, artifact_dir, dtype=INDEX_ARTIFACT_DTYPE):
+    """
+    Exports a Chroma vector database to an index artifact at artifact_dir.
+    The artifact is written to a temporary directory and moved into place, so
+    readers never see a half-written artifact. Returns the artifact manifest.
+    """
+    if dtype not in ("float32", "float16", "int8"):
+        raise ValueError(f"Unsupported artifact dtype '{dtype}'; use float32, float16 or int8.")
+
+    ids, embeddings, texts, metadatas = read_collection(db_path)
+
+    tmp_dir = artifact_dir.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    if dtype == "int8":
+        scales = np.abs(embeddings).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(embeddings / scales[:, None]).astype(np.int8)
+        np.save(os.path.join(tmp_dir, "embeddings.npy"), quantized)
+        np.save(os.path.join(tmp_dir, "scales.npy"), scales.astype(np.float32))
+    else:
+        np.save(os.path.join(tmp_dir, "embeddings.npy"), embeddings.astype(dtype))
+
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(data) for data in encoded])
+    with open(os.path.join(tmp_dir, "texts.bin"), "wb") as f:
+        for data in encoded:
+            f.write(data)
+    np.save(os.path.join(tmp_dir, "text_offsets.npy"), offsets)
+    with open(os.path.join(tmp_dir, "records.json"), "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "metadatas": metadatas}, f)
+
+    lexical_dir = lexical_index_path(db_path)
+    if os.path.isdir(lexical_dir):
+        shutil.copytree(lexical_dir, lexical_index_path(tmp_dir))
+    if os.path.exists(collections_path(db_path)):
+        shutil.copyfile(collections_path(db_path), collections_path(tmp_dir))
+
+    ingest_manifest = load_manifest(db_path) or {}
+    settings = ingest_manifest.get("settings", {})
+    hasher = hashlib.sha256()
+    for name in ARTIFACT_FILES:
+        path = os.path.join(tmp_dir, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    hasher.update(block)
+    manifest = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "embedding_model": settings.get("embedding_model"),
+        "embedding_backend": settings.get("embedding_backend", "torch"),
+        "ingest_settings": settings,
+        "source_version": index_version(db_path),
+        "version": hasher.hexdigest()[:16],
+        "dtype": dtype,
+        "count": len(ids),
+        "dimension": int(embeddings.shape[1]),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    with open(os.path.join(tmp_dir, ARTIFACT_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    replace_artifact_dir(tmp_dir, artifact_dir)
+    return manifest
+
+def fetch_index_artifact(gcs_path, artifact_dir):
+    """
+    Downloads the artifact under a gs://bucket/prefix location to artifact_dir,
+    skipping the download when the local copy already has the remote version.
+    Returns True if files were downloaded.
+    """
+    storage_manager, prefix = _storage_location(gcs_path)
+    remote_manifest = json.loads(storage_manager.bucket.blob(f"{prefix}/{ARTIFACT_MANIFEST}").download_as_bytes())
+    local_manifest = load_artifact_manifest(artifact_dir)
+    if local_manifest and local_manifest.get("version") == remote_manifest.get("version"):
+        return False
+
+    tmp_dir = artifact_dir.rstrip("/\\") + ".download"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    # Files unchanged since a previous download (e.g. the lexical index) come from the local cache
+    storage_manager.download_prefix(prefix, tmp_dir)
+    replace_artifact_dir(tmp_dir, artifact_dir)
+    return True
+
+def upload_index_artifact(artifact_dir, gcs_path):
+    """Uploads an artifact directory to a gs://bucket/prefix location, manifest last."""
+    storage_manager, prefix = _storage_location(gcs_path)
+    for root, _, files in os.walk(artifact_dir):
+        for name in sorted(files):
+            if root == artifact_dir and name == ARTIFACT_MANIFEST:
+                continue
+            local_path = os.path.join(root, name)
+            relative = os.path.relpath(local_path, artifact_dir).replace(os.sep, "/")
+            storage_manager.upload_file(local_path, f"{prefix}/{relative}")
+    # Readers key on the manifest, so it goes up once every other file is in place
+    storage_manager.upload_file(os.path.join(artifact_dir, ARTIFACT_MANIFEST), f"{prefix}/{ARTIFACT_MANIFEST}")
+
+def remote_artifact_generation(gcs_path):
+    """
+    Returns the Cloud Storage generation of the artifact manifest at a
+    gs://bucket/prefix location, or None if there is none. One metadata
+    request; the manifest is uploaded last, so a new generation means a
+    complete new artifact.
+    """
+    storage_manager, prefix = _storage_location(gcs_path)
+    blob = storage_manager.bucket.get_blob(f"{prefix}/{ARTIFACT_MANIFEST}")
+    return str(blob.generation) if blob is not None else None
+
+def _storage_location(gcs_path):
+    """Splits a gs://bucket/prefix location into a (shared) storage manager and the prefix."""
+    bucket_name, _, prefix = gcs_path[len("gs://"):].partition("/")
+    return _storage_manager(bucket_name), prefix.rstrip("/")
+
+@functools.lru_cache(maxsize=None)
+def _storage_manager(bucket_name):
+    from cloud_storage import CloudStorageManager
+
+    return CloudStorageManager(bucket_name=bucket_name)
+
+class IndexArtifact:
+    """
+    Read-only vector store over a memory-mapped index artifact.
+    Implements the subset of the LangChain Chroma interface the chatbot uses
+    (similarity_search_by_vector and get), so it can stand in for Chroma.
+    """
+
+    def __init__(self, artifact_dir):
+        self.artifact_dir = artifact_dir = resolve_artifact_dir(artifact_dir)
+        self.manifest = load_artifact_manifest(artifact_dir)
+        if self.manifest is None:
+            raise FileNotFoundError(f"No index artifact found at '{artifact_dir}'.")
+        if self.manifest.get("format_version") != ARTIFACT_FORMAT_VERSION:
+            raise ValueError(
+                f"Index artifact format {self.manifest.get('format_version')} is not supported "
+                f"(expected {ARTIFACT_FORMAT_VERSION}); re-export it with this version."
+            )
+
+        self.embeddings = np.load(os.path.join(artifact_dir, "embeddings.npy"), mmap_mode="r")
+        scales_path = os.path.join(artifact_dir, "scales.npy")
+        self.scales = np.load(scales_path, mmap_mode="r") if os.path.exists(scales_path) else None
+        self.text_offsets = np.load(os.path.join(artifact_dir, "text_offsets.npy"), mmap_mode="r")
+        self.texts = np.memmap(os.path.join(artifact_dir, "texts.bin"), dtype=np.uint8, mode="r") \
+            if self.text_offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+        with open(os.path.join(artifact_dir, "records.json"), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        self.ids = records["ids"]
+        self.metadatas = records["metadatas"]
+        self._positions = {cid: i for i, cid in enumerate(self.ids)}
+        # Row range of each collection, so a routed search only scores its rows
+        self.partitions = partition_rows(self.metadatas)
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    def document(self, position):
+        """Returns the chunk at a row position as a Document."""
+        start, end = int(self.text_offsets[position]), int(self.text_offsets[position + 1])
+        text = bytes(self.texts[start:end]).decode("utf-8")
+        return Document(page_content=text, metadata=dict(self.metadatas[position]))
+
+    def scores(self, embedding, start=0, end=None):
+        """Returns the cosine similarity of the chunks in rows [start, end) to a query embedding."""
+        end = len(self.ids) if end is None else end
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = np.empty(end - start, dtype=np.float32)
+        for block_start in range(start, end, SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.embeddings[block_start:min(block_start + SEARCH_BLOCK_ROWS, end)], dtype=np.float32)
+            scores[block_start - start:block_start - start + len(block)] = block @ query
+        if self.scales is not None:
+            scores *= self.scales[start:end]
+        return scores
+
+    def similarity_search_by_vector(self, embedding, k=4, collections=None, **kwargs):
+        """Returns the k chunks most similar to a query embedding, optionally only from some collections."""
+        ranges = collection_ranges(self.partitions, collections, len(self.ids))
+        if not ranges:
+            return []
+        scores = np.concatenate([self.scores(embedding, start, end) for start, end in ranges])
+        positions = np.concatenate([np.arange(start, end) for start, end in ranges])
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.document(int(positions[i])) for i in top]
+
+    def get(self, ids=None, include=None, **kwargs):
+        """Returns chunks by ID in the same shape as Chroma's get()."""
+        positions = [self._positions[cid] for cid in (ids if ids is not None else self.ids) if cid in self._positions]
+        documents = [self.document(i) for i in positions]
+        return {
+            "ids": [self.ids[i] for i in positions],
+            "documents": [doc.page_content for doc in documents],
+            "metadatas": [doc.metadata for doc in documents],
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a portable index artifact from the vector database.")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--db-path", default="chroma_db", help="Index root; its live version is exported.")
+    parser.add_argument("--output", default=INDEX_ARTIFACT_PATH)
+    parser.add_argument("--dtype", default=INDEX_ARTIFACT_DTYPE, choices=["float32", "float16", "int8"])
+    parser.add_argument("--upload", default=INDEX_ARTIFACT_GCS_PATH,
+                        help="gs://bucket/prefix to upload the artifact to after exporting.")
+    args = parser.parse_args()
+
+    manifest = export_index_artifact(current_index_dir(args.db_path), args.output, args.dtype)
+    print(f"Exported {manifest['count']} chunks ({manifest['dtype']}) to '{args.output}', "
+          f"version {manifest['version']}")
+    if args.upload:
+        upload_index_artifact(args.output, args.upload)
+        print(f"Uploaded artifact to {args.upload}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = "ingest_manifest.json"
+
+def manifest_path(db_path):
+    """Returns the path of the ingestion manifest stored alongside a vector database."""
+    return os.path.join(db_path, MANIFEST_NAME)
+
+def load_manifest(db_path):
+    """Loads the ingestion manifest for a vector database, or None if there isn't one."""
+    path = manifest_path(db_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(db_path, manifest):
+    """
+    Writes the ingestion manifest atomically, so a crash mid-write never leaves
+    a truncated manifest next to the database.
+    """
+    os.makedirs(db_path, exist_ok=True)
+    path = manifest_path(db_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def compute_version(chunk_ids, settings):
+    """Returns a content hash identifying a set of chunks built with the given settings."""
+    hasher = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    for chunk_id in sorted(chunk_ids):
+        hasher.update(chunk_id.encode("utf-8"))
+    return hasher.hexdigest()[:16]
+
+def index_version(db_path):
+    """
+    Returns a string identifying the current build of the vector database.
+    Uses the content hash from the ingestion manifest when present, falling
+    back to the SQLite file's modification time for databases built before
+    manifests existed.
+    """
+    manifest = load_manifest(db_path)
+    if manifest and manifest.get("version"):
+        return manifest["version"]
+    sqlite_path = os.path.join(db_path, "chroma.sqlite3")
+    if not os.path.exists(sqlite_path):
+        return "missing"
+    stat = os.stat(sqlite_path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
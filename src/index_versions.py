@@ -0,0 +1,145 @@
+"""
+Versioned index directories with an atomically published CURRENT pointer.
+
+Each ingest builds into a staging directory under the index root, validates
+it, and publishes it as versions/<version>; publishing is a single atomic
+rename of the CURRENT file, so readers always see either the old or the new
+build, never a partial one:
+
+    chroma_db/
+        CURRENT                 name of the live version
+        versions/<version>/     Chroma database, ingest manifest, lexical index
+        versions/.staging-*     builds in progress
+
+Roots created before versioning (the database directly in chroma_db) are read
+as-is until the next ingest publishes a version.
+"""
+import os
+import shutil
+import time
+
+from index_manifest import load_manifest
+from lexical_index import LexicalIndex, lexical_index_path
+from routing import collection_names
+
+# --- Configuration ---
+CURRENT_POINTER = "CURRENT"
+VERSIONS_DIR = "versions"
+STAGING_PREFIX = ".staging-"
+# Published versions kept on disk, the live one included. Instances that have not
+# swapped yet keep reading the previous ones, so keep at least 2.
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))
+SELF_MATCH_MAX_DISTANCE = 1e-3
+
+class IndexValidationError(Exception):
+    """A staged index failed validation and was not published."""
+
+def current_version_name(root):
+    """Returns the name of the published version, or None for an unversioned root."""
+    try:
+        with open(os.path.join(root, CURRENT_POINTER), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def current_index_dir(root):
+    """Returns the directory of the live index under root (root itself if unversioned)."""
+    name = current_version_name(root)
+    if name is None:
+        return root
+    return os.path.join(root, VERSIONS_DIR, name)
+
+def stage_index_dir(root):
+    """
+    Creates a staging directory seeded with a copy of the live index, so an
+    ingest can update it incrementally without touching what readers use.
+    Returns the staging path.
+    """
+    versions = os.path.join(root, VERSIONS_DIR)
+    os.makedirs(versions, exist_ok=True)
+    staging = os.path.join(versions, f"{STAGING_PREFIX}{os.getpid()}-{int(time.time())}")
+    shutil.rmtree(staging, ignore_errors=True)
+
+    live = current_index_dir(root)
+    if os.path.isdir(live) and os.listdir(live):
+        # An unversioned root holds the database itself, next to the versions we add
+        ignore = shutil.ignore_patterns(VERSIONS_DIR, CURRENT_POINTER, CURRENT_POINTER + ".tmp") \
+            if live == root else None
+        shutil.copytree(live, staging, ignore=ignore)
+    else:
+        os.makedirs(staging)
+    return staging
+
+def discard_staged_index(staging):
+    shutil.rmtree(staging, ignore_errors=True)
+
+def validate_index(index_dir):
+    """
+    Checks a built index before it is published: the manifest is present, the
+    collections hold exactly the chunks it lists, a stored embedding finds
+    itself in each collection, and the lexical index covers the same chunks.
+    Raises IndexValidationError describing the first problem found.
+    """
+    import chromadb
+
+    manifest = load_manifest(index_dir)
+    if not manifest or not manifest.get("version"):
+        raise IndexValidationError(f"No ingest manifest in '{index_dir}'.")
+    expected = set(manifest.get("chunks", {}))
+
+    client = chromadb.PersistentClient(path=index_dir)
+    count = 0
+    for name in collection_names(index_dir):
+        collection = client.get_or_create_collection(name)
+        count += collection.count()
+        if not collection.count():
+            continue
+        sample = collection.get(include=["embeddings"], limit=1)
+        if sample["ids"][0] not in expected:
+            raise IndexValidationError(f"Chunk '{sample['ids'][0]}' in collection '{name}' is not in the manifest.")
+        found = collection.query(query_embeddings=[list(sample["embeddings"][0])], n_results=1,
+                                 include=["distances"])
+        # Compared by distance, since identical texts on different pages share an embedding
+        if not found["distances"][0] or found["distances"][0][0] > SELF_MATCH_MAX_DISTANCE:
+            raise IndexValidationError(f"A stored embedding did not retrieve its own chunk in collection '{name}'.")
+    if count != len(expected):
+        raise IndexValidationError(f"Collections hold {count} chunks; the manifest lists {len(expected)}.")
+
+    lexical = LexicalIndex.load(lexical_index_path(index_dir))
+    if lexical is None or set(lexical.chunk_ids) != expected:
+        raise IndexValidationError("The lexical index is missing or out of date.")
+    return manifest
+
+def publish_index(root, staging, version):
+    """
+    Moves a validated staging directory to versions/<version> and points
+    CURRENT at it atomically. Returns the published directory.
+    """
+    target = os.path.join(root, VERSIONS_DIR, version)
+    if os.path.isdir(target):
+        # The same content was published before; its directory is reused as-is
+        discard_staged_index(staging)
+    else:
+        os.replace(staging, target)
+
+    tmp_path = os.path.join(root, CURRENT_POINTER + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_POINTER))
+    prune_versions(root)
+    return target
+
+def prune_versions(root, keep=INDEX_KEEP_VERSIONS):
+    """Deletes the oldest published versions beyond `keep`, never the live one."""
+    versions = os.path.join(root, VERSIONS_DIR)
+    live = current_version_name(root)
+    published = [
+        name for name in os.listdir(versions)
+        if not name.startswith(STAGING_PREFIX) and os.path.isdir(os.path.join(versions, name))
+    ]
+    published.sort(key=lambda name: os.path.getmtime(os.path.join(versions, name)), reverse=True)
+    older = [name for name in published if name != live]
+    for name in older[max(keep - 1, 0):]:
+        shutil.rmtree(os.path.join(versions, name), ignore_errors=True)
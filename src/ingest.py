@@ -1,112 +1,485 @@
 import os
+import glob
+import hashlib
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dotenv import load_dotenv
 import fitz  # PyMuPDF
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
+import chromadb
+import numpy as np
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from cloud_storage import CloudStorageManager
-import tempfile
+from index_manifest import load_manifest, save_manifest, compute_version
+from routing import DEFAULT_COLLECTION, check_collection_names, collection_names, save_collections
+from index_versions import (
+    IndexValidationError,
+    current_index_dir,
+    current_version_name,
+    discard_staged_index,
+    publish_index,
+    stage_index_dir,
+    validate_index,
+)
+from embedding_backends import EMBEDDING_BACKEND, create_embeddings as create_backend_embeddings
+from lexical_index import build_lexical_index, lexical_index_path
+from index_artifact import (
+    INDEX_ARTIFACT_GCS_PATH,
+    INDEX_ARTIFACT_PATH,
+    export_index_artifact,
+    upload_index_artifact,
+)
 
 # Load environment variables from .env file
 load_dotenv()
 
 # --- Configuration ---
-DATA_PATH = "data/MANE_GRADUATE_HANDBOOK.pdf"
-DB_PATH = "chroma_db"
-EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL")
+DATA_DIR = os.getenv("DATA_DIR", "data")
+DB_PATH = "chroma_db"  # Index root; each build is published under DB_PATH/versions (see index_versions.py)
+# PDFs in a subdirectory of DATA_DIR (or CLOUD_DOCUMENT_PREFIX) go to the collection
+# named after it, which must be a valid Chroma collection name; top-level PDFs go to
+# DEFAULT_COLLECTION (see routing.py)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 
+# Pipeline tuning
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+CHROMA_BATCH_SIZE = int(os.getenv("CHROMA_BATCH_SIZE", "1000"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))  # 0 keeps torch's default
+
 # Cloud storage configuration
 USE_CLOUD_STORAGE = os.getenv("USE_CLOUD_STORAGE", "false").lower() == "true"
 CLOUD_DOCUMENT_PATH = os.getenv("CLOUD_DOCUMENT_PATH", "documents/MANE_GRADUATE_HANDBOOK.pdf")
+# When set, every PDF under this folder is ingested instead of CLOUD_DOCUMENT_PATH.
+# Normalized to end in "/", so "documents" doesn't also match "documents_old/..."
+CLOUD_DOCUMENT_PREFIX = os.getenv("CLOUD_DOCUMENT_PREFIX", "").rstrip("/")
+CLOUD_DOCUMENT_PREFIX = CLOUD_DOCUMENT_PREFIX + "/" if CLOUD_DOCUMENT_PREFIX else ""
 
-def load_documents():
-    """Loads text from the specified PDF file (local or cloud)."""
-    if USE_CLOUD_STORAGE:
-        return load_documents_from_cloud()
-    else:
-        return load_documents_from_local()
+# Also export a memory-mappable index artifact (see index_artifact.py) after ingesting
+EXPORT_INDEX_ARTIFACT = os.getenv("EXPORT_INDEX_ARTIFACT", "false").lower() == "true"
+
+# Year or academic year in a file name, e.g. "handbook_2024-2025.pdf"
+EDITION_PATTERN = re.compile(r"(?:19|20)\d{2}(?:\s*[-_]\s*(?:19|20)?\d{2})?")
+CENTROID_PAGE_SIZE = 1000
+HEADING_SIZE_RATIO = 1.15  # Font size relative to body text that marks a heading
+MAX_HEADING_LENGTH = 120
 
-def load_documents_from_local():
-    """Loads text from local PDF file."""
-    if not os.path.exists(DATA_PATH):
-        print(f"Error: The file '{DATA_PATH}' was not found.")
-        print("Please place the MANE Graduate Student Handbook PDF in the 'data' directory.")
+def page_heading(page):
+    """
+    Returns the first heading-sized line on a PDF page, or None.
+    A line counts as a heading when its font is noticeably larger than the
+    most common (body text) font size on the page.
+    """
+    lines = []
+    size_counts = {}
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            spans = [span for span in line["spans"] if span["text"].strip()]
+            if not spans:
+                continue
+            size = max(span["size"] for span in spans)
+            text = "".join(span["text"] for span in spans).strip()
+            lines.append((size, text))
+            size_counts[round(size)] = size_counts.get(round(size), 0) + len(text)
+
+    if not lines:
         return None
-    
-    doc = fitz.open(DATA_PATH)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    doc.close()
-    return [{"page_content": text, "metadata": {"source": DATA_PATH}}]
+    body_size = max(size_counts, key=size_counts.get)
+    for size, text in lines:
+        if size >= body_size * HEADING_SIZE_RATIO:
+            return text[:MAX_HEADING_LENGTH]
+    return None
+
+def iter_pdf_pages(doc, source, metadata=None):
+    """
+    Yields a Document for each non-empty page of an open PDF.
+    Metadata carries the source, the 1-based page number and the most recent
+    heading seen on or before the page, plus the document's own metadata
+    (collection, document and edition; see document_metadata).
+    """
+    heading = ""
+    for page_number, page in enumerate(doc, start=1):
+        text = page.get_text()
+        if not text.strip():
+            continue
+        heading = page_heading(page) or heading
+        yield Document(
+            page_content=text,
+            metadata={**(metadata or {}), "source": source, "page": page_number, "heading": heading},
+        )
+
+def document_metadata(relative_path):
+    """
+    Returns the collection, document name and edition of a PDF from its path
+    relative to the data directory or prefix, e.g. "policies/grad_school_2024-2025.pdf"
+    -> collection "policies", document "grad_school_2024-2025", edition "2024-2025".
+    """
+    parts = relative_path.replace("\\", "/").split("/")
+    document = os.path.splitext(parts[-1])[0]
+    editions = EDITION_PATTERN.findall(document)
+    return {
+        "collection": parts[0] if len(parts) > 1 else DEFAULT_COLLECTION,
+        "document": document,
+        "edition": editions[-1].replace(" ", "").replace("_", "-") if editions else "",
+    }
+
+def local_pdf_paths():
+    """Returns the PDFs to ingest from the local data directory and its collection subdirectories."""
+    return sorted(
+        glob.glob(os.path.join(DATA_DIR, "*.pdf")) + glob.glob(os.path.join(DATA_DIR, "*", "*.pdf"))
+    )
 
 def load_documents_from_cloud():
-    """Loads text from cloud PDF file."""
+    """
+    Yields per-page documents from the cloud PDF file.
+    The PDF is parsed straight from memory; it is only downloaded when its
+    generation differs from the locally cached copy.
+    """
     try:
         storage_manager = CloudStorageManager()
-        
-        if not storage_manager.file_exists(CLOUD_DOCUMENT_PATH):
-            print(f"Error: The file '{CLOUD_DOCUMENT_PATH}' was not found in cloud storage.")
-            return None
-        
-        # Download to temporary file
-        temp_file_path = storage_manager.get_temp_file(CLOUD_DOCUMENT_PATH)
-        
-        doc = fitz.open(temp_file_path)
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        doc.close()
-        
-        # Clean up temporary file
-        os.unlink(temp_file_path)
-        
-        return [{"page_content": text, "metadata": {"source": f"gs://{storage_manager.bucket_name}/{CLOUD_DOCUMENT_PATH}"}}]
-    
+        data = storage_manager.read_bytes(CLOUD_DOCUMENT_PATH)
     except Exception as e:
         print(f"Error loading document from cloud storage: {e}")
-        return None
+        return
 
-def create_vector_database():
-    """Creates a ChromaDB vector database from the handbook."""
-    print("Loading handbook...")
-    documents = load_documents()
-    if not documents:
+    if data is None:
+        print(f"Error: The file '{CLOUD_DOCUMENT_PATH}' was not found in cloud storage.")
         return
 
-    print("Splitting document into chunks...")
+    source = f"gs://{storage_manager.bucket_name}/{CLOUD_DOCUMENT_PATH}"
+    metadata = document_metadata(os.path.basename(CLOUD_DOCUMENT_PATH))
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        yield from iter_pdf_pages(doc, source, metadata)
+
+def cloud_pdf_paths():
+    """
+    Returns {gs:// source: cached local path} for every PDF under
+    CLOUD_DOCUMENT_PREFIX, downloading only new or changed ones.
+    """
+    storage_manager = CloudStorageManager()
+    paths = storage_manager.fetch_many(CLOUD_DOCUMENT_PREFIX, suffix=".pdf")
+    return {f"gs://{storage_manager.bucket_name}/{name}": path for name, path in paths.items()}
+
+def chunk_id(chunk):
+    """Returns a content hash identifying a chunk by its text and metadata."""
+    hasher = hashlib.sha256()
+    for key in sorted(chunk.metadata):
+        if key != "chunk_id":
+            hasher.update(f"{key}={chunk.metadata[key]}\n".encode("utf-8"))
+    hasher.update(chunk.page_content.encode("utf-8"))
+    return hasher.hexdigest()
+
+def ingest_settings():
+    """Returns the settings that invalidate every stored chunk when they change."""
+    return {
+        "embedding_model": EMBEDDING_MODEL,
+        "embedding_backend": EMBEDDING_BACKEND,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "loader": "per-page",
+    }
+
+def split_pages(pages):
+    """Splits page documents into chunks as they arrive, tagging each with its chunk ID."""
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP
-    )
-    texts = text_splitter.create_documents(
-        [doc["page_content"] for doc in documents],
-        metadatas=[doc["metadata"] for doc in documents]
+        chunk_overlap=CHUNK_OVERLAP,
+        add_start_index=True,
     )
+    for page in pages:
+        for chunk in text_splitter.split_documents([page]):
+            chunk.metadata["chunk_id"] = chunk_id(chunk)
+            yield chunk
+
+def load_and_split_pdf(path, source=None, metadata=None):
+    """Parses and splits one local PDF. Runs in a worker process."""
+    with fitz.open(path) as doc:
+        return list(split_pages(iter_pdf_pages(doc, source or path, metadata)))
+
+def iter_chunks():
+    """
+    Yields the chunks of every document (local or cloud).
+    PDFs in the data directory or under CLOUD_DOCUMENT_PREFIX are parsed in
+    parallel, one per worker process.
+    """
+    if USE_CLOUD_STORAGE and not CLOUD_DOCUMENT_PREFIX:
+        yield from split_pages(load_documents_from_cloud())
+        return
+
+    if USE_CLOUD_STORAGE:
+        sources = cloud_pdf_paths()
+        if not sources:
+            print(f"Error: No PDF files were found under '{CLOUD_DOCUMENT_PREFIX}' in cloud storage.")
+            return
+        paths, sources = list(sources.values()), list(sources)
+        # Sources are gs://bucket/<object name>, and every name starts with the prefix
+        relative_paths = [source.split("/", 3)[3][len(CLOUD_DOCUMENT_PREFIX):] for source in sources]
+    else:
+        paths = local_pdf_paths()
+        if not paths:
+            print(f"Error: No PDF files were found in '{DATA_DIR}'.")
+            print("Please place the MANE Graduate Student Handbook PDF in the 'data' directory.")
+            return
+        sources = paths
+        relative_paths = [os.path.relpath(path, DATA_DIR) for path in paths]
+    metadatas = [document_metadata(path) for path in relative_paths]
+    check_collection_names({source: metadata["collection"] for source, metadata in zip(sources, metadatas)})
+
+    workers = min(INGEST_WORKERS, len(paths))
+    if workers <= 1:
+        for path, source, metadata in zip(paths, sources, metadatas):
+            yield from load_and_split_pdf(path, source, metadata)
+        return
 
-    print(f"Creating embeddings with '{EMBEDDING_MODEL}'. This may take a moment...")
-    # Use HuggingFaceEmbeddings for local, free embeddings
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    print(f"Parsing {len(paths)} PDFs with {workers} worker processes...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for file_chunks in pool.map(load_and_split_pdf, paths, sources, metadatas):
+            yield from file_chunks
 
-    print(f"Creating and persisting vector store at '{DB_PATH}'...")
-    # Create a new Chroma database from the documents
-    db = Chroma.from_documents(
-        texts,
-        embeddings,
-        persist_directory=DB_PATH
+def create_embeddings():
+    """
+    Creates the embedding model used for ingestion on EMBEDDING_BACKEND (see
+    embedding_backends.py), honouring EMBED_THREADS.
+    """
+    if EMBED_THREADS > 0:
+        import torch
+        torch.set_num_threads(EMBED_THREADS)
+    return create_backend_embeddings(
+        EMBEDDING_MODEL,
+        encode_kwargs={"batch_size": EMBED_BATCH_SIZE},
     )
-    
+
+def embed_and_store(collection, chunks, embeddings):
+    """
+    Embeds chunks in batches of EMBED_BATCH_SIZE and upserts them into the
+    collection in batches of CHROMA_BATCH_SIZE. Writes run on a background
+    thread so the next batch is embedded while the previous one is stored.
+    Returns the embedding throughput in chunks per second.
+    """
+    pending_ids, pending_vectors, pending_texts, pending_metadatas = [], [], [], []
+    writes = []
+    embed_seconds = 0.0
+
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        def flush():
+            writes.append(writer.submit(
+                collection.upsert,
+                ids=list(pending_ids),
+                embeddings=list(pending_vectors),
+                documents=list(pending_texts),
+                metadatas=list(pending_metadatas),
+            ))
+            for pending in (pending_ids, pending_vectors, pending_texts, pending_metadatas):
+                pending.clear()
+
+        for start in range(0, len(chunks), EMBED_BATCH_SIZE):
+            batch = chunks[start:start + EMBED_BATCH_SIZE]
+            started = time.perf_counter()
+            vectors = embeddings.embed_documents([chunk.page_content for chunk in batch])
+            embed_seconds += time.perf_counter() - started
+
+            for chunk, vector in zip(batch, vectors):
+                pending_ids.append(chunk.metadata["chunk_id"])
+                pending_vectors.append(vector)
+                pending_texts.append(chunk.page_content)
+                pending_metadatas.append(chunk.metadata)
+            if len(pending_ids) >= CHROMA_BATCH_SIZE:
+                flush()
+
+            done = start + len(batch)
+            print(f"  Embedded {done}/{len(chunks)} chunks ({done / embed_seconds:.1f} chunks/sec)")
+
+        if pending_ids:
+            flush()
+        for write in writes:
+            write.result()
+
+    return len(chunks) / embed_seconds if embed_seconds else 0.0
+
+def create_vector_database():
+    """
+    Builds a new version of the ChromaDB vector database from the handbook and
+    publishes it, leaving the live version untouched until the switch.
+
+    The build starts from a copy of the live version. Every chunk is stored
+    under the hash of its content, and a manifest next to the database records
+    the settings it was built with. Only chunks that are not already in the
+    database are embedded; chunks that disappeared from the handbook are
+    deleted. The result is validated, then published by atomically updating
+    the CURRENT pointer, which running chatbots pick up without restarting.
+    Re-running on an unchanged handbook embeds and publishes nothing.
+    Returns the directory of the live version.
+    """
+    print("Loading and splitting documents page by page...")
+    started = time.perf_counter()
+
+    # Key chunks by content hash; identical chunks collapse into one entry
+    chunks = {}
+    for chunk in iter_chunks():
+        chunks[chunk.metadata["chunk_id"]] = chunk
+
+    if not chunks:
+        print("No text was loaded from the handbook; leaving the vector database unchanged.")
+        return current_index_dir(DB_PATH)
+
+    settings = ingest_settings()
+    version = compute_version(chunks, settings)
+    if current_version_name(DB_PATH) == version:
+        print(f"No new or changed chunks; version {version} is already published.")
+        return current_index_dir(DB_PATH)
+
+    build_dir = stage_index_dir(DB_PATH)
+    try:
+        new_ids, stale_ids, throughput = build_index(build_dir, chunks, settings, version)
+        print("Validating the new index...")
+        validate_index(build_dir)
+    except IndexValidationError as e:
+        discard_staged_index(build_dir)
+        print(f"Error: the new index failed validation ({e}); the live version was left in place.")
+        raise
+    except BaseException:
+        discard_staged_index(build_dir)
+        raise
+    published_dir = publish_index(DB_PATH, build_dir, version)
+
     print("\n-----------------------------------------")
-    print("Vector database created successfully!")
-    print(f"Number of chunks: {len(texts)}")
-    print(f"Database location: {DB_PATH}")
+    print("Vector database updated successfully!")
+    collection_count = len({chunk.metadata["collection"] for chunk in chunks.values()})
+    print(f"Number of chunks: {len(chunks)} in {collection_count} collection(s) "
+          f"({len(new_ids)} added, {len(stale_ids)} removed)")
+    if new_ids:
+        print(f"Embedding throughput: {throughput:.1f} chunks/sec")
+    print(f"Total time: {time.perf_counter() - started:.1f}s")
+    print(f"Published version {version} at: {published_dir}")
     if USE_CLOUD_STORAGE:
-        print(f"Document source: Cloud Storage ({CLOUD_DOCUMENT_PATH})")
+        print(f"Document source: Cloud Storage ({CLOUD_DOCUMENT_PREFIX or CLOUD_DOCUMENT_PATH})")
     else:
-        print(f"Document source: Local ({DATA_PATH})")
+        print(f"Document source: Local ({DATA_DIR}/*.pdf)")
     print("-----------------------------------------")
+    return published_dir
+
+def build_index(build_dir, chunks, settings, version):
+    """
+    Brings the database in build_dir up to date with chunks, one Chroma
+    collection per named collection: deletes stale chunks (and collections
+    with no documents left), embeds new ones, and rewrites the collection
+    summaries, lexical index and manifest.
+    Returns (new_ids, stale_ids, embedding throughput).
+    """
+    manifest = load_manifest(build_dir)
+    rebuild = manifest is None or manifest.get("settings") != settings
+    client = chromadb.PersistentClient(path=build_dir)
+
+    by_collection = {}
+    for cid, chunk in chunks.items():
+        by_collection.setdefault(chunk.metadata["collection"], {})[cid] = chunk
+
+    new_ids, stale_ids = [], []
+    for name in sorted(set(collection_names(build_dir)) - by_collection.keys()):
+        # Every document of this collection was removed
+        collection = client.get_or_create_collection(name)
+        stale_ids.extend(collection.get(include=[])["ids"])
+        print(f"Deleting collection '{name}', which has no documents left...")
+        client.delete_collection(name)
+
+    collections = {}
+    embeddings = None
+    embedded, embed_seconds = 0, 0.0
+    for name, collection_chunks in sorted(by_collection.items()):
+        collection = client.get_or_create_collection(name)
+        existing_ids = set(collection.get(include=[])["ids"])
+
+        if rebuild:
+            # Built by an older ingest or with different settings: nothing can be reused
+            if existing_ids:
+                print(f"Ingestion settings changed (or no manifest found); rebuilding collection '{name}'.")
+            stale = existing_ids
+            new = list(collection_chunks)
+        else:
+            stale = existing_ids - collection_chunks.keys()
+            new = [cid for cid in collection_chunks if cid not in existing_ids]
+
+        if stale:
+            print(f"Deleting {len(stale)} chunks that are no longer in collection '{name}'...")
+            stale = list(stale)
+            for start in range(0, len(stale), CHROMA_BATCH_SIZE):
+                collection.delete(ids=stale[start:start + CHROMA_BATCH_SIZE])
+
+        if new:
+            print(f"Creating embeddings for {len(new)} new or changed chunks in collection '{name}' "
+                  f"with '{EMBEDDING_MODEL}' ({EMBEDDING_BACKEND} backend, batch size {EMBED_BATCH_SIZE})...")
+            if embeddings is None:
+                # Local, free embeddings from sentence-transformers
+                embeddings = create_embeddings()
+            throughput = embed_and_store(collection, [collection_chunks[cid] for cid in new], embeddings)
+            embedded += len(new)
+            embed_seconds += len(new) / throughput if throughput else 0.0
+
+        new_ids.extend(new)
+        stale_ids.extend(stale)
+        collections[name] = collection_summary(collection, collection_chunks.values())
+
+    if not new_ids:
+        print("No new or changed chunks to embed.")
+    save_collections(build_dir, collections)
+
+    # The lexical index is cheap to build, so it is always rebuilt from every chunk
+    print("Building lexical (BM25) index...")
+    build_lexical_index(
+        lexical_index_path(build_dir),
+        list(chunks),
+        [chunk.page_content for chunk in chunks.values()],
+        [chunk.metadata["collection"] for chunk in chunks.values()],
+    )
+
+    save_manifest(build_dir, {
+        "settings": settings,
+        "version": version,
+        "chunks": {cid: chunk.metadata.get("source", "") for cid, chunk in chunks.items()},
+    })
+    return new_ids, stale_ids, embedded / embed_seconds if embed_seconds else 0.0
+
+def collection_summary(collection, chunks):
+    """
+    Returns what routing needs to know about a collection: its chunk count,
+    documents with their editions, and the centroid of its (normalized) chunk
+    embeddings, read back in pages so reused chunks count too.
+    """
+    total = None
+    count = collection.count()
+    for offset in range(0, count, CENTROID_PAGE_SIZE):
+        vectors = np.asarray(
+            collection.get(include=["embeddings"], limit=CENTROID_PAGE_SIZE, offset=offset)["embeddings"],
+            dtype=np.float64,
+        )
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        page_sum = (vectors / np.where(norms == 0, 1, norms)).sum(axis=0)
+        total = page_sum if total is None else total + page_sum
+
+    documents = {}
+    for chunk in chunks:
+        editions = documents.setdefault(chunk.metadata["document"], set())
+        if chunk.metadata.get("edition"):
+            editions.add(chunk.metadata["edition"])
+    return {
+        "chunks": count,
+        "documents": {name: sorted(editions) for name, editions in sorted(documents.items())},
+        "centroid": (total / count).round(6).tolist() if count else [],
+    }
+
+def export_artifact():
+    """Exports the index artifact and, if configured, uploads it to Cloud Storage."""
+    print(f"Exporting index artifact to '{INDEX_ARTIFACT_PATH}'...")
+    manifest = export_index_artifact(current_index_dir(DB_PATH), INDEX_ARTIFACT_PATH)
+    print(f"Index artifact version {manifest['version']}: {manifest['count']} chunks ({manifest['dtype']})")
+    if INDEX_ARTIFACT_GCS_PATH:
+        upload_index_artifact(INDEX_ARTIFACT_PATH, INDEX_ARTIFACT_GCS_PATH)
+        print(f"Uploaded index artifact to {INDEX_ARTIFACT_GCS_PATH}")
 
 if __name__ == "__main__":
     create_vector_database()
+    if EXPORT_INDEX_ARTIFACT:
+        export_artifact()
@@ -0,0 +1,122 @@
+import json
+import math
+import os
+import re
+
+import numpy as np
+
+LEXICAL_INDEX_DIR = "lexical"
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it of on or that the "
+    "this to was what when where which who will with do does can my".split()
+)
+
+def tokenize(text):
+    """Splits text into lowercase alphanumeric terms, dropping common stopwords."""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+def lexical_index_path(db_path):
+    """Returns the directory holding the lexical index for a vector database."""
+    return os.path.join(db_path, LEXICAL_INDEX_DIR)
+
+def build_lexical_index(index_dir, chunk_ids, texts, collections=None):
+    """
+    Builds a BM25 inverted index over chunk texts and writes it to index_dir.
+    `collections` optionally names each chunk's collection, so searches can be
+    restricted to some of them.
+
+    Postings are stored as flat NumPy arrays (document numbers and term
+    frequencies, grouped by term) so they can be memory-mapped at startup; the
+    vocabulary maps each term to its slice of those arrays.
+    """
+    postings = {}
+    doc_lengths = np.zeros(len(texts), dtype=np.int32)
+    for doc_number, text in enumerate(texts):
+        terms = tokenize(text)
+        doc_lengths[doc_number] = len(terms)
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            postings.setdefault(term, []).append((doc_number, count))
+
+    vocabulary = {}
+    docs = []
+    frequencies = []
+    for term in sorted(postings):
+        entries = postings[term]
+        vocabulary[term] = [len(docs), len(entries)]
+        docs.extend(doc_number for doc_number, _ in entries)
+        frequencies.extend(min(count, np.iinfo(np.uint16).max) for _, count in entries)
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, "postings_docs.npy"), np.asarray(docs, dtype=np.int32))
+    np.save(os.path.join(index_dir, "postings_tf.npy"), np.asarray(frequencies, dtype=np.uint16))
+    np.save(os.path.join(index_dir, "doc_lengths.npy"), doc_lengths)
+    with open(os.path.join(index_dir, "vocabulary.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "chunk_ids": list(chunk_ids),
+            "collections": list(collections) if collections is not None else None,
+            "terms": vocabulary,
+        }, f)
+
+class LexicalIndex:
+    """A read-only BM25 index over the chunks of a vector database."""
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, "vocabulary.json"), "r", encoding="utf-8") as f:
+            vocabulary = json.load(f)
+        self.chunk_ids = vocabulary["chunk_ids"]
+        # Each chunk's collection as a small integer code, for cheap masking
+        collections = vocabulary.get("collections")
+        self.collection_codes = None
+        if collections is not None:
+            self.collection_names = sorted(set(collections))
+            codes = {name: code for code, name in enumerate(self.collection_names)}
+            self.collection_codes = np.asarray([codes[name] for name in collections], dtype=np.int32)
+        self.terms = vocabulary["terms"]
+        self.docs = np.load(os.path.join(index_dir, "postings_docs.npy"), mmap_mode="r")
+        self.frequencies = np.load(os.path.join(index_dir, "postings_tf.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(index_dir, "doc_lengths.npy"), mmap_mode="r")
+        self.average_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+
+    @classmethod
+    def load(cls, index_dir):
+        """Loads the index from index_dir, or returns None if it hasn't been built."""
+        if not os.path.exists(os.path.join(index_dir, "vocabulary.json")):
+            return None
+        return cls(index_dir)
+
+    def search(self, query, k, collections=None):
+        """
+        Returns up to k (chunk_id, score) pairs ranked by BM25 score, only from
+        the given collections if the index records them.
+        """
+        total = len(self.chunk_ids)
+        if total == 0:
+            return []
+
+        scores = np.zeros(total, dtype=np.float32)
+        for term in set(tokenize(query)):
+            entry = self.terms.get(term)
+            if entry is None:
+                continue
+            offset, count = entry
+            docs = self.docs[offset:offset + count]
+            tf = self.frequencies[offset:offset + count].astype(np.float32)
+            idf = math.log(1 + (total - count + 0.5) / (count + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docs] / self.average_length)
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        if collections is not None and self.collection_codes is not None:
+            allowed = [code for code, name in enumerate(self.collection_names) if name in collections]
+            scores[~np.isin(self.collection_codes, allowed)] = 0.0
+
+        k = min(k, total)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.chunk_ids[i], float(scores[i])) for i in top if scores[i] > 0]
@@ -0,0 +1,358 @@
+"""
+Resilient client for OpenRouter's OpenAI-compatible chat completions API.
+
+Every request has an overall deadline (LLM_DEADLINE) and a per-attempt timeout.
+Rate limits (429), server errors (5xx), timeouts and connection errors are
+retried with jittered exponential backoff, honouring Retry-After. When a model
+keeps failing, the next model in the fallback list is tried. Non-streamed
+requests can also be hedged: if no response arrives within LLM_HEDGE_AFTER
+seconds, a second identical request is sent and the first answer wins.
+
+Streamed requests are retried (and fall back) only until the first token has
+been received; an interrupted stream raises LLMError.
+
+Run it against the local stub server (see stub_llm_server.py) to exercise
+the failure handling without calling OpenRouter.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import httpx
+
+from metrics import REGISTRY, log_event
+
+# --- Configuration ---
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# Seconds to wait before sending a hedged duplicate request (0 disables hedging)
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0"))
+# Comma-separated models tried in order after OPENROUTER_MODEL
+OPENROUTER_FALLBACK_MODELS = [
+    model.strip() for model in os.getenv("OPENROUTER_FALLBACK_MODELS", "").split(",") if model.strip()
+]
+
+RETRYABLE_STATUS = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+FATAL_STATUS = frozenset({401, 402, 403})  # Fallback models won't help with these
+
+class LLMError(Exception):
+    """Raised when the LLM request fails; retryable errors may succeed on a later attempt."""
+
+    def __init__(self, message, status=None, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+    @property
+    def kind(self):
+        if self.status is not None:
+            return str(self.status)
+        return "timeout" if "timed out" in str(self) else "error"
+
+class _Attempts:
+    """Walks the model fallback list and the retries of one request, within its deadline."""
+
+    def __init__(self, models, deadline, max_retries):
+        self.models = models
+        self.deadline = time.monotonic() + deadline
+        self.max_retries = max_retries
+        self.errors = []
+        self._next_model = False
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def __iter__(self):
+        """Yields (model, attempt, seconds_remaining) until the caller stops or time runs out."""
+        for index, model in enumerate(self.models):
+            if index:
+                REGISTRY.increment("llm_fallbacks_total", model=model)
+                log_event("llm_fallback", model=model, errors=self.errors[-1:])
+            self._next_model = False
+            for attempt in range(self.max_retries + 1):
+                remaining = self.remaining()
+                if remaining <= 0:
+                    return
+                yield model, attempt, remaining
+                if self._next_model:
+                    break
+
+    def failed(self, model, attempt, error):
+        """Records a failed attempt and returns the seconds to back off before retrying."""
+        REGISTRY.increment("llm_attempts_total", model=model, outcome=error.kind)
+        self.errors.append(f"{model}: {error}")
+        if error.status in FATAL_STATUS:
+            raise error
+        if not error.retryable or attempt == self.max_retries:
+            self._next_model = True
+            return 0.0
+        delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+        if error.retry_after is not None:
+            delay = max(delay, error.retry_after)
+        if delay >= self.remaining():
+            self._next_model = True
+            return 0.0
+        REGISTRY.increment("llm_retries_total", model=model)
+        return delay
+
+    def succeeded(self, model):
+        REGISTRY.increment("llm_attempts_total", model=model, outcome="ok")
+
+    def exhausted(self):
+        detail = self.errors[-1] if self.errors else f"no response within {LLM_DEADLINE:g}s"
+        return LLMError(f"No model answered ({len(self.errors)} failed attempts; last: {detail})")
+
+class ResilientChatClient:
+    """
+    Chat completions with pooled connections, deadlines, retries, hedging and
+    model fallback. Messages are OpenAI-style dictionaries; complete() returns
+    the answer text and stream() yields it token by token. Thread-safe: one
+    client is shared by every session.
+    """
+
+    def __init__(self, base_url, api_key, models, limits=None, temperature=0.3, max_tokens=1024,
+                 deadline=LLM_DEADLINE, attempt_timeout=LLM_ATTEMPT_TIMEOUT,
+                 max_retries=LLM_MAX_RETRIES, hedge_after=LLM_HEDGE_AFTER):
+        self.models = list(models)
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.hedge_after = hedge_after
+        limits = limits or httpx.Limits()
+        headers = {"Authorization": f"Bearer {api_key}"}
+        base_url = base_url.rstrip("/")
+        self._client = httpx.Client(base_url=base_url, headers=headers, limits=limits)
+        self._async_client = httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits)
+        # Each pooled request holds a connection, so threads beyond the connection
+        # limit would only wait inside httpx
+        self._hedge_pool = ThreadPoolExecutor(max_workers=limits.max_connections or None,
+                                              thread_name_prefix="llm-hedge") if hedge_after > 0 else None
+
+    def complete(self, messages):
+        """Returns the answer to messages, retrying and falling back as needed."""
+        attempts = _Attempts(self.models, self.deadline, self.max_retries)
+        for model, attempt, remaining in attempts:
+            try:
+                answer = self._hedged(model, messages, remaining)
+                attempts.succeeded(model)
+                return answer
+            except LLMError as e:
+                delay = attempts.failed(model, attempt, e)
+            time.sleep(delay)
+        raise attempts.exhausted()
+
+    async def acomplete(self, messages):
+        """Async version of complete()."""
+        attempts = _Attempts(self.models, self.deadline, self.max_retries)
+        for model, attempt, remaining in attempts:
+            try:
+                answer = await self._ahedged(model, messages, remaining)
+                attempts.succeeded(model)
+                return answer
+            except LLMError as e:
+                delay = attempts.failed(model, attempt, e)
+            await asyncio.sleep(delay)
+        raise attempts.exhausted()
+
+    def stream(self, messages):
+        """Yields the answer to messages token by token."""
+        attempts = _Attempts(self.models, self.deadline, self.max_retries)
+        for model, attempt, remaining in attempts:
+            started = False
+            try:
+                with self._client.stream("POST", "/chat/completions", json=self._payload(model, messages, True),
+                                         timeout=self._timeout(remaining)) as response:
+                    if response.status_code != 200:
+                        response.read()
+                        _raise_for_status(response, model)
+                    for token in _iter_sse_tokens(response.iter_lines(), model):
+                        started = True
+                        yield token
+                attempts.succeeded(model)
+                return
+            except httpx.HTTPError as e:
+                error = _transport_error(e, model)
+            except LLMError as e:
+                error = e
+            if started:
+                raise LLMError(f"{model}: the answer stream was interrupted ({error})")
+            time.sleep(attempts.failed(model, attempt, error))
+        raise attempts.exhausted()
+
+    async def astream(self, messages):
+        """Async version of stream()."""
+        attempts = _Attempts(self.models, self.deadline, self.max_retries)
+        for model, attempt, remaining in attempts:
+            started = False
+            try:
+                async with self._async_client.stream("POST", "/chat/completions",
+                                                     json=self._payload(model, messages, True),
+                                                     timeout=self._timeout(remaining)) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        _raise_for_status(response, model)
+                    async for line in response.aiter_lines():
+                        for token in _iter_sse_tokens([line], model):
+                            started = True
+                            yield token
+                attempts.succeeded(model)
+                return
+            except httpx.HTTPError as e:
+                error = _transport_error(e, model)
+            except LLMError as e:
+                error = e
+            if started:
+                raise LLMError(f"{model}: the answer stream was interrupted ({error})")
+            await asyncio.sleep(attempts.failed(model, attempt, error))
+        raise attempts.exhausted()
+
+    def _payload(self, model, messages, stream):
+        return {
+            "model": model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stream": stream,
+        }
+
+    def _timeout(self, remaining):
+        return httpx.Timeout(min(self.attempt_timeout, remaining), connect=min(LLM_CONNECT_TIMEOUT, remaining))
+
+    def _post(self, model, messages, remaining):
+        try:
+            response = self._client.post("/chat/completions", json=self._payload(model, messages, False),
+                                         timeout=self._timeout(remaining))
+        except httpx.HTTPError as e:
+            raise _transport_error(e, model) from e
+        _raise_for_status(response, model)
+        return _completion_text(response, model)
+
+    async def _apost(self, model, messages, remaining):
+        try:
+            response = await self._async_client.post("/chat/completions",
+                                                     json=self._payload(model, messages, False),
+                                                     timeout=self._timeout(remaining))
+        except httpx.HTTPError as e:
+            raise _transport_error(e, model) from e
+        _raise_for_status(response, model)
+        return _completion_text(response, model)
+
+    def _hedged(self, model, messages, remaining):
+        """Sends the request, and a duplicate if the first is slower than hedge_after."""
+        if self._hedge_pool is None or self.hedge_after >= remaining:
+            return self._post(model, messages, remaining)
+        primary = self._hedge_pool.submit(self._post, model, messages, remaining)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        REGISTRY.increment("llm_hedged_requests_total", model=model)
+        hedge = self._hedge_pool.submit(self._post, model, messages, remaining - self.hedge_after)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The slower request can't be cancelled mid-flight; its result is discarded
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _ahedged(self, model, messages, remaining):
+        """Async version of _hedged(); the losing request is cancelled."""
+        if self._hedge_pool is None or self.hedge_after >= remaining:
+            return await self._apost(model, messages, remaining)
+        primary = asyncio.ensure_future(self._apost(model, messages, remaining))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        REGISTRY.increment("llm_hedged_requests_total", model=model)
+        hedge = asyncio.ensure_future(self._apost(model, messages, remaining - self.hedge_after))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+def _transport_error(error, model):
+    if isinstance(error, httpx.TimeoutException):
+        return LLMError(f"{model} timed out", retryable=True)
+    return LLMError(f"{model}: {type(error).__name__}: {error}", retryable=True)
+
+def _raise_for_status(response, model):
+    if response.status_code == 200:
+        return
+    retry_after = response.headers.get("Retry-After")
+    try:
+        retry_after = float(retry_after) if retry_after is not None else None
+    except ValueError:
+        retry_after = None
+    raise LLMError(
+        f"{model} returned HTTP {response.status_code}: {response.text[:200]}",
+        status=response.status_code,
+        retryable=response.status_code in RETRYABLE_STATUS,
+        retry_after=retry_after,
+    )
+
+def _body_error(error, model):
+    """Turns an error object in a 200 response body (as OpenRouter sends them) into an LLMError."""
+    code = error.get("code")
+    status = code if isinstance(code, int) else None
+    return LLMError(
+        f"{model} returned an error: {error.get('message', error)}",
+        status=status,
+        retryable=status is None or status in RETRYABLE_STATUS,
+    )
+
+def _completion_text(response, model):
+    try:
+        data = response.json()
+    except ValueError as e:
+        # e.g. a proxy's HTML error page or a truncated body
+        raise LLMError(f"{model} returned a response that is not JSON", retryable=True) from e
+    if isinstance(data, dict) and "error" in data:
+        raise _body_error(data["error"], model)
+    try:
+        return data["choices"][0]["message"]["content"] or ""
+    except (KeyError, IndexError, TypeError) as e:
+        raise LLMError(f"{model} returned a malformed completion", retryable=True) from e
+
+def _iter_sse_tokens(lines, model):
+    """Yields the content deltas of server-sent chat completion chunks."""
+    for line in lines:
+        # Blank lines separate events; lines starting with ":" are keep-alive comments
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        try:
+            chunk = json.loads(data)
+        except ValueError as e:
+            raise LLMError(f"{model} sent a malformed stream event", retryable=True) from e
+        if "error" in chunk:
+            raise _body_error(chunk["error"], model)
+        for choice in chunk.get("choices", []):
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                yield content
@@ -0,0 +1,228 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configuration ---
+# Serve /metrics from the Streamlit process on this port (0 disables it)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger("mane_chatbot")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+class Histogram:
+    """A cumulative histogram with fixed bucket upper bounds."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    """Thread-safe store of labelled counters and histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def increment(self, name, amount=1, **labels):
+        """Adds amount to a counter."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """Records a value (seconds, for latency histograms) in a histogram."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Times the enclosed block (or decorated function) into a histogram."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        """Returns counters and histogram summaries as plain dictionaries."""
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self._counters.items()
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), "count": h.count, "sum": h.sum}
+                    for (name, labels), h in self._histograms.items()
+                ],
+            }
+
+    def render_prometheus(self):
+        """Renders every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    bucket_labels = labels + (("le", str(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+class RequestTrace:
+    """
+    Collects per-stage timings for one chatbot request.
+    Every stage is also recorded in the rag_stage_seconds histogram, and
+    finish() writes one structured JSON log line for the whole request.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.fields = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Times the enclosed block as the named stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        """Records a stage timed by the caller (e.g. one spanning a generator)."""
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+        REGISTRY.observe("rag_stage_seconds", seconds, stage=name)
+
+    def set(self, **fields):
+        """Attaches extra fields (cache result, token counts, ...) to the log line."""
+        self.fields.update(fields)
+
+    def finish(self, status="ok"):
+        total = time.perf_counter() - self.started
+        REGISTRY.observe("rag_request_seconds", total, operation=self.operation, status=status)
+        REGISTRY.increment("rag_requests_total", operation=self.operation, status=status)
+        log_event(
+            "rag_request",
+            operation=self.operation,
+            status=status,
+            total_ms=round(total * 1000, 2),
+            stages_ms={name: round(seconds * 1000, 2) for name, seconds in self.timings.items()},
+            **self.fields,
+        )
+
+class StartupProfile:
+    """
+    Records how long each cold-start phase (imports, model load, index open,
+    warm-up) takes. Phases are timed from when this module was first imported,
+    which is close to process start for the apps and the API server.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        """Times the enclosed block as the named startup phase."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + seconds
+            REGISTRY.observe("startup_phase_seconds", seconds, phase=name)
+
+    def report(self):
+        """Returns the phase timings and the time since import, in milliseconds."""
+        with self._lock:
+            phases = {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()}
+        return {
+            "phases_ms": phases,
+            "since_import_ms": round((time.perf_counter() - self.started) * 1000, 2),
+        }
+
+STARTUP = StartupProfile()
+
+def log_event(event, **fields):
+    """Writes a structured JSON log line."""
+    logger.info(json.dumps({"event": event, "ts": time.time(), **fields}, default=str))
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+def start_metrics_server(port=METRICS_PORT):
+    """
+    Serves /metrics on a background thread, once per process. Used by the
+    Streamlit apps, which can't add routes of their own; does nothing when
+    the port is 0.
+    """
+    global _metrics_server
+    if not port:
+        return None
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            _metrics_server.daemon_threads = True
+            threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+    return _metrics_server
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ") + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
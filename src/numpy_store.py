@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.documents import Document
+
+from index_artifact import read_collection
+from routing import collection_ranges, partition_rows
+
+# --- Configuration ---
+NUMPY_STORE_DTYPE = os.getenv("NUMPY_STORE_DTYPE", "float32")
+FILTER_CACHE_SIZE = 64  # Metadata filter masks kept per store
+
+class NumpyVectorStore:
+    """
+    Exact, in-memory vector search for small corpora.
+
+    Every chunk embedding lives in one contiguous, L2-normalized matrix
+    (float32, or float16 to halve the memory), and a search is a single
+    matrix-vector product followed by argpartition. For a few thousand chunks
+    this is faster than an HNSW index and returns the exact top k. Implements
+    the subset of the LangChain Chroma interface the chatbot uses.
+
+    Rows are kept grouped by collection, so a search restricted to some
+    collections only multiplies their rows.
+
+    Metadata filters use Chroma's where syntax: {"field": value},
+    {"field": {"$eq" | "$ne" | "$gt" | "$gte" | "$lt" | "$lte" | "$in" | "$nin": ...}},
+    and {"$and" | "$or": [filter, ...]}.
+    """
+
+    def __init__(self, ids, embeddings, texts, metadatas, dtype=NUMPY_STORE_DTYPE):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported NUMPY_STORE_DTYPE '{dtype}'; use float32 or float16.")
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        self.embeddings = np.ascontiguousarray(embeddings / np.where(norms == 0, 1, norms), dtype=dtype)
+        self.ids = list(ids)
+        self.texts = list(texts)
+        self.metadatas = [dict(metadata or {}) for metadata in metadatas]
+        self._positions = {cid: i for i, cid in enumerate(self.ids)}
+        self.partitions = partition_rows(self.metadatas)
+        self._filter_masks = OrderedDict()
+        self._filter_lock = threading.Lock()
+
+    @classmethod
+    def from_chroma(cls, db_path, dtype=NUMPY_STORE_DTYPE):
+        """Loads every chunk of a Chroma vector database into memory."""
+        ids, embeddings, texts, metadatas = read_collection(db_path)
+        return cls(ids, embeddings, texts, metadatas, dtype=dtype)
+
+    @property
+    def nbytes(self):
+        """Memory held by the embedding matrix."""
+        return self.embeddings.nbytes
+
+    def document(self, position):
+        return Document(page_content=self.texts[position], metadata=dict(self.metadatas[position]))
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, collections=None, **kwargs):
+        """Returns the k chunks most similar to a query embedding, optionally only from some collections."""
+        return self.similarity_search_by_vectors([embedding], k=k, filter=filter, collections=collections)[0]
+
+    def similarity_search_by_vectors(self, embeddings, k=4, filter=None, collections=None):
+        """
+        Searches for several query embeddings at once with one matrix product
+        per searched collection. Returns one list of k documents per query.
+        """
+        ranges = collection_ranges(self.partitions, collections, len(self.ids))
+        if not ranges:
+            return [[] for _ in embeddings]
+        queries = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries /= np.where(norms == 0, 1, norms)
+        scores = np.concatenate(
+            [np.matmul(queries, self.embeddings[start:end].T, dtype=np.float32) for start, end in ranges], axis=1
+        )
+        positions = np.concatenate([np.arange(start, end) for start, end in ranges])
+
+        if filter:
+            mask = self._filter_mask(filter)[positions]
+            scores[:, ~mask] = -np.inf
+            k = min(k, int(mask.sum()))
+        k = min(k, len(positions))
+        if k <= 0:
+            return [[] for _ in embeddings]
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        rows = np.arange(len(queries))[:, None]
+        top = np.take_along_axis(top, np.argsort(-scores[rows, top], axis=1), axis=1)
+        return [[self.document(int(positions[i])) for i in row] for row in top]
+
+    def get(self, ids=None, include=None, where=None, **kwargs):
+        """Returns chunks by ID (and/or metadata filter) in the same shape as Chroma's get()."""
+        if ids is None:
+            positions = range(len(self.ids))
+        else:
+            positions = [self._positions[cid] for cid in ids if cid in self._positions]
+        if where:
+            mask = self._filter_mask(where)
+            positions = [i for i in positions if mask[i]]
+        return {
+            "ids": [self.ids[i] for i in positions],
+            "documents": [self.texts[i] for i in positions],
+            "metadatas": [dict(self.metadatas[i]) for i in positions],
+        }
+
+    def _filter_mask(self, where):
+        """Returns a boolean mask of the chunks matching a filter, cached per filter."""
+        key = json.dumps(where, sort_keys=True, default=str)
+        with self._filter_lock:
+            mask = self._filter_masks.get(key)
+            if mask is not None:
+                self._filter_masks.move_to_end(key)
+                return mask
+        mask = np.fromiter((matches(metadata, where) for metadata in self.metadatas),
+                           dtype=bool, count=len(self.metadatas))
+        with self._filter_lock:
+            self._filter_masks[key] = mask
+            while len(self._filter_masks) > FILTER_CACHE_SIZE:
+                self._filter_masks.popitem(last=False)
+        return mask
+
+_OPERATORS = {
+    "$eq": lambda value, arg: value == arg,
+    "$ne": lambda value, arg: value != arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+}
+
+def matches(metadata, where):
+    """Returns True if a chunk's metadata satisfies a Chroma-style where filter."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, arg in condition.items():
+                if operator not in _OPERATORS:
+                    raise ValueError(f"Unsupported filter operator '{operator}'.")
+                if not _OPERATORS[operator](value, arg):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
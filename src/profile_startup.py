@@ -0,0 +1,51 @@
+"""
+Cold-start profile for the chatbot.
+
+Times importing the chatbot module and each phase of building the shared
+chatbot (embedding model load, index open, reranker load when enabled, LLM
+client creation, warm-up when enabled), then prints a report. Run it in a
+fresh process, the way a new Cloud Run instance starts.
+
+Usage:
+    python src/profile_startup.py [--output startup_profile.json]
+
+For a per-module breakdown of import time:
+    python -X importtime src/profile_startup.py 2> importtime.log
+"""
+import argparse
+import json
+import time
+
+from metrics import STARTUP
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the chatbot's cold start.")
+    parser.add_argument("--output", help="Also write the report to this JSON file.")
+    args = parser.parse_args()
+
+    with STARTUP.phase("import_chatbot_module"):
+        import chatbot
+
+    started = time.perf_counter()
+    chatbot.get_chatbot()
+    ready_seconds = time.perf_counter() - started
+
+    report = STARTUP.report()
+    report["get_chatbot_ms"] = round(ready_seconds * 1000, 2)
+    report["vector_store"] = chatbot.VECTOR_STORE
+    report["embedding_model"] = chatbot.EMBEDDING_MODEL
+    report["embedding_backend"] = chatbot.EMBEDDING_BACKEND
+
+    width = max(len(name) for name in report["phases_ms"])
+    print("\n--- Startup profile ---")
+    for name, ms in report["phases_ms"].items():
+        print(f"{name:<{width}}  {ms:>10.1f} ms")
+    print(f"{'total':<{width}}  {report['since_import_ms']:>10.1f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import os
+import threading
+from collections import OrderedDict
+
+from cache import normalize_query
+from metrics import REGISTRY
+
+# --- Configuration ---
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_EMBED_MAX_BATCH = int(os.getenv("QUERY_EMBED_MAX_BATCH", "32"))
+
+class _PendingQuery:
+    """A query waiting to be embedded in the next batch."""
+
+    def __init__(self, text):
+        self.text = text
+        self.done = threading.Event()
+        self.lead = False
+        self.vector = None
+        self.error = None
+
+class QueryEmbedder:
+    """
+    Embeds queries for the chatbot, sharing the model between concurrent sessions.
+
+    Embeddings of recently seen normalized queries are kept in a bounded LRU
+    cache. On a miss, queries are micro-batched: one caller at a time runs the
+    model, and queries that arrive while it does are embedded together in the
+    next batch by one of their callers. A lone query never waits for others,
+    so single-user latency stays the same while concurrent load is embedded
+    with batch sizes above 1.
+    """
+
+    def __init__(self, embeddings, cache_size=QUERY_EMBEDDING_CACHE_SIZE, max_batch=QUERY_EMBED_MAX_BATCH):
+        self.embeddings = embeddings
+        self.cache_size = cache_size
+        self.max_batch = max_batch
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._busy = False
+
+    def embed_query(self, query):
+        """Returns the embedding of a query, from the cache when possible."""
+        key = normalize_query(query)
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+        if vector is not None:
+            REGISTRY.increment("query_embedding_cache_total", result="hit")
+            return vector
+
+        REGISTRY.increment("query_embedding_cache_total", result="miss")
+        vector = self._embed_batched(query)
+        if self.cache_size > 0:
+            with self._cache_lock:
+                self._cache[key] = vector
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return vector
+
+    def clear(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    def _embed_batched(self, text):
+        request = _PendingQuery(text)
+        with self._lock:
+            self._pending.append(request)
+            if not self._busy:
+                self._busy = True
+                request.lead = True
+
+        if not request.lead:
+            # Woken either with a result, or to embed the next batch itself
+            request.done.wait()
+        if request.lead:
+            self._run_batch()
+        if request.error is not None:
+            raise request.error
+        return request.vector
+
+    def _run_batch(self):
+        """Embeds the pending queries, then hands the model to the next waiting caller."""
+        with self._lock:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+
+        try:
+            vectors = self.embeddings.embed_documents([request.text for request in batch])
+        except Exception as e:
+            vectors = [None] * len(batch)
+            for request in batch:
+                request.error = e
+        REGISTRY.increment("query_embedding_batches_total")
+        REGISTRY.increment("query_embedding_batched_queries_total", len(batch))
+
+        for request, vector in zip(batch, vectors):
+            request.vector = vector
+            request.lead = False
+            request.done.set()
+
+        with self._lock:
+            if self._pending:
+                next_leader = self._pending[0]
+                next_leader.lead = True
+                next_leader.done.set()
+            else:
+                self._busy = False
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from cache import normalize_query
+
+# --- Configuration ---
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidates retrieved for reranking, and how many of them are sent to the LLM
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+
+class CrossEncoderReranker:
+    """
+    Reorders retrieved chunks by a local cross-encoder's relevance score.
+
+    All uncached (query, chunk) pairs of a request are scored in one batched
+    call. Scores are cached per normalized query and chunk ID (chunk IDs are
+    content hashes, so a re-ingested chunk gets a new entry), bounded by
+    RERANK_CACHE_SIZE.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL, batch_size=RERANK_BATCH_SIZE, cache_size=RERANK_CACHE_SIZE):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name)
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def rerank(self, query, docs, top_n=RERANK_TOP_N):
+        """Returns the top_n documents, best first."""
+        if not docs:
+            return []
+        normalized = normalize_query(query)
+        keys = [(normalized, _chunk_key(doc)) for doc in docs]
+
+        scores = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[key] = self._cache[key]
+
+        missing = [(key, doc) for key, doc in zip(keys, docs) if key not in scores]
+        if missing:
+            predicted = self.model.predict(
+                [(query, doc.page_content) for _, doc in missing],
+                batch_size=self.batch_size,
+            )
+            with self._lock:
+                for (key, _), score in zip(missing, predicted):
+                    scores[key] = float(score)
+                    if self.cache_size > 0:
+                        self._cache[key] = float(score)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        ranked = sorted(zip(keys, docs), key=lambda pair: scores[pair[0]], reverse=True)
+        return [doc for _, doc in ranked[:top_n]]
+
+    def warm_up(self):
+        """Scores one throwaway pair so the first real request doesn't load weights lazily."""
+        self.model.predict([("warm up", "warm up")])
+
+def _chunk_key(doc):
+    chunk_id = doc.metadata.get("chunk_id")
+    if chunk_id:
+        return chunk_id
+    # Databases ingested before chunk IDs existed: key by content
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
@@ -0,0 +1,188 @@
+"""
+Named collections and query routing.
+
+Documents are ingested into named collections (one per subdirectory of the data
+directory or Cloud Storage prefix; top-level files go to DEFAULT_COLLECTION).
+Next to the index, collections.json records each collection's chunk count,
+documents and editions, and the centroid of its chunk embeddings:
+
+    {"mane": {"chunks": 812, "documents": {"MANE_GRADUATE_HANDBOOK": ["2024-2025"]},
+              "centroid": [...]}, ...}
+
+A query is searched in the collections it names explicitly or, failing that,
+in the few whose centroids are closest to the query embedding, so search cost
+and prompt noise stay bounded as collections are added.
+"""
+import json
+import os
+import re
+
+import numpy as np
+
+# --- Configuration ---
+# LangChain's default collection name, so databases built before collections existed keep working
+DEFAULT_COLLECTION = "langchain"
+COLLECTIONS_FILE = "collections.json"
+# Collections searched per query when routing by centroid, and how far below the best
+# centroid similarity another collection may score and still be searched
+ROUTING_MAX_COLLECTIONS = int(os.getenv("ROUTING_MAX_COLLECTIONS", "2"))
+ROUTING_MARGIN = float(os.getenv("ROUTING_MARGIN", "0.05"))
+# Chroma's collection name rules: 3-63 characters from [a-zA-Z0-9._-], starting and
+# ending with a letter or digit, no ".." and not an IPv4 address
+COLLECTION_NAME_PATTERN = re.compile(r"[a-zA-Z0-9][a-zA-Z0-9._-]{1,61}[a-zA-Z0-9]")
+IPV4_PATTERN = re.compile(r"\d{1,3}(?:\.\d{1,3}){3}")
+
+def is_valid_collection_name(name):
+    """Returns whether name can be used as a Chroma collection name."""
+    return (COLLECTION_NAME_PATTERN.fullmatch(name) is not None and ".." not in name
+            and IPV4_PATTERN.fullmatch(name) is None)
+
+def check_collection_names(collections_by_path):
+    """
+    Raises ValueError naming every document whose collection ({path: collection})
+    is not a valid Chroma collection name, so ingestion stops before any work is done.
+    """
+    invalid = [f"'{path}' -> '{name}'" for path, name in collections_by_path.items()
+               if not is_valid_collection_name(name)]
+    if invalid:
+        raise ValueError(
+            "Invalid collection name(s): " + ", ".join(invalid) + ". Collection directories must be "
+            "named with 3-63 letters, digits, '.', '_' or '-', starting and ending with a letter or digit."
+        )
+
+def collections_path(index_dir):
+    return os.path.join(index_dir, COLLECTIONS_FILE)
+
+def load_collections(index_dir):
+    """Returns the collection summaries stored with an index, or {} if there are none."""
+    try:
+        with open(collections_path(index_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_collections(index_dir, collections):
+    """Writes the collection summaries atomically."""
+    path = collections_path(index_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(collections, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def collection_names(index_dir):
+    """Returns the names of the Chroma collections in an index, in a stable order."""
+    return sorted(load_collections(index_dir)) or [DEFAULT_COLLECTION]
+
+def partition_rows(metadatas):
+    """
+    Returns {collection: (start, end)} for rows grouped by their "collection"
+    metadata, or None if the rows are not grouped (e.g. an older index).
+    """
+    ranges = {}
+    for row, metadata in enumerate(metadatas):
+        name = metadata.get("collection", DEFAULT_COLLECTION)
+        if name in ranges:
+            start, end = ranges[name]
+            if end != row:
+                return None
+            ranges[name] = (start, row + 1)
+        else:
+            ranges[name] = (row, row + 1)
+    return ranges
+
+def collection_ranges(partitions, collections, total):
+    """
+    Returns the (start, end) row ranges to search for the given collections:
+    every row when no collections are given or the rows are not grouped.
+    """
+    if collections is None or partitions is None:
+        return [(0, total)] if total else []
+    return [partitions[name] for name in collections if name in partitions]
+
+class CollectionRouter:
+    """
+    Picks the collections a query is searched in.
+    Explicitly requested collections are used as given; otherwise the query
+    embedding is compared with every collection centroid (one small matrix
+    product) and the closest ROUTING_MAX_COLLECTIONS within ROUTING_MARGIN of
+    the best are chosen.
+    """
+
+    def __init__(self, collections, max_collections=ROUTING_MAX_COLLECTIONS, margin=ROUTING_MARGIN):
+        self.collections = collections
+        self.names = sorted(name for name in collections if collections[name].get("centroid"))
+        centroids = np.asarray([collections[name]["centroid"] for name in self.names], dtype=np.float32)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.where(norms == 0, 1, norms)
+        self.max_collections = max_collections
+        self.margin = margin
+
+    @classmethod
+    def load(cls, index_dir):
+        """Returns a router for an index, or None if it has fewer than two collections."""
+        collections = load_collections(index_dir)
+        if len(collections) < 2:
+            return None
+        return cls(collections)
+
+    def route(self, embedding, requested=None):
+        """Returns the names of the collections to search for a query."""
+        if requested:
+            unknown = [name for name in requested if name not in self.collections]
+            if unknown:
+                raise ValueError(f"Unknown collection(s): {', '.join(unknown)}. "
+                                 f"Available: {', '.join(self.names)}.")
+            return list(requested)
+
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = self.centroids @ query
+        order = np.argsort(-scores)[:max(self.max_collections, 1)]
+        best = scores[order[0]]
+        return [self.names[i] for i in order if scores[i] >= best - self.margin]
+
+class ChromaCollections:
+    """
+    Searches a Chroma database holding several named collections, only in the
+    collections a query is routed to. Implements the subset of the LangChain
+    Chroma interface the chatbot uses, plus a `collections` argument.
+    """
+
+    def __init__(self, index_dir, embedding_function, names):
+        from langchain_community.vectorstores import Chroma
+
+        self.stores = {
+            name: Chroma(persist_directory=index_dir, collection_name=name,
+                         embedding_function=embedding_function)
+            for name in names
+        }
+
+    def similarity_search_by_vector(self, embedding, k=4, collections=None, **kwargs):
+        """Returns the k chunks most similar to a query embedding across the given collections."""
+        scored = []
+        for name in collections or self.stores:
+            scored.extend(self.stores[name].similarity_search_by_vector_with_relevance_scores(embedding, k=k, **kwargs))
+        # Every collection uses the same distance, so results merge by distance
+        scored.sort(key=lambda pair: pair[1])
+        return [doc for doc, _ in scored[:k]]
+
+    def get(self, ids=None, include=None, **kwargs):
+        """Returns chunks by ID from every collection, in the same shape as Chroma's get()."""
+        merged = {"ids": [], "documents": [], "metadatas": []}
+        for store in self.stores.values():
+            found = store.get(ids=ids, include=include or ["documents", "metadatas"], **kwargs)
+            for key in merged:
+                merged[key].extend(found.get(key) or [])
+        return merged
+
+def open_chroma(index_dir, embedding_function):
+    """
+    Opens a Chroma database for search: a plain LangChain Chroma store when it
+    has a single collection, otherwise a ChromaCollections over all of them.
+    """
+    names = collection_names(index_dir)
+    if len(names) > 1:
+        return ChromaCollections(index_dir, embedding_function, names)
+    from langchain_community.vectorstores import Chroma
+
+    return Chroma(persist_directory=index_dir, collection_name=names[0], embedding_function=embedding_function)
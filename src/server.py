@@ -0,0 +1,131 @@
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import uvicorn
+from dotenv import load_dotenv
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from chatbot import get_chatbot, is_chatbot_ready, start_background_warm_up
+from metrics import REGISTRY, STARTUP
+
+# Load environment variables
+load_dotenv()
+
+# --- Configuration ---
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8080"))
+
+class Question(BaseModel):
+    question: str
+    # Search only these collections (see /collections); routed automatically when omitted
+    collections: Optional[List[str]] = None
+
+def serialize_sources(sources):
+    """Converts source documents into JSON-friendly dictionaries."""
+    return [
+        {
+            "content": doc.page_content,
+            "source": doc.metadata.get("source", "N/A"),
+            "page": doc.metadata.get("page"),
+            "heading": doc.metadata.get("heading"),
+            "collection": doc.metadata.get("collection"),
+            "document": doc.metadata.get("document"),
+            "edition": doc.metadata.get("edition"),
+        }
+        for doc in sources
+    ]
+
+async def shared_chatbot():
+    """
+    Returns the shared chatbot, waiting for the background warm-up in a worker
+    thread (never on the event loop) if it hasn't finished yet.
+    """
+    if is_chatbot_ready():
+        return get_chatbot()
+    return await asyncio.to_thread(get_chatbot)
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Starts loading the shared chatbot in the background and begins accepting
+    connections right away; /readyz reports when it is ready to answer.
+    """
+    start_background_warm_up()
+    yield
+
+app = FastAPI(title="MANE Handbook Chatbot API", lifespan=lifespan)
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness probe."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness probe: 503 until the chatbot is loaded and warmed up."""
+    if not is_chatbot_ready():
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return {"status": "ready", "startup": STARTUP.report()["phases_ms"]}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-stage latency histograms and counters in Prometheus text format."""
+    return REGISTRY.render_prometheus()
+
+def unknown_collections(bot, requested):
+    """Returns a 400 response if any requested collection doesn't exist, else None."""
+    if not requested:
+        return None
+    available = bot.collections()
+    unknown = [name for name in requested if name not in available]
+    if not unknown:
+        return None
+    return JSONResponse(
+        {"error": f"Unknown collection(s): {', '.join(unknown)}", "available": sorted(available)},
+        status_code=400,
+    )
+
+@app.get("/collections")
+async def collections():
+    """Lists the collections of the current index with their documents and editions."""
+    bot = await shared_chatbot()
+    return bot.collections()
+
+@app.post("/ask")
+async def ask(body: Question):
+    """Answers a question and returns the answer with its sources."""
+    bot = await shared_chatbot()
+    error = unknown_collections(bot, body.collections)
+    if error is not None:
+        return error
+    answer, sources = await bot.aget_response(body.question, body.collections)
+    return {"answer": answer, "sources": serialize_sources(sources)}
+
+@app.post("/ask/stream")
+async def ask_stream(body: Question):
+    """
+    Streams an answer as newline-delimited JSON: one {"type": "sources"} event
+    followed by {"type": "token"} events as the LLM produces them.
+    """
+    bot = await shared_chatbot()
+    error = unknown_collections(bot, body.collections)
+    if error is not None:
+        return error
+
+    async def events():
+        async for kind, payload in bot.astream_response(body.question, body.collections):
+            if kind == "sources":
+                event = {"type": "sources", "sources": serialize_sources(payload)}
+            else:
+                event = {"type": "token", "text": payload}
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=API_HOST, port=API_PORT)
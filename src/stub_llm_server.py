@@ -0,0 +1,166 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configuration ---
+STUB_HOST = os.getenv("STUB_LLM_HOST", "127.0.0.1")
+STUB_PORT = int(os.getenv("STUB_LLM_PORT", "8765"))
+STUB_ANSWER = (
+    "According to the handbook, the requirement is described in the provided "
+    "context. Please contact the MANE Office of Graduate Student Services for details."
+)
+# Failure injection, for exercising the client's retries, hedging and fallback
+STUB_FAILURE_RATE = float(os.getenv("STUB_LLM_FAILURE_RATE", "0"))
+STUB_FAILURE_STATUS = int(os.getenv("STUB_LLM_FAILURE_STATUS", "503"))
+STUB_SLOW_RATE = float(os.getenv("STUB_LLM_SLOW_RATE", "0"))
+STUB_SLOW_DELAY = float(os.getenv("STUB_LLM_SLOW_DELAY", "5"))
+STUB_FAILING_MODELS = [m.strip() for m in os.getenv("STUB_LLM_FAILING_MODELS", "").split(",") if m.strip()]
+# Retry-After seconds sent with injected failures (unset sends none)
+STUB_RETRY_AFTER = os.getenv("STUB_LLM_RETRY_AFTER")
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """
+    Serves POST /v1/chat/completions like an OpenAI-compatible API, returning a
+    canned answer after a fixed delay. Supports both regular and streamed
+    (server-sent events) responses.
+
+    Failures can be injected: a fraction of requests (and every request for
+    a model in failing_models) get an HTTP error, and a fraction are delayed
+    by slow_delay extra seconds. For deterministic tests, the server's `script`
+    lists the outcomes of the next requests in arrival order: "ok", "fail",
+    "slow", or "malformed" (a 200 response whose body is not JSON).
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        model = request.get("model", "stub")
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            outcome = server.script.pop(0) if server.script else None
+        if outcome == "fail" or (outcome is None and (
+                model in server.failing_models or random.random() < server.failure_rate)):
+            self._fail(server.failure_status)
+            return
+        if outcome == "malformed":
+            self._send(200, b"<html>Bad gateway</html>", "text/html")
+            return
+        delay = server.first_token_delay
+        if outcome == "slow" or (outcome is None and random.random() < server.slow_rate):
+            delay += server.slow_delay
+        time.sleep(delay)
+
+        try:
+            if request.get("stream"):
+                self._stream(model)
+            else:
+                self._respond(model)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up, e.g. a hedged request that lost the race
+            self.close_connection = True
+
+    def _fail(self, status):
+        body = json.dumps({"error": {"code": status, "message": "Injected failure"}}).encode("utf-8")
+        headers = {}
+        if self.server.retry_after is not None:
+            headers["Retry-After"] = str(self.server.retry_after)
+        self._send(status, body, "application/json", headers)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _respond(self, model):
+        body = json.dumps({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": STUB_ANSWER},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(STUB_ANSWER.split()), "total_tokens": 0},
+        }).encode("utf-8")
+        self._send(200, body, "application/json")
+
+    def _stream(self, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        words = STUB_ANSWER.split(" ")
+        for i, word in enumerate(words):
+            delta = {"content": word if i == 0 else " " + word}
+            self._send_event(completion_id, model, delta, None)
+            time.sleep(self.server.token_delay)
+        self._send_event(completion_id, model, {}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def _send_event(self, completion_id, model, delta, finish_reason):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+def start_stub_server(host=STUB_HOST, port=STUB_PORT, first_token_delay=0.2, token_delay=0.01,
+                      failure_rate=STUB_FAILURE_RATE, failure_status=STUB_FAILURE_STATUS,
+                      slow_rate=STUB_SLOW_RATE, slow_delay=STUB_SLOW_DELAY,
+                      failing_models=STUB_FAILING_MODELS, retry_after=STUB_RETRY_AFTER, script=()):
+    """
+    Starts the stub server on a background thread and returns it.
+    Its base URL (for OPENROUTER_BASE_URL) is f"http://{host}:{port}/v1"
+    (pass port=0 to pick a free port; see server.server_address);
+    server.requests counts the requests received. Call server.shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), StubLLMHandler)
+    server.daemon_threads = True
+    server.first_token_delay = first_token_delay
+    server.token_delay = token_delay
+    server.failure_rate = failure_rate
+    server.failure_status = failure_status
+    server.slow_rate = slow_rate
+    server.slow_delay = slow_delay
+    server.failing_models = set(failing_models)
+    server.retry_after = retry_after
+    server.script = list(script)
+    server.requests = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    server = start_stub_server()
+    print(f"Stub LLM server listening on http://{STUB_HOST}:{STUB_PORT}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
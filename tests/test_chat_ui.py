@@ -0,0 +1,38 @@
+"""Transcript capping and compaction."""
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("streamlit")
+from chat_ui import append_message, compact_message, get_source_store, prepend_messages
+
+START = datetime(2026, 1, 1)
+
+def stored(i, sources=()):
+    return {"id": f"m{i}", "role": "user", "content": f"message {i}",
+            "timestamp": START + timedelta(minutes=i), "sources": list(sources)}
+
+def test_append_message_drops_oldest_beyond_cap():
+    messages = []
+    dropped = [append_message(messages, compact_message("user", str(i)), max_messages=3) for i in range(5)]
+    assert [m["content"] for m in messages] == ["2", "3", "4"]
+    assert [[m["content"] for m in d] for d in dropped] == [[], [], [], ["0"], ["1"]]
+
+def test_prepend_messages_compacts_sources():
+    passage = {"content": "Theses are due in April.", "source": "handbook.pdf", "page": 12}
+    messages = []
+    assert prepend_messages(messages, [stored(0, [passage])]) == 0
+
+    message = messages[0]
+    assert message["id"] == "m0"
+    assert message["timestamp"] == START
+    assert get_source_store().get(message["sources"][0])["content"] == passage["content"]
+
+def test_prepend_messages_enforces_cap():
+    messages = [compact_message("user", f"message {i}", message_id=f"m{i}") for i in range(8, 10)]
+    left_out = prepend_messages(messages, [stored(i) for i in range(8)], max_messages=5)
+
+    assert left_out == 5
+    assert [m["id"] for m in messages] == ["m5", "m6", "m7", "m8", "m9"]
+    assert prepend_messages(messages, [stored(4)], max_messages=5) == 1
+    assert len(messages) == 5
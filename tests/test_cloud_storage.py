@@ -0,0 +1,173 @@
+"""CloudStorageManager's generation-keyed cache against an in-memory bucket."""
+import base64
+import hashlib
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("google.cloud.storage")
+from cloud_storage import CloudStorageManager
+
+class FakeBlob:
+    def __init__(self, bucket, name, data, generation, composite=False):
+        self.bucket = bucket
+        self.name = name
+        self.data = data
+        self.generation = generation
+        self.size = len(data)
+        self.etag = f"etag-{generation}"
+        self.md5_hash = None if composite else base64.b64encode(hashlib.md5(data).digest()).decode()
+
+    def download_to_filename(self, path, if_generation_match=None):
+        current = self.bucket.objects[self.name]
+        assert if_generation_match == current.generation
+        with self.bucket.lock:
+            self.bucket.downloads.append(self.name)
+            self.bucket.active += 1
+            self.bucket.max_active = max(self.bucket.max_active, self.bucket.active)
+        time.sleep(0.01)
+        with open(path, "wb") as f:
+            f.write(current.data)
+        with self.bucket.lock:
+            self.bucket.active -= 1
+
+class FakeBucket:
+    def __init__(self, name):
+        self.name = name
+        self.objects = {}
+        self.downloads = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self._generation = 0
+
+    def put(self, name, data, composite=False):
+        self._generation += 1
+        self.objects[name] = FakeBlob(self, name, data, self._generation, composite)
+
+    def get_blob(self, name):
+        return self.objects.get(name)
+
+class FakeClient:
+    def __init__(self):
+        self.buckets = {}
+
+    def bucket(self, name):
+        return self.buckets.setdefault(name, FakeBucket(name))
+
+    def list_blobs(self, bucket_name, prefix="", fields=None):
+        objects = self.buckets[bucket_name].objects
+        return [blob for name, blob in sorted(objects.items()) if name.startswith(prefix)]
+
+@pytest.fixture
+def storage(tmp_path):
+    client = FakeClient()
+    manager = CloudStorageManager("docs", client=client, cache_dir=str(tmp_path / "cache"))
+    return manager, client.bucket("docs")
+
+def test_fetch_downloads_once_then_hits_cache(storage):
+    manager, bucket = storage
+    bucket.put("handbook.pdf", b"v1")
+
+    first = manager.fetch("handbook.pdf")
+    second = manager.fetch("handbook.pdf")
+
+    assert first == second
+    assert bucket.downloads == ["handbook.pdf"]
+    assert manager.read_bytes("handbook.pdf") == b"v1"
+    assert bucket.downloads == ["handbook.pdf"]
+
+def test_missing_object(storage):
+    manager, bucket = storage
+    assert manager.fetch("missing.pdf") is None
+    assert manager.read_bytes("missing.pdf") is None
+    assert bucket.downloads == []
+
+def test_new_generation_is_downloaded_again(storage):
+    manager, bucket = storage
+    bucket.put("handbook.pdf", b"v1")
+    manager.fetch("handbook.pdf")
+    bucket.put("handbook.pdf", b"v2")
+
+    assert manager.read_bytes("handbook.pdf") == b"v2"
+    assert bucket.downloads == ["handbook.pdf", "handbook.pdf"]
+
+def test_superseded_generation_is_deleted(storage):
+    manager, bucket = storage
+    bucket.put("handbook.pdf", b"v1")
+    old = manager.fetch("handbook.pdf")
+    bucket.put("handbook.pdf", b"v2")
+    new = manager.fetch("handbook.pdf")
+
+    assert not os.path.exists(old)
+    assert os.listdir(os.path.dirname(new)) == [os.path.basename(new)]
+
+def test_file_shared_by_another_object_is_kept(storage):
+    manager, bucket = storage
+    bucket.put("handbook.pdf", b"same")
+    bucket.put("copy.pdf", b"same")
+    shared = manager.fetch("handbook.pdf")
+    assert manager.fetch("copy.pdf") == shared
+
+    bucket.put("handbook.pdf", b"changed")
+    manager.fetch("handbook.pdf")
+    assert manager.read_bytes("copy.pdf") == b"same"
+    assert os.path.exists(shared)
+
+def test_download_prefix_links_cached_files(storage, tmp_path):
+    manager, bucket = storage
+    bucket.put("artifact/embeddings.npy", b"vectors")
+    bucket.put("artifact/lexical/index.json", b"{}")
+
+    manager.download_prefix("artifact", str(tmp_path / "out"))
+
+    cached = manager.fetch("artifact/embeddings.npy")
+    local = tmp_path / "out" / "embeddings.npy"
+    assert local.read_bytes() == b"vectors"
+    assert (tmp_path / "out" / "lexical" / "index.json").read_bytes() == b"{}"
+    assert os.path.samefile(local, cached)
+
+def test_cache_survives_a_new_manager(storage, tmp_path):
+    manager, bucket = storage
+    bucket.put("handbook.pdf", b"v1")
+    manager.fetch("handbook.pdf")
+
+    again = CloudStorageManager("docs", client=SimpleNamespace(bucket=lambda name: bucket),
+                                cache_dir=manager.cache_dir)
+    assert again.read_bytes("handbook.pdf") == b"v1"
+    assert bucket.downloads == ["handbook.pdf"]
+
+def test_composite_objects_without_md5_are_cached_by_generation(storage):
+    manager, bucket = storage
+    bucket.put("big.pdf", b"part1part2", composite=True)
+    first = manager.fetch("big.pdf")
+    assert manager.fetch("big.pdf") == first
+
+    bucket.put("big.pdf", b"part1part3", composite=True)
+    second = manager.fetch("big.pdf")
+
+    assert second != first
+    assert manager.read_bytes("big.pdf") == b"part1part3"
+    assert bucket.downloads == ["big.pdf", "big.pdf"]
+
+def test_fetch_many_downloads_concurrently_and_reuses_cache(storage):
+    manager, bucket = storage
+    for i in range(20):
+        bucket.put(f"handbooks/doc{i:02}.pdf", f"document {i}".encode())
+    bucket.put("handbooks/notes.txt", b"not a pdf")
+
+    paths = manager.fetch_many("handbooks/", suffix=".pdf")
+
+    assert list(paths) == [f"handbooks/doc{i:02}.pdf" for i in range(20)]
+    for i, path in enumerate(paths.values()):
+        with open(path, "rb") as f:
+            assert f.read() == f"document {i}".encode()
+    assert sorted(bucket.downloads) == list(paths)
+    assert bucket.max_active > 1
+
+    bucket.put("handbooks/doc03.pdf", b"revised")
+    manager.fetch_many("handbooks/", suffix=".pdf")
+    assert len(bucket.downloads) == 21
@@ -0,0 +1,84 @@
+"""Context assembly: merging, near-duplicate dropping, token budget and tokenizer fallback."""
+import builtins
+
+import pytest
+
+pytest.importorskip("langchain_core")
+import context
+from langchain_core.documents import Document
+
+@pytest.fixture
+def no_tiktoken(monkeypatch):
+    real_import = builtins.__import__
+
+    def fake_import(name, *args, **kwargs):
+        if name == "tiktoken":
+            raise ImportError("No module named 'tiktoken'")
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", fake_import)
+    monkeypatch.setattr(context, "_encoding", None)
+
+def test_fallback_estimates_and_logs_once(no_tiktoken, monkeypatch):
+    events = []
+    monkeypatch.setattr(context, "log_event", lambda event, **fields: events.append((event, fields)))
+
+    assert context.count_tokens("abcdefgh") == 2
+    assert context.count_tokens("abcde") == 2
+    assert [event for event, _ in events] == ["tokenizer_fallback"]
+    assert events[0][1]["encoding"] == "cl100k_base"
+
+PAGE = "".join(f"word{i:04d} " for i in range(300))  # 2700 characters
+
+def chunk(start, length=800, source="handbook.pdf", page=1, **metadata):
+    return Document(page_content=PAGE[start:start + length],
+                    metadata={"source": source, "page": page, "start_index": start, **metadata})
+
+@pytest.fixture
+def estimated_tokens(monkeypatch):
+    monkeypatch.setattr(context, "_encoding", False)
+
+def test_overlapping_chunks_merge_in_rank_order():
+    merged = context.merge_overlapping([chunk(600, rank=1), chunk(0, rank=2), chunk(1800, rank=3)])
+    assert [doc.page_content for doc in merged] == [PAGE[0:1400], PAGE[1800:2600]]
+    assert merged[0].metadata["rank"] == 1
+    assert merged[0].metadata["start_index"] == 0
+
+def test_touching_chunks_merge():
+    merged = context.merge_overlapping([chunk(0), chunk(800)])
+    assert [doc.page_content for doc in merged] == [PAGE[0:1600]]
+
+def test_bridging_chunk_joins_two_passages():
+    merged = context.merge_overlapping([chunk(0, rank=1), chunk(1600, rank=2), chunk(800, rank=3)])
+    assert len(merged) == 1
+    assert merged[0].page_content == PAGE[0:2400]
+    assert merged[0].metadata["rank"] == 1
+
+def test_chunk_inside_a_passage_adds_nothing():
+    merged = context.merge_overlapping([chunk(0, length=1600), chunk(400)])
+    assert [doc.page_content for doc in merged] == [PAGE[0:1600]]
+
+def test_other_pages_and_chunks_without_offsets_pass_through():
+    loose = Document(page_content="no offsets", metadata={})
+    merged = context.merge_overlapping([chunk(0), chunk(400, page=2), loose, chunk(400)])
+    assert [doc.page_content for doc in merged] == [PAGE[0:1200], PAGE[400:1200], "no offsets"]
+
+def test_near_duplicates_are_dropped():
+    text = "Students must submit the thesis to the graduate office before the deadline."
+    kept = context.drop_near_duplicates([
+        Document(page_content=text),
+        Document(page_content=text + " Rarely extended."),
+        Document(page_content="Qualifying exams are held each spring semester."),
+    ], threshold=0.8)
+    assert [doc.page_content for doc in kept] == [text, "Qualifying exams are held each spring semester."]
+
+def test_assemble_context_packs_passages_within_budget(estimated_tokens):
+    docs = [Document(page_content=letter * length) for letter, length in (("a", 400), ("b", 800), ("c", 200))]
+    packed = context.assemble_context(docs, token_budget=200)
+    # 100 + 50 tokens fit; the 200-token passage is skipped
+    assert [doc.page_content[0] for doc in packed] == ["a", "c"]
+
+def test_assemble_context_truncates_an_oversized_best_passage(estimated_tokens):
+    packed = context.assemble_context([Document(page_content="a" * 1000)], token_budget=100)
+    assert len(packed) == 1
+    assert context.count_tokens(packed[0].page_content) <= 100
@@ -0,0 +1,77 @@
+"""Backend parity thresholds and the index embedding check, with stub encoders."""
+import numpy as np
+import pytest
+
+import embedding_backends
+from embedding_backends import (
+    EmbeddingMismatchError,
+    check_index_embeddings,
+    compare_backends,
+)
+
+DIM = 4
+TEXTS = [f"chunk {i}" for i in range(12)]
+
+def unit(*components):
+    vector = np.zeros(DIM)
+    vector[:len(components)] = components
+    return vector
+
+class StubEmbeddings:
+    """Embeds the query at cosine `query_cosine` to e0 and ranks chunk i i-th for it, after `swaps`."""
+
+    def __init__(self, query_cosine=1.0, swaps=()):
+        self.query = unit(query_cosine, np.sqrt(1 - query_cosine ** 2))
+        order = list(range(len(TEXTS)))
+        for a, b in swaps:
+            order[a], order[b] = order[b], order[a]
+        # Chunk ranked r sits further from e0 (towards e2) as r grows
+        self.vectors = {TEXTS[i]: unit(1.0, 0.0, 0.1 * rank) for rank, i in enumerate(order)}
+
+    def embed_query(self, text):
+        return list(self.query)
+
+    def embed_documents(self, texts):
+        return [list(self.vectors[text]) for text in texts]
+
+def compare(monkeypatch, candidate):
+    backends = {"torch": StubEmbeddings(), "onnx-int8": candidate}
+    monkeypatch.setattr(embedding_backends, "create_embeddings", lambda model, backend: backends[backend])
+    return compare_backends("stub-model", "onnx-int8", ["When is the thesis due?"], TEXTS, k=10)
+
+def test_identical_backend_passes(monkeypatch):
+    report = compare(monkeypatch, StubEmbeddings())
+    assert report["min_query_cosine"] == pytest.approx(1.0)
+    assert report["mean_top_k_overlap"] == 1.0
+    assert report["passed"]
+
+@pytest.mark.parametrize("cosine, passed", [(0.985, True), (0.975, False)])
+def test_query_cosine_threshold(monkeypatch, cosine, passed):
+    report = compare(monkeypatch, StubEmbeddings(query_cosine=cosine))
+    assert report["min_query_cosine"] == pytest.approx(cosine, abs=1e-6)
+    assert report["mean_top_k_overlap"] == 1.0
+    assert report["passed"] is passed
+
+@pytest.mark.parametrize("swaps, overlap, passed", [
+    ([(9, 10)], 0.9, True),
+    ([(8, 10), (9, 11)], 0.8, False),
+])
+def test_top_k_overlap_threshold(monkeypatch, swaps, overlap, passed):
+    report = compare(monkeypatch, StubEmbeddings(swaps=swaps))
+    assert report["mean_top_k_overlap"] == pytest.approx(overlap)
+    assert report["passed"] is passed
+
+def test_check_index_embeddings_accepts_matching_index():
+    check_index_embeddings({"embedding_model": "m", "embedding_backend": "onnx"}, "m", backend="onnx")
+    # Indexes from before backends existed were embedded with torch
+    check_index_embeddings({"embedding_model": "m"}, "m", backend="torch")
+
+@pytest.mark.parametrize("settings, match", [
+    ({"embedding_model": "other"}, "built with 'other'"),
+    ({"embedding_model": "m", "embedding_backend": "onnx-int8"}, "'onnx-int8' backend"),
+    ({}, "does not record"),
+    (None, "does not record"),
+])
+def test_check_index_embeddings_rejects_mismatch(settings, match):
+    with pytest.raises(EmbeddingMismatchError, match=match):
+        check_index_embeddings(settings, "m", backend="torch")
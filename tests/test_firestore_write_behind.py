@@ -0,0 +1,208 @@
+"""Write-behind chat queue against an in-memory stand-in for the Firestore client."""
+import json
+import threading
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("google.cloud.firestore")
+from google.api_core import exceptions as google_exceptions
+from google.cloud import firestore
+
+from firestore_chat import ChatWriteBehindQueue, FirestoreChatManager
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self.db, f"{self.path}/{name}")
+
+class FakeCollection:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+
+    def document(self, document_id):
+        return FakeDocument(self.db, f"{self.path}/{document_id}")
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, ref, data):
+        self.writes.append(("set", ref.path, data))
+
+    def update(self, ref, data):
+        self.writes.append(("update", ref.path, data))
+
+    def commit(self):
+        with self.db.lock:
+            self.db.commits += 1
+            error = self.db.fail_next.pop(self.writes[0][1], None)
+            if error is not None:
+                raise error
+            # Batches are atomic: check every write before applying any
+            for op, path, _ in self.writes:
+                if op == "update" and path not in self.db.documents:
+                    raise google_exceptions.NotFound(f"No document to update: {path}")
+            for op, path, data in self.writes:
+                if op == "set":
+                    self.db.documents[path] = dict(data)
+                    continue
+                document = self.db.documents[path]
+                for key, value in data.items():
+                    if isinstance(value, firestore.Increment):
+                        document[key] = document.get(key, 0) + value.value
+                    else:
+                        document[key] = value
+
+class FakeFirestore:
+    def __init__(self):
+        self.documents = {}
+        self.fail_next = {}  # document path -> error raised by the next batch starting with it
+        self.commits = 0
+        self.lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def add_session(self, session_id):
+        self.documents[f"chat_sessions/{session_id}"] = {"message_count": 0}
+
+    def messages(self, session_id):
+        prefix = f"chat_sessions/{session_id}/messages/"
+        return [data for path, data in self.documents.items() if path.startswith(prefix)]
+
+def message(content):
+    return {"role": "user", "content": content, "timestamp": datetime(2026, 1, 1), "sources": []}
+
+@pytest.fixture
+def paths(tmp_path):
+    return {"spool_path": str(tmp_path / "spool.jsonl"), "dead_letter_path": str(tmp_path / "spool.jsonl.dead")}
+
+def make_queue(db, paths):
+    return ChatWriteBehindQueue(db, "chat_sessions", flush_interval=0.01, **paths)
+
+def read_lines(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def test_deleted_session_is_dead_lettered_without_blocking_others(paths):
+    db = FakeFirestore()
+    db.add_session("live")
+    queue = make_queue(db, paths)
+    for i in range(3):
+        queue.add("live", f"live-{i}", message(f"live {i}"))
+        queue.add("deleted", f"deleted-{i}", message(f"deleted {i}"))
+
+    assert queue.flush(timeout=5)
+    queue.close()
+
+    assert len(db.messages("live")) == 3
+    assert db.documents["chat_sessions/live"]["message_count"] == 3
+    assert db.messages("deleted") == []
+    dead = read_lines(paths["dead_letter_path"])
+    assert [record["message_id"] for record in dead] == ["deleted-0", "deleted-1", "deleted-2"]
+    assert "No document to update" in dead[0]["error"]
+    assert read_lines(paths["spool_path"]) == []
+
+def test_transient_failure_retries_only_that_session(paths):
+    db = FakeFirestore()
+    db.add_session("a")
+    db.add_session("b")
+    db.fail_next["chat_sessions/b"] = google_exceptions.ServiceUnavailable("try again")
+    queue = make_queue(db, paths)
+    queue.add("a", "a-0", message("a"))
+    queue.add("b", "b-0", message("b"))
+
+    assert queue.flush(timeout=5)
+    queue.close()
+
+    assert db.documents["chat_sessions/a"]["message_count"] == 1
+    assert db.documents["chat_sessions/b"]["message_count"] == 1
+    assert read_lines(paths["dead_letter_path"]) == []
+
+def test_large_session_is_split_into_batches(paths):
+    db = FakeFirestore()
+    db.add_session("big")
+    queue = make_queue(db, paths)
+    failed = queue._commit([
+        {"session_id": "big", "message_id": f"m{i}", "data": message(str(i))} for i in range(1200)
+    ])
+    queue.close()
+
+    assert failed == []
+    assert db.commits == 3
+    assert len(db.messages("big")) == 1200
+    assert db.documents["chat_sessions/big"]["message_count"] == 1200
+
+def test_spooled_messages_are_replayed_on_start(paths):
+    db = FakeFirestore()
+    db.add_session("s")
+    with open(paths["spool_path"], "w", encoding="utf-8") as f:
+        f.write(json.dumps({"session_id": "s", "message_id": "m0",
+                            "data": dict(message("spooled"), timestamp="2026-01-01T00:00:00")}) + "\n")
+        f.write('{"session_id": "s", "mess')  # torn final line
+
+    queue = make_queue(db, paths)
+    assert queue.flush(timeout=5)
+    queue.close()
+
+    assert [data["content"] for data in db.messages("s")] == ["spooled"]
+    assert read_lines(paths["spool_path"]) == []
+
+def test_manager_writes_synchronously_without_write_behind():
+    db = FakeFirestore()
+    db.add_session("s")
+    manager = FirestoreChatManager(client=db, write_behind=False)
+    manager.add_message("s", "assistant", "hello")
+
+    assert [data["content"] for data in db.messages("s")] == ["hello"]
+    assert db.documents["chat_sessions/s"]["message_count"] == 1
+
+def test_processes_claim_separate_spools_and_free_ones_are_replayed(paths):
+    db = FakeFirestore()
+    db.add_session("s")
+    first = make_queue(db, paths)
+    second = make_queue(db, paths)
+    assert first.spool_path == paths["spool_path"]
+    assert second.spool_path != first.spool_path
+
+    # The first process dies (releasing its lock) with a message still spooled
+    first.close()
+    with open(first.spool_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"session_id": "s", "message_id": "m0",
+                            "data": dict(message("left behind"), timestamp="2026-01-01T00:00:00")}) + "\n")
+
+    third = make_queue(db, paths)
+    assert third.spool_path == paths["spool_path"]
+    assert third.flush(timeout=5)
+    for queue in (second, third):
+        queue.close()
+    assert [data["content"] for data in db.messages("s")] == ["left behind"]
+
+def test_sigterm_flushes_queues_before_the_previous_handler(paths, monkeypatch):
+    import firestore_chat
+
+    db = FakeFirestore()
+    db.add_session("s")
+    queue = make_queue(db, paths)
+    queue.add("s", "m0", message("before shutdown"))
+    calls = []
+    monkeypatch.setattr(firestore_chat, "_previous_sigterm_handler",
+                        lambda signum, frame: calls.append(len(db.messages("s"))))
+
+    firestore_chat._flush_on_sigterm(15, None)
+
+    assert calls == [1]
+    assert queue not in firestore_chat._open_queues
@@ -0,0 +1,46 @@
+"""Swapping index artifact directories."""
+import json
+import os
+
+import pytest
+
+pytest.importorskip("langchain_core")
+from index_artifact import (
+    load_artifact_manifest,
+    previous_artifact_dir,
+    replace_artifact_dir,
+    resolve_artifact_dir,
+)
+
+def make_artifact(path, version):
+    os.makedirs(path)
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": version}, f)
+    return str(path)
+
+def test_replace_swaps_in_new_artifact_and_removes_old(tmp_path):
+    target = make_artifact(tmp_path / "index_artifact", "v1")
+    replace_artifact_dir(make_artifact(tmp_path / "index_artifact.tmp", "v2"), target)
+
+    assert load_artifact_manifest(target)["version"] == "v2"
+    assert not os.path.exists(previous_artifact_dir(target))
+    assert not os.path.exists(tmp_path / "index_artifact.tmp")
+
+def test_first_artifact(tmp_path):
+    target = str(tmp_path / "index_artifact")
+    assert load_artifact_manifest(target) is None
+    replace_artifact_dir(make_artifact(tmp_path / "new", "v1"), target)
+    assert load_artifact_manifest(target)["version"] == "v1"
+
+def test_interrupted_swap_keeps_previous_artifact_readable(tmp_path):
+    target = str(tmp_path / "index_artifact")
+    # The process died after setting the old artifact aside
+    make_artifact(previous_artifact_dir(target), "v1")
+
+    assert resolve_artifact_dir(target) == previous_artifact_dir(target)
+    assert load_artifact_manifest(target)["version"] == "v1"
+
+    replace_artifact_dir(make_artifact(tmp_path / "new", "v2"), target)
+    assert resolve_artifact_dir(target) == target
+    assert load_artifact_manifest(target)["version"] == "v2"
+    assert not os.path.exists(previous_artifact_dir(target))
@@ -0,0 +1,95 @@
+"""ResilientChatClient against the local stub server with injected failures."""
+import time
+
+import httpx
+import pytest
+
+import llm_client
+from llm_client import LLMError, ResilientChatClient
+from stub_llm_server import STUB_ANSWER, start_stub_server
+
+MESSAGES = [{"role": "user", "content": "When is the thesis due?"}]
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_BACKOFF_BASE", 0.01)
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**options):
+        options.setdefault("first_token_delay", 0.0)
+        server = start_stub_server(host="127.0.0.1", port=0, **options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+def make_client(server, models=("primary",), **options):
+    host, port = server.server_address
+    options.setdefault("deadline", 10)
+    return ResilientChatClient(f"http://{host}:{port}/v1", "test-key", models, **options)
+
+def test_retries_transient_failures(stub):
+    server = stub(script=["fail", "fail"])
+    assert make_client(server, max_retries=2).complete(MESSAGES) == STUB_ANSWER
+    assert server.requests == 3
+
+def test_honours_retry_after(stub):
+    server = stub(script=["fail"], failure_status=429, retry_after=1)
+    started = time.monotonic()
+    assert make_client(server).complete(MESSAGES) == STUB_ANSWER
+    assert time.monotonic() - started >= 1
+
+def test_malformed_response_is_retried(stub):
+    server = stub(script=["malformed"])
+    assert make_client(server).complete(MESSAGES) == STUB_ANSWER
+    assert server.requests == 2
+
+def test_malformed_responses_raise_llm_error(stub):
+    server = stub(script=["malformed"] * 3)
+    with pytest.raises(LLMError, match="not JSON"):
+        make_client(server, max_retries=2).complete(MESSAGES)
+
+def test_falls_back_to_next_model(stub):
+    server = stub(failing_models=["primary"])
+    client = make_client(server, models=("primary", "fallback"), max_retries=1)
+    assert client.complete(MESSAGES) == STUB_ANSWER
+    assert server.requests == 3
+
+def test_fatal_status_does_not_fall_back(stub):
+    server = stub(failing_models=["primary"], failure_status=401)
+    client = make_client(server, models=("primary", "fallback"))
+    with pytest.raises(LLMError) as error:
+        client.complete(MESSAGES)
+    assert error.value.status == 401
+    assert server.requests == 1
+
+def test_hedged_request_wins_over_slow_primary(stub):
+    server = stub(script=["slow"], slow_delay=3)
+    client = make_client(server, hedge_after=0.1)
+    started = time.monotonic()
+    assert client.complete(MESSAGES) == STUB_ANSWER
+    assert time.monotonic() - started < 2
+    assert server.requests == 2
+
+def test_async_hedged_request_wins_over_slow_primary(stub):
+    import asyncio
+
+    server = stub(script=["slow"], slow_delay=3)
+    client = make_client(server, hedge_after=0.1)
+    started = time.monotonic()
+    assert asyncio.run(client.acomplete(MESSAGES)) == STUB_ANSWER
+    assert time.monotonic() - started < 2
+
+def test_hedge_pool_is_sized_by_connection_limit(stub):
+    server = stub()
+    client = make_client(server, hedge_after=0.5, limits=httpx.Limits(max_connections=4))
+    assert client._hedge_pool._max_workers == 4
+
+def test_stream_retries_before_first_token(stub):
+    server = stub(script=["fail"], token_delay=0.0)
+    assert "".join(make_client(server).stream(MESSAGES)) == STUB_ANSWER
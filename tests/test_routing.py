@@ -0,0 +1,60 @@
+"""Collection name checks, row partitions and centroid routing."""
+import pytest
+
+from routing import (
+    CollectionRouter,
+    check_collection_names,
+    collection_ranges,
+    is_valid_collection_name,
+    partition_rows,
+)
+
+@pytest.mark.parametrize("name", ["langchain", "aero", "graduate_school", "mane-2024.v2", "abc"])
+def test_valid_collection_names(name):
+    assert is_valid_collection_name(name)
+
+@pytest.mark.parametrize("name", [
+    "ab",                      # too short
+    "a" * 64,                  # too long
+    "_drafts",                 # must start with a letter or digit
+    "policies-",               # must end with a letter or digit
+    "grad school",             # no spaces
+    "thèses",                  # ASCII only
+    "a..b",
+    "192.168.0.1",
+])
+def test_invalid_collection_names(name):
+    assert not is_valid_collection_name(name)
+
+def test_check_collection_names_reports_offending_paths():
+    with pytest.raises(ValueError) as error:
+        check_collection_names({
+            "data/aero/handbook.pdf": "aero",
+            "data/grad school/policies.pdf": "grad school",
+            "data/ab/notes.pdf": "ab",
+        })
+    message = str(error.value)
+    assert "'data/grad school/policies.pdf' -> 'grad school'" in message
+    assert "'data/ab/notes.pdf' -> 'ab'" in message
+    assert "aero/handbook" not in message
+
+def test_partition_rows():
+    metadatas = [{"collection": "a"}, {"collection": "a"}, {}, {"collection": "b"}]
+    partitions = partition_rows(metadatas)
+    assert partitions == {"a": (0, 2), "langchain": (2, 3), "b": (3, 4)}
+    assert collection_ranges(partitions, ["b", "a"], 4) == [(3, 4), (0, 2)]
+    assert collection_ranges(partitions, None, 4) == [(0, 4)]
+    # Interleaved rows can't be searched by range
+    assert partition_rows([{"collection": "a"}, {"collection": "b"}, {"collection": "a"}]) is None
+
+def test_router_picks_closest_collections():
+    router = CollectionRouter({
+        "aero": {"centroid": [1.0, 0.0, 0.0]},
+        "mane": {"centroid": [0.0, 1.0, 0.0]},
+        "policies": {"centroid": [0.0, 0.0, 1.0]},
+    }, max_collections=2, margin=0.05)
+    assert router.route([0.9, 0.1, 0.0]) == ["aero"]
+    assert sorted(router.route([1.0, 1.0, 0.0])) == ["aero", "mane"]
+    assert router.route([0.0, 0.0, 1.0], requested=["mane"]) == ["mane"]
+    with pytest.raises(ValueError, match="Unknown collection"):
+        router.route([1.0, 0.0, 0.0], requested=["missing"])